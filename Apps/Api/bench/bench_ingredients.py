@@ -0,0 +1,151 @@
+from __future__ import annotations
+import argparse
+import re
+import time
+from typing import Callable, List, Optional
+
+from Apps.Api.schemas.models import Ingredient
+from Apps.Api.services.ingredient_utils import (
+    FRACTION_CHAR_MAP, LINE_RE, PARSE_CACHE, load_notes_rules, load_unit_aliases,
+    parse_ingredient_line, parse_ingredient_lines,
+)
+
+LINES = {
+    "sv": [
+        "2 dl vispgrädde", "1 ½ msk kakao", "salt och peppar", "100 g smör (rumsvarmt)",
+        "3 st ägg", "1 burk krossade tomater à 400 g", "2 klyftor vitlök, finhackad",
+        "gärna färsk koriander till servering", "1-2 tsk sambal oelek", "ev. 1 krm cayennepeppar",
+        "500 g kycklingfilé", "1 gul lök", "¾ dl olivolja", "4 skivor bacon", "riven ost som topping",
+    ],
+    "en": [
+        "2 cups all-purpose flour", "1 tbsp sugar", "salt to taste", "3 large eggs",
+        "1/2 cup milk (warm)", "optional 1 tsp vanilla extract", "2-3 cloves garlic",
+        "1 lb ground beef", "fresh parsley for serving", "¼ cup butter, melted",
+    ],
+}
+
+def _legacy_fraction_to_float(s: str) -> Optional[float]:
+    s = s.strip()
+    m = re.match(r"^\s*(\d+)?(?:\s+)?(\d+/\d+)\s*$", s)
+    if m:
+        whole, frac = m.groups()
+        num, den = frac.split("/")
+        return (int(whole) if whole else 0) + (int(num) / int(den))
+    try:
+        return float(s.replace(",", "."))
+    except ValueError:
+        return None
+
+def _legacy_parse_quantity(qty_raw: Optional[str]) -> Optional[str]:
+    if not qty_raw:
+        return None
+    s = qty_raw
+    for ch, rep in FRACTION_CHAR_MAP.items():
+        s = s.replace(ch, rep)
+    vals = []
+    for p in [p.strip() for p in re.split(r"[-–]", s) if p.strip()]:
+        v = _legacy_fraction_to_float(p)
+        if v is None:
+            return qty_raw.strip()
+        vals.append(v)
+    if not vals:
+        return None
+    if len(vals) == 1:
+        return f"{vals[0]:g}"
+    return f"{min(vals):g}-{max(vals):g}"
+
+def legacy_parse_ingredient_line(line: str, lang: str = "sv") -> Ingredient:
+    # Radvis pipeline som den såg ut före parse_ingredient_lines, för jämförelse
+    for ch, rep in FRACTION_CHAR_MAP.items():
+        line = line.replace(ch, rep)
+    raw = line.strip()
+    m = LINE_RE.match(raw)
+    if not m:
+        return Ingredient(name=raw)
+    qty_s, unit_s, notes_s = m.group("qty"), m.group("unit"), m.group("notes")
+    name_s = (m.group("name") or "").strip()
+    qty = _legacy_parse_quantity(qty_s)
+    aliases = load_unit_aliases(lang)
+    unit = aliases.get(unit_s.strip().lower().rstrip("."), unit_s.strip().lower().rstrip(".")) if unit_s else None
+    if unit_s and unit_s.strip().lower().rstrip(".") not in load_unit_aliases(lang):
+        name_s = f"{unit_s} {name_s}".strip()
+        unit = None
+    if qty is None and unit_s:
+        name_s = f"{unit_s} {name_s}".strip()
+        unit = None
+    rules = load_notes_rules(lang)
+    a_note = None
+    if rules["cleanup"].get("normalize_a_pack", False):
+        am = re.search(r"\bà\b\s*([0-9]+)\s*([a-zA-Z]+)", name_s, flags=re.IGNORECASE)
+        if am:
+            a_note = f"à {am.group(1)} {am.group(2)}"
+            name_s = (name_s[:am.start()] + name_s[am.end():]).strip().rstrip(",;.")
+    parent_notes: List[str] = []
+    def repl(pm: re.Match):
+        if pm.group(1).strip():
+            parent_notes.append(pm.group(1).strip())
+        return ""
+    name_s = re.sub(r"\(([^)]+)\)", repl, name_s).strip()
+    lead_notes: List[str] = []
+    for rx in rules["leading_adverbs"]:
+        lm = rx.search(name_s)
+        if lm:
+            lead_notes.append(lm.group(0).strip())
+            name_s = name_s[lm.end():].lstrip(",; .").strip()
+    trail_notes: List[str] = []
+    for rx in rules["trailing_phrases"]:
+        tm = rx.search(name_s)
+        if tm:
+            trail_notes.append(tm.group(0).strip())
+            name_s = name_s[:tm.start()].rstrip(",; .").strip()
+    notes = " ".join(n for n in [notes_s, a_note, *parent_notes, *lead_notes, *trail_notes] if n).strip() or None
+    if not name_s:
+        return Ingredient(name=raw)
+    return Ingredient(name=name_s, quantity=qty, unit=unit, notes=notes)
+
+def _time(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run(recipes: int = 2000, repeat: int = 5) -> dict:
+    out = {}
+    for lang, lines in LINES.items():
+        batch = lines * (recipes // len(lines) + 1)
+        batch = batch[:recipes]
+        n = len(batch)
+        legacy = _time(lambda: [legacy_parse_ingredient_line(l, lang) for l in batch], repeat)
+        # Kall cache: varje körning börjar tom, så bara dubbletter inom batchen träffar
+        per_line = _time(lambda: (PARSE_CACHE.clear(), [parse_ingredient_line(l, lang) for l in batch]), repeat)
+        batched = _time(lambda: (PARSE_CACHE.clear(), parse_ingredient_lines(batch, lang)), repeat)
+        # Varm cache: raderna är redan parsade, som vid återkommande receptsajter
+        parse_ingredient_lines(batch, lang)
+        warm = _time(lambda: parse_ingredient_lines(batch, lang), repeat)
+        out[lang] = {
+            "lines": n,
+            "legacy_lines_per_s": n / legacy,
+            "per_line_lines_per_s": n / per_line,
+            "batch_lines_per_s": n / batched,
+            "warm_lines_per_s": n / warm,
+            "speedup_vs_legacy": legacy / batched,
+            "cache": PARSE_CACHE.stats(),
+        }
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Micro-benchmark for ingredient line parsing")
+    ap.add_argument("--lines", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    for lang, r in run(args.lines, args.repeat).items():
+        print(
+            f"{lang}: legacy {r['legacy_lines_per_s']:,.0f}/s  per-line {r['per_line_lines_per_s']:,.0f}/s  "
+            f"batch {r['batch_lines_per_s']:,.0f}/s  ({r['speedup_vs_legacy']:.2f}x)  "
+            f"warm cache {r['warm_lines_per_s']:,.0f}/s  (hit rate {r['cache']['hit_rate']:.0%})"
+        )
+
+if __name__ == "__main__":
+    main()
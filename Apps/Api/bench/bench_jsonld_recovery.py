@@ -0,0 +1,96 @@
+from __future__ import annotations
+import argparse
+import json
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from Apps.Api.services.parsers_jsonld import recover_json_values
+
+RECIPE = {
+    "@context": "https://schema.org",
+    "@type": "Recipe",
+    "name": "Pasta med tomatsås",
+    "recipeIngredient": ["400 g pasta", "1 burk krossade tomater", "1 gul lök", "salt"],
+    "recipeInstructions": [{"@type": "HowToStep", "text": "Koka pastan."}, {"@type": "HowToStep", "text": "Blanda."}],
+}
+
+# Trasiga block som faktiskt förekommer; varje fall måste ge tillbaka receptet
+CASES: Dict[str, str] = {
+    "trailing_commas": json.dumps(RECIPE).replace("]", ",]").replace("}", ",}"),
+    "html_entities": json.dumps(RECIPE, ensure_ascii=False).replace('"', "&quot;"),
+    "control_chars": json.dumps(RECIPE, ensure_ascii=False).replace("Koka", "Ko\x02ka\x0b"),
+    "concatenated": json.dumps({"@type": "WebSite"}) + json.dumps(RECIPE),
+    "comment_wrapped": "<!--\n" + json.dumps(RECIPE) + "\n-->",
+    "truncated_graph": '{"@graph": [' + json.dumps(RECIPE) + ', {"@type": "BreadcrumbList", "itemListElement": [',
+}
+
+def _legacy_candidates(text: str) -> List[Any]:
+    # Den girighetsbaserade reservvägen som den såg ut tidigare, för jämförelse
+    candidates: List[Any] = []
+    for m in re.finditer(r"(\{.*\}|\[.*\])", text, flags=re.DOTALL):
+        try:
+            candidates.append(json.loads(m.group(1)))
+        except Exception:
+            pass
+    return candidates
+
+def adversarial(size: int) -> Dict[str, str]:
+    blob = json.dumps(RECIPE)
+    return {
+        "open_braces": "{" * size,
+        "open_brackets_with_strings": '["x", ' * (size // 6),
+        "many_small_objects": ('{"a": 1}' * (size // 8)),
+        "large_with_trailing_commas": "[" + ",".join([blob.replace("}", ",}")] * (size // len(blob))) + "]",
+        "large_truncated": "[" + ",".join([blob] * (size // len(blob))),
+    }
+
+def _time(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def check() -> Dict[str, bool]:
+    out = {}
+    for name, text in CASES.items():
+        found = recover_json_values(text)
+        out[name] = any(isinstance(v, dict) and v.get("@type") == "Recipe" for v in found)
+    return out
+
+def run(sizes: List[int], repeat: int = 3, legacy_max: int = 64 * 1024) -> dict:
+    out: Dict[str, Dict[str, Any]] = {}
+    for size in sizes:
+        for name, text in adversarial(size).items():
+            row = out.setdefault(name, {})
+            row[size] = {
+                "recover_ms": _time(lambda: recover_json_values(text), repeat) * 1000,
+                "values": len(recover_json_values(text)),
+            }
+            # Den gamla vägen är kvadratisk på öppna klamrar; kör den bara på små fall
+            if size <= legacy_max:
+                row[size]["legacy_ms"] = _time(lambda: _legacy_candidates(text), 1) * 1000
+                row[size]["legacy_values"] = len(_legacy_candidates(text))
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark JSON-LD recovery on malformed and adversarial blocks")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[16 * 1024, 64 * 1024, 1024 * 1024])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    failed = [name for name, ok in check().items() if not ok]
+    for name, ok in check().items():
+        print(f"{name:<28} {'ok' if ok else 'FAILED'}")
+    print()
+    for name, by_size in run(args.sizes, args.repeat).items():
+        for size, r in by_size.items():
+            legacy = f"legacy {r['legacy_ms']:9.1f} ms ({r['legacy_values']} values)" if "legacy_ms" in r else "legacy skipped"
+            print(f"{name:<28} {size // 1024:>6} KiB  recover {r['recover_ms']:8.2f} ms ({r['values']} values)  {legacy}")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
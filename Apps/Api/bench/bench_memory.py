@@ -0,0 +1,103 @@
+from __future__ import annotations
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from Apps.Api.bench.bench_ingredients import LINES
+from Apps.Api.core.compact import CompactRecipe
+from Apps.Api.core.storage import InMemoryStorage
+from Apps.Api.schemas.models import Cookbook, InstructionStep, Recipe
+from Apps.Api.services.ingredient_utils import parse_ingredient_lines
+
+STEPS = {
+    "sv": ["Sätt ugnen på 200 grader.", "Hacka löken fint.", "Fräs i smör tills den mjuknat.", "Rör ner resten och låt sjuda i 20 minuter.", "Smaka av med salt och peppar."],
+    "en": ["Preheat the oven to 400F.", "Chop the onion.", "Fry in butter until soft.", "Stir in the rest and simmer for 20 minutes.", "Season to taste."],
+}
+
+def make_recipes(n: int, cookbooks: int = 20, seed: int = 1) -> List[Recipe]:
+    rnd = random.Random(seed)
+    parsed = {lang: parse_ingredient_lines(lines, lang) for lang, lines in LINES.items()}
+    out = []
+    for i in range(n):
+        lang = "sv" if i % 3 else "en"
+        ings = rnd.sample(parsed[lang], rnd.randint(5, min(12, len(parsed[lang]))))
+        steps = rnd.sample(STEPS[lang], rnd.randint(3, len(STEPS[lang])))
+        out.append(Recipe(
+            cookbook_id=f"cookbook-{i % cookbooks}",
+            title=f"Recipe {i}",
+            description="En enkel vardagsrätt." if i % 2 else None,
+            ingredients=[ing.model_copy() for ing in ings],
+            steps=[InstructionStep(order=k + 1, text=t) for k, t in enumerate(steps)],
+            servings="4 portioner" if lang == "sv" else "4 servings",
+            total_time="30 min",
+            source_url=f"https://example.com/recept/{i}",
+            images=[f"https://example.com/img/{i}.jpg"],
+            language=lang,
+        ))
+    return out
+
+def _retained(build: Callable[[], object]) -> int:
+    # Bytes som fortfarande är allokerade när build() returnerat, dvs. det som hålls kvar
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def run(n: int = 20000) -> Dict[str, float]:
+    recipes = make_recipes(n)
+    payload = [r.model_dump() for r in recipes]
+    del recipes
+
+    models = _retained(lambda: {d["id"]: Recipe.model_validate(d) for d in payload})
+    compact = _retained(lambda: {d["id"]: CompactRecipe.from_model(Recipe.model_validate(d)) for d in payload})
+
+    def storage() -> InMemoryStorage:
+        s = InMemoryStorage()
+        for k in range(20):
+            s.put_cookbook(Cookbook(id=f"cookbook-{k}", name=f"Kokbok {k}"))
+        for d in payload:
+            s.put_recipes([Recipe.model_validate(d)])
+        return s
+    store = _retained(storage)
+
+    items = [CompactRecipe.from_model(Recipe.model_validate(d)) for d in payload]
+    t0 = time.perf_counter()
+    for c in items:
+        c.to_model()
+    to_model = time.perf_counter() - t0
+    mismatched = sum(c.to_model().model_dump() != d for c, d in zip(items, payload))
+
+    return {
+        "recipes": n,
+        "model_bytes_per_recipe": models / n,
+        "compact_bytes_per_recipe": compact / n,
+        "reduction": 1 - compact / models,
+        "storage_bytes_per_recipe": store / n,
+        "to_model_us": to_model / n * 1e6,
+        "roundtrip_mismatches": mismatched,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Memory per stored recipe: Pydantic models vs compact records")
+    ap.add_argument("--recipes", type=int, default=20000)
+    args = ap.parse_args()
+    r = run(args.recipes)
+    print(f"recipes                 {r['recipes']:>10,}")
+    print(f"pydantic Recipe         {r['model_bytes_per_recipe']:>10,.0f} B/recipe")
+    print(f"CompactRecipe           {r['compact_bytes_per_recipe']:>10,.0f} B/recipe  ({r['reduction']:.0%} smaller)")
+    print(f"InMemoryStorage total   {r['storage_bytes_per_recipe']:>10,.0f} B/recipe  (incl. search indexes)")
+    print(f"to_model                {r['to_model_us']:>10.1f} us/recipe")
+    if r["roundtrip_mismatches"]:
+        print(f"roundtrip mismatches    {r['roundtrip_mismatches']:>10,}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
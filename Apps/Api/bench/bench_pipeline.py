@@ -0,0 +1,173 @@
+from __future__ import annotations
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from Apps.Api.bench.server import load_corpus, serve
+from Apps.Api.core.store import Store
+from Apps.Api.schemas.models import CookbookCreate, RecipeBase
+from Apps.Api.services.parsers import extract_recipe_from_html, extract_recipe_from_scan
+from Apps.Api.services.jsonld_stream import fetch_page_streaming
+from Apps.Api.services.parsers_jsonld import (
+    detect_lang, extract_ingredients, extract_servings, extract_steps, extract_title,
+    extract_total_time, fetch_html, find_first_recipe, find_jsonld_blocks, parse_html,
+    try_load_json_candidates,
+)
+
+STAGES = ("fetch", "html_parse", "jsonld_decode", "ingredients", "model", "store")
+
+def _percentile(xs: List[float], q: float) -> float:
+    s = sorted(xs)
+    k = max(0, min(len(s) - 1, int(round(q * (len(s) - 1)))))
+    return s[k]
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "ops_per_s": len(samples) / total if total else 0.0,
+    }
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def run_page(url: str, store: Store, cookbook_id: str, timings: Dict[str, List[float]]) -> None:
+    def timed(stage: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        out = fn()
+        timings[stage].append(time.perf_counter() - t0)
+        return out
+
+    html = timed("fetch", lambda: fetch_html(url))
+    soup = timed("html_parse", lambda: parse_html(html))
+
+    def decode():
+        lang = detect_lang(html, url, soup=soup)
+        candidates: List[Any] = []
+        for block in find_jsonld_blocks(html, soup=soup):
+            candidates.extend(try_load_json_candidates(block))
+        return lang, find_first_recipe(candidates)
+
+    lang, recipe = timed("jsonld_decode", decode)
+    if not recipe:
+        return
+    ingredients = timed("ingredients", lambda: extract_ingredients(recipe, lang=lang))
+    rb = timed("model", lambda: RecipeBase(
+        title=extract_title(recipe),
+        ingredients=ingredients,
+        steps=extract_steps(recipe),
+        servings=extract_servings(recipe),
+        total_time=extract_total_time(recipe),
+        source_url=url,
+        language=lang,
+    ))
+    timed("store", lambda: store.add_recipe(cookbook_id, rb))
+
+IMPORT_MODES: Dict[str, Callable[[str], RecipeBase]] = {
+    "tree": lambda url: extract_recipe_from_html(fetch_html(url), url),
+    "stream": lambda url: extract_recipe_from_scan(fetch_page_streaming(url).scan, url),
+}
+
+def run_import_modes(urls: List[str], iterations: int) -> Dict[str, Any]:
+    # Hel import per läge: väggtid, CPU-tid och högsta Python-allokering (tracemalloc)
+    out: Dict[str, Any] = {}
+    for mode, fn in IMPORT_MODES.items():
+        wall: List[float] = []
+        cpu: List[float] = []
+        for url in urls:
+            fn(url)
+        for _ in range(iterations):
+            for url in urls:
+                w0, c0 = time.perf_counter(), time.process_time()
+                fn(url)
+                wall.append(time.perf_counter() - w0)
+                cpu.append(time.process_time() - c0)
+        peaks: List[int] = []
+        for url in urls:
+            tracemalloc.start()
+            fn(url)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        out[mode] = {
+            **_summary(wall),
+            "cpu_mean_ms": statistics.fmean(cpu) * 1000,
+            "peak_kb_max": max(peaks) / 1024,
+        }
+    return out
+
+def run(iterations: int = 50, pad_kb: int = 512) -> Dict[str, Any]:
+    pages = load_corpus(pad_kb)
+    srv, base = serve(pages)
+    try:
+        store = Store()
+        cb = store.create_cookbook(CookbookCreate(name="bench"))
+        results: Dict[str, Any] = {}
+        groups = {"small": [p for p in pages if not p.startswith("/large/")],
+                  "large": [p for p in pages if p.startswith("/large/")]}
+        for group, paths in groups.items():
+            if not paths:
+                continue
+            timings: Dict[str, List[float]] = {s: [] for s in STAGES}
+            for path in paths:
+                run_page(base + path, store, cb.id, timings)  # uppvärmning
+            for s in STAGES:
+                timings[s].clear()
+            for _ in range(iterations):
+                for path in paths:
+                    run_page(base + path, store, cb.id, timings)
+            results[group] = {s: _summary(v) for s, v in timings.items() if v}
+            results[group]["import"] = run_import_modes([base + p for p in paths], iterations)
+        return {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "iterations": iterations,
+            "pad_kb": pad_kb,
+            "pages": sorted(pages),
+            "stages": results,
+        }
+    finally:
+        srv.shutdown()
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Per-stage benchmark of the URL import pipeline")
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--pad-kb", type=int, default=512, help="ad filler added to the /large/ page variants")
+    ap.add_argument("--out", type=Path, help="write results as JSON to this file")
+    args = ap.parse_args()
+
+    res = run(args.iterations, args.pad_kb)
+    for group, stages in res["stages"].items():
+        print(f"[{group}]")
+        for stage, r in stages.items():
+            if stage == "import":
+                continue
+            print(f"  {stage:<14} p50 {r['p50_ms']:8.3f} ms  p99 {r['p99_ms']:8.3f} ms  {r['ops_per_s']:10,.0f} ops/s")
+        for mode, r in stages["import"].items():
+            print(
+                f"  import/{mode:<7} p50 {r['p50_ms']:8.3f} ms  p99 {r['p99_ms']:8.3f} ms  "
+                f"cpu {r['cpu_mean_ms']:8.3f} ms  peak {r['peak_kb_max']:9,.0f} KiB"
+            )
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(res, indent=2), encoding="utf-8")
+        print(f"wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+MODES = {
+    "lazy": {"RECIPEER_PRELOAD_PARSERS": "0"},
+    "preload": {"RECIPEER_PRELOAD_PARSERS": "1"},
+}
+
+def child() -> None:
+    # Körs i en ny process per mätning: allt ska vara kallt
+    t0 = time.perf_counter()
+    from Apps.Api import main
+    imported = time.perf_counter() - t0
+    loaded = sorted(m for m in ("requests", "bs4", "lxml") if m in sys.modules)
+
+    from fastapi.testclient import TestClient
+    from Apps.Api.bench.server import load_corpus, serve
+    from Apps.Api.core.instrumentation import FIRST_REQUEST_SECONDS
+    from Apps.Api.services import warmup
+
+    srv, base = serve(load_corpus())
+    with TestClient(main.app) as c:
+        ready = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        cb = c.post("/cookbooks", json={"name": "Bench"}).json()["id"]
+        first = time.perf_counter() - t1
+        t1 = time.perf_counter()
+        r = c.post(f"/cookbooks/{cb}/recipes:url", json={"url": f"{base}/sv_graph.html"})
+        first_import = time.perf_counter() - t1
+        t1 = time.perf_counter()
+        c.post(f"/cookbooks/{cb}/recipes:url", json={"url": f"{base}/en_list.html"})
+        second_import = time.perf_counter() - t1
+    srv.shutdown()
+    print(json.dumps({
+        "import_s": imported,
+        "ready_s": ready,
+        "startup_gauge_s": warmup.STARTUP_SECONDS.value,
+        "warmup_s": warmup.WARMUP_SECONDS.value,
+        "first_request_s": first,
+        "first_request_gauge_s": FIRST_REQUEST_SECONDS.value,
+        "first_import_s": first_import,
+        "second_import_s": second_import,
+        "import_status": r.status_code,
+        "parsers_at_import": loaded,
+    }))
+
+def measure(mode: str, runs: int) -> Dict[str, float]:
+    env = {**os.environ, **MODES[mode]}
+    env.pop("RECIPEER_DB_PATH", None)
+    samples: List[dict] = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-m", "Apps.Api.bench.bench_startup", "--child"],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    res: Dict[str, float] = {k: statistics.median(s[k] for s in samples) for k in samples[0] if k.endswith("_s")}
+    res["parsers_at_import"] = ",".join(samples[0]["parsers_at_import"]) or "-"
+    res["import_status"] = samples[0]["import_status"]
+    return res
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Cold start: module import, lifespan startup and first-request latency")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child()
+        return
+    print(f"{'mode':<9}{'import':>9}{'ready':>9}{'warmup':>9}{'1st req':>9}{'1st url':>9}{'2nd url':>9}  parsers loaded at import")
+    for mode in MODES:
+        r = measure(mode, args.runs)
+        print(
+            f"{mode:<9}"
+            + "".join(f"{r[k] * 1000:>7.0f}ms" for k in ("import_s", "ready_s", "warmup_s", "first_request_s", "first_import_s", "second_import_s"))
+            + f"  {r['parsers_at_import']}"
+        )
+
+if __name__ == "__main__":
+    main()
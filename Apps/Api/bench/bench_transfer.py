@@ -0,0 +1,96 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+from Apps.Api.bench.bench_memory import make_recipes
+from Apps.Api.core.storage import SqliteStorage
+from Apps.Api.core.store import Store
+from Apps.Api.schemas.models import CookbookCreate, RecipeBase
+from Apps.Api.services.transfer import import_ndjson, iter_export
+
+def _fill(store: Store, n: int) -> str:
+    cb = store.create_cookbook(CookbookCreate(name="Bench")).id
+    batch: List[RecipeBase] = []
+    for r in make_recipes(n, cookbooks=1):
+        batch.append(RecipeBase.model_validate(r.model_dump(exclude={"id", "cookbook_id", "version", "created_at", "updated_at"})))
+        if len(batch) == 500:
+            store.add_recipes(cb, batch)
+            batch.clear()
+    if batch:
+        store.add_recipes(cb, batch)
+    return cb
+
+def _measure(fn: Callable[[], int]) -> Tuple[float, int, int]:
+    # (sekunder, bytes, tracemalloc-topp under körningen)
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+async def _replay(path: str) -> AsyncIterator[bytes]:
+    # Som en request-kropp: filen läses i bitar, aldrig hel
+    with open(path, "rb") as f:
+        while chunk := f.read(64 * 1024):
+            yield chunk
+
+def run(n: int, compress: bool) -> Dict[str, float]:
+    tmp = tempfile.mkdtemp()
+    store = Store(SqliteStorage(os.path.join(tmp, "bench.sqlite")))
+    src = _fill(store, n)
+    dst = store.create_cookbook(CookbookCreate(name="Import")).id
+    path = os.path.join(tmp, "export.ndjson" + (".gz" if compress else ""))
+
+    def export() -> int:
+        size = 0
+        with open(path, "wb") as f:
+            for block in iter_export(store, src, compress=compress):
+                f.write(block)
+                size += len(block)
+        return size
+
+    def load() -> int:
+        res = asyncio.run(import_ndjson(store, dst, _replay(path)))
+        if res.imported != n or res.failed:
+            raise SystemExit(f"import mismatch: {res.imported} imported, {res.failed} failed")
+        return os.path.getsize(path)
+
+    ex_s, size, ex_peak = _measure(export)
+    im_s, _, im_peak = _measure(load)
+    return {
+        "recipes": n,
+        "bytes": size,
+        "export_rps": n / ex_s,
+        "export_mbps": size / ex_s / 1e6,
+        "export_peak": ex_peak,
+        "import_rps": n / im_s,
+        "import_mbps": size / im_s / 1e6,
+        "import_peak": im_peak,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Cookbook NDJSON export/import throughput and peak memory")
+    ap.add_argument("--recipes", type=int, default=5000)
+    args = ap.parse_args()
+    print(f"{'':<14}{'recipes':>8}{'size MB':>9}{'exp rec/s':>11}{'exp MB/s':>10}{'exp peak':>10}{'imp rec/s':>11}{'imp MB/s':>10}{'imp peak':>10}")
+    for compress in (False, True):
+        # Samma körning med dubbelt så många recept: toppminnet ska ligga still
+        for n in (args.recipes, 2 * args.recipes):
+            r = run(n, compress)
+            print(
+                f"{'gzip' if compress else 'ndjson':<14}{n:>8,}{r['bytes'] / 1e6:>9.1f}"
+                f"{r['export_rps']:>11,.0f}{r['export_mbps']:>10.1f}{r['export_peak'] / 1e6:>8.1f}MB"
+                f"{r['import_rps']:>11,.0f}{r['import_mbps']:>10.1f}{r['import_peak'] / 1e6:>8.1f}MB"
+            )
+
+if __name__ == "__main__":
+    main()
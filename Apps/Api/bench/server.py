@@ -0,0 +1,66 @@
+from __future__ import annotations
+import http.server
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+
+def _ad_filler(kb: int) -> str:
+    # Deterministiskt "annonsbrus" så att sidorna liknar riktiga 500 KB+-sidor
+    block = (
+        '<div class="ad-slot" data-slot="{i}"><script>window.ads=window.ads||[];'
+        'window.ads.push({{id:{i},size:[300,250],targeting:{{"sec":"recept"}}}});</script>'
+        '<iframe src="about:blank" width="300" height="250"></iframe><p>Annons {i}</p></div>\n'
+    )
+    out, size, i = [], 0, 0
+    while size < kb * 1024:
+        chunk = block.format(i=i)
+        out.append(chunk)
+        size += len(chunk)
+        i += 1
+    return "".join(out)
+
+def load_corpus(pad_kb: int = 0) -> Dict[str, bytes]:
+    pages: Dict[str, bytes] = {}
+    filler = _ad_filler(pad_kb) if pad_kb else ""
+    for p in sorted(CORPUS_DIR.glob("*.html")):
+        html = p.read_text(encoding="utf-8")
+        pages[f"/{p.name}"] = html.encode("utf-8")
+        if filler:
+            pages[f"/large/{p.name}"] = html.replace("<body>", "<body>\n" + filler, 1).encode("utf-8")
+    return pages
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    pages: Dict[str, bytes] = {}
+
+    def do_GET(self):
+        body = self.pages.get(self.path.split("?", 1)[0])
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Klienter som slutar läsa tidigt (strömmande parsning) stänger anslutningen
+        pass
+
+def serve(pages: Dict[str, bytes]) -> Tuple[http.server.ThreadingHTTPServer, str]:
+    handler = type("CorpusHandler", (_Handler,), {"pages": pages})
+    srv = _Server(("127.0.0.1", 0), handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}"
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional, Tuple
+
+from Apps.Api.schemas.models import Recipe
+
+_EPOCH = datetime(1970, 1, 1)
+_MICRO = timedelta(microseconds=1)
+
+def _intern(s: Optional[str]) -> Optional[str]:
+    return sys.intern(s) if s is not None else None
+
+def _column(values: Iterable[Any]) -> Optional[Tuple[Any, ...]]:
+    # En kolumn med bara None (t.ex. notes i de flesta recept) sparas som None
+    col = tuple(values)
+    return col if any(v is not None for v in col) else None
+
+def _micros(dt: datetime) -> int:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICRO
+
+def _datetime(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)
+
+class CompactRecipe:
+    # Internt lagringsformat för InMemoryStorage: inga Pydantic-objekt per ingrediens
+    # och steg, utan en tupel per kolumn. Namn, enheter, mängder och kokboks-id
+    # internas eftersom samma strängar återkommer i tusentals recept.
+    __slots__ = (
+        "id", "cookbook_id", "title", "description",
+        "names", "quantities", "units", "notes",
+        "steps", "step_orders",
+        "servings", "total_time", "source_url", "images", "language",
+        "version", "created_at", "updated_at",
+    )
+
+    @classmethod
+    def from_model(cls, r: Recipe) -> "CompactRecipe":
+        c = cls.__new__(cls)
+        c.id = r.id
+        c.cookbook_id = sys.intern(r.cookbook_id)
+        c.title = r.title
+        c.description = r.description
+        ings = r.ingredients
+        c.names = tuple(sys.intern(i.name) for i in ings)
+        c.quantities = _column(_intern(i.quantity) for i in ings)
+        c.units = _column(_intern(i.unit) for i in ings)
+        c.notes = _column(i.notes for i in ings)
+        c.steps = tuple(s.text for s in r.steps)
+        orders = tuple(s.order for s in r.steps)
+        # Numreringen 1..n är normalfallet och behöver inte sparas
+        c.step_orders = None if orders == tuple(range(1, len(orders) + 1)) else orders
+        c.servings = _intern(r.servings)
+        c.total_time = _intern(r.total_time)
+        c.source_url = str(r.source_url) if r.source_url is not None else None
+        c.images = tuple(r.images) or None
+        c.language = _intern(r.language)
+        c.version = r.version
+        c.created_at = _micros(r.created_at)
+        c.updated_at = _micros(r.updated_at)
+        return c
+
+    def stamp(self) -> Tuple[str, int, datetime]:
+        return self.id, self.version, _datetime(self.updated_at)
+
+    def to_model(self) -> Recipe:
+        # En validering av en ren dict sker helt i pydantic-core och är snabbare än
+        # model_construct per ingrediens
+        n = len(self.names)
+        none = (None,) * n
+        orders = self.step_orders or range(1, len(self.steps) + 1)
+        return Recipe.model_validate({
+            "id": self.id,
+            "cookbook_id": self.cookbook_id,
+            "title": self.title,
+            "description": self.description,
+            "ingredients": [
+                {"name": name, "quantity": q, "unit": u, "notes": notes}
+                for name, q, u, notes in zip(self.names, self.quantities or none, self.units or none, self.notes or none)
+            ],
+            "steps": [{"order": o, "text": t} for o, t in zip(orders, self.steps)],
+            "servings": self.servings,
+            "total_time": self.total_time,
+            "source_url": self.source_url,
+            "images": list(self.images or ()),
+            "language": self.language,
+            "version": self.version,
+            "created_at": _datetime(self.created_at),
+            "updated_at": _datetime(self.updated_at),
+        })
@@ -0,0 +1,41 @@
+from __future__ import annotations
+import json
+from difflib import SequenceMatcher
+from typing import Any, Dict, List
+
+# Patch-format, JSON-serialiserbart:
+#   {"title": {"set": "Ny titel"}, "ingredients": {"splice": [[i1, i2, [nya element]], ...]}}
+# En splice ersätter a[i1:i2]; index avser listan före patchen.
+
+def _item_key(item: Any) -> str:
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+def diff_list(a: List[Any], b: List[Any]) -> List[list]:
+    sm = SequenceMatcher(None, [_item_key(x) for x in a], [_item_key(x) for x in b], autojunk=False)
+    return [[i1, i2, b[j1:j2]] for op, i1, i2, j1, j2 in sm.get_opcodes() if op != "equal"]
+
+def diff(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    # Patch som gör a till b; bara ändrade fält tas med
+    patch: Dict[str, Any] = {}
+    for key in a.keys() | b.keys():
+        old, new = a.get(key), b.get(key)
+        if old == new:
+            continue
+        if isinstance(old, list) and isinstance(new, list):
+            patch[key] = {"splice": diff_list(old, new)}
+        else:
+            patch[key] = {"set": new}
+    return patch
+
+def apply_patch(a: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(a)
+    for key, op in patch.items():
+        if "set" in op:
+            out[key] = op["set"]
+            continue
+        items = list(out.get(key) or ())
+        # Bakifrån så att tidigare index fortfarande stämmer
+        for i1, i2, repl in reversed(op["splice"]):
+            items[i1:i2] = repl
+        out[key] = items
+    return out
@@ -0,0 +1,106 @@
+from __future__ import annotations
+import heapq
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from Apps.Api.schemas.models import Recipe
+from Apps.Api.core.search import LANGS, analyze
+
+# Postningar är heltal slot << 8 | ingrediensindex, så att set-snitt sker i C
+_IDX_BITS = 8
+_IDX_MASK = (1 << _IDX_BITS) - 1
+_SLOT_OF = _IDX_BITS.__rrshift__
+
+def ingredient_terms(r: Recipe) -> List[Tuple[int, List[str]]]:
+    lang = r.language if r.language in LANGS else "sv"
+    out: List[Tuple[int, List[str]]] = []
+    for i, ing in enumerate(r.ingredients[: _IDX_MASK + 1]):
+        terms = analyze(ing.name, lang)
+        if terms:
+            out.append((i, terms))
+    return out
+
+def pantry_term_sets(have: List[str], lang: Optional[str] = None) -> List[List[Set[str]]]:
+    # Varje användaringrediens ger en tokenmängd per språk; någon av dem måste täckas
+    langs = (lang,) if lang in LANGS else LANGS
+    out: List[List[Set[str]]] = []
+    for name in have:
+        alts = []
+        for lg in langs:
+            terms = set(analyze(name, lg))
+            if terms and terms not in alts:
+                alts.append(terms)
+        if alts:
+            out.append(alts)
+    return out
+
+class IngredientIndex:
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = {}
+        self.doc_ids: List[Optional[str]] = []
+        self.doc_slot: Dict[str, int] = {}
+        self.doc_group: List[Optional[str]] = []
+        self.doc_total: List[int] = []
+        self.doc_keys: Dict[int, List[Tuple[str, int]]] = {}
+        # Lediga slots efter borttagna dokument, som i InvertedIndex
+        self._free: List[int] = []
+
+    def add(self, doc_id: str, group: str, items: List[Tuple[int, List[str]]]) -> None:
+        self.remove(doc_id)
+        if self._free:
+            slot = self._free.pop()
+            self.doc_ids[slot] = doc_id
+            self.doc_group[slot] = group
+            self.doc_total[slot] = len(items)
+        else:
+            slot = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_group.append(group)
+            self.doc_total.append(len(items))
+        self.doc_slot[doc_id] = slot
+        keys: List[Tuple[str, int]] = []
+        for idx, terms in items:
+            key = slot << _IDX_BITS | idx
+            for t in set(terms):
+                self.postings.setdefault(t, set()).add(key)
+                keys.append((t, key))
+        self.doc_keys[slot] = keys
+
+    def remove(self, doc_id: str) -> None:
+        slot = self.doc_slot.pop(doc_id, None)
+        if slot is None:
+            return
+        for t, key in self.doc_keys.pop(slot, ()):
+            plist = self.postings.get(t)
+            if plist is not None:
+                plist.discard(key)
+                if not plist:
+                    del self.postings[t]
+        self.doc_ids[slot] = None
+        self.doc_group[slot] = None
+        self._free.append(slot)
+
+    def cover(self, pantry: List[List[Set[str]]], group: Optional[str] = None, limit: int = 20) -> List[Tuple[str, int, int, List[int]]]:
+        covered: Set[int] = set()
+        for alts in pantry:
+            for terms in alts:
+                plists = [self.postings.get(t) for t in terms]
+                if not all(plists):
+                    continue
+                plists.sort(key=len)
+                covered |= plists[0].intersection(*plists[1:])
+
+        # Räkna träffar per dokument helt i C: Counter över slot = key >> 8
+        counts = Counter(map(_SLOT_OF, covered))
+        total = self.doc_total
+        doc_group = self.doc_group
+        cands = counts.items()
+        if group is not None:
+            cands = [kv for kv in cands if doc_group[kv[0]] == group]
+        top = heapq.nlargest(limit, cands, key=lambda kv: (kv[1] / total[kv[0]], kv[1]))
+
+        out = []
+        for slot, n in top:
+            idx = sorted({key & _IDX_MASK for _, key in self.doc_keys[slot] if key in covered})
+            out.append((self.doc_ids[slot], n, total[slot], idx))
+        return out
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from Apps.Api.core.metrics import REGISTRY
+
+# 0 = av; annars samplas varje request och de som tar längre än så dumpas
+SLOW_REQUEST_MS = float(os.getenv("RECIPEER_SLOW_REQUEST_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("RECIPEER_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("RECIPEER_PROFILE_DIR")
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "recipeer_http_request_seconds", "HTTP request latency by route", labels=("method", "route", "status"),
+)
+SLOW_REQUESTS = REGISTRY.counter("recipeer_slow_requests_total", "Requests slower than RECIPEER_SLOW_REQUEST_MS")
+FIRST_REQUEST_SECONDS = REGISTRY.gauge("recipeer_first_request_seconds", "Latency of the first HTTP request this process served")
+
+log = logging.getLogger("recipeer.profiling")
+
+# Trådar som bara väntar (idle-workers, event-loopens select) är brus i en profil
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+def _collapse(frame: Any, max_depth: int = 64) -> Optional[str]:
+    if Path(frame.f_code.co_filename).name in _IDLE_FILES:
+        return None
+    names = []
+    while frame is not None and len(names) < max_depth:
+        co = frame.f_code
+        names.append(f"{co.co_name} ({Path(co.co_filename).name}:{co.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class StackSampler:
+    # En tråd samplar alla trådars stackar så länge minst en request pågår. Async-requests
+    # delar event-loop och workers, så samtidiga requests syns i varandras profiler.
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._active: Dict[int, Tally] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self) -> Tally:
+        samples: Tally = Tally()
+        with self._lock:
+            self._active[id(samples)] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="recipeer-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return samples
+
+    def end(self, samples: Tally) -> None:
+        with self._lock:
+            self._active.pop(id(samples), None)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            if not self._active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            stacks = [s for tid, f in sys._current_frames().items() if tid != me and (s := _collapse(f))]
+            with self._lock:
+                for samples in self._active.values():
+                    samples.update(stacks)
+            time.sleep(self.interval)
+
+def dump_slow_request(method: str, path: str, route: str, elapsed: float, samples: Tally) -> Optional[Path]:
+    SLOW_REQUESTS.inc()
+    log.warning("Slow request %s %s took %.0f ms (%d stack samples)", method, path, elapsed * 1000, sum(samples.values()))
+    if not PROFILE_DIR:
+        for stack, n in samples.most_common(5):
+            log.warning("  %5d  %s", n, stack.rsplit(";", 3)[-3:])
+        return None
+    # Collapsed-stack-format ("a;b;c antal"), läses direkt av flamegraph.pl och speedscope
+    out = Path(PROFILE_DIR)
+    out.mkdir(parents=True, exist_ok=True)
+    name = _UNSAFE_RE.sub("_", f"{method}-{route}").strip("_")
+    target = out / f"{int(time.time() * 1000)}-{name}-{int(elapsed * 1000)}ms.folded"
+    target.write_text("".join(f"{stack} {n}\n" for stack, n in samples.most_common()), encoding="utf-8")
+    return target
+
+class RequestMetricsMiddleware:
+    def __init__(self, app: Callable, slow_ms: float = SLOW_REQUEST_MS, sampler: Optional[StackSampler] = None):
+        self.app = app
+        self.slow = slow_ms / 1000
+        self.sampler = sampler or (StackSampler() if slow_ms > 0 else None)
+        self._first = True
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        samples = self.sampler.begin() if self.sampler else None
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - t0
+            # Routens mall ("/jobs/{job_id}"), inte själva sökvägen, så att antalet serier är begränsat
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+            if self._first:
+                # Kallstartens kostnad: allt som fortfarande laddas lat hamnar i den här siffran
+                self._first = False
+                FIRST_REQUEST_SECONDS.set(elapsed)
+            if samples is not None:
+                self.sampler.end(samples)
+                if elapsed >= self.slow:
+                    # Filskrivningen får inte blockera event-loopen, allra minst för de långsamma requesterna
+                    await asyncio.to_thread(dump_slow_request, scope["method"], scope["path"], route, elapsed, samples)
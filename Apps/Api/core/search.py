@@ -0,0 +1,252 @@
+from __future__ import annotations
+import heapq
+import math
+from bisect import bisect_left, bisect_right
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from Apps.Api.schemas.models import Recipe
+from Apps.Api.services.ingredient_utils import load_unit_aliases, replace_fraction_chars
+
+LANGS = ("sv", "en")
+
+# Fältvikter för BM25F: titel väger mest, sedan ingredienser, sedan steg
+FIELD_WEIGHTS = {"title": 3.0, "ingredients": 2.0, "steps": 1.0}
+
+# Bumpas när analysen (stamning, stoppord) ändras; lagrade söktermer byggs då om
+ANALYZER_VERSION = 2
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Hur långt medellängden får driva innan en cachad impact-lista sorteras om
+IMPACT_MAX_DRIFT = 1.1
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+STOPWORDS = {
+    "sv": frozenset("""
+        och i på med till av för att en ett som den det de är om eller så från ur
+        vid efter under över utan men du din ditt dina vi man sin sitt sina
+    """.split()),
+    "en": frozenset("""
+        a an and the of in on with to for or from into at by as is are be it its
+        your you if then until about over under
+    """.split()),
+}
+
+# Singularens -a/-e tas också bort så att "pannkaka" och "pannkakor", "äpple" och "äpplen" får samma stam
+SUFFIXES = {
+    "sv": ("arnas", "ernas", "ornas", "arna", "erna", "orna", "ande", "ade", "ar", "er", "or", "en", "et", "na", "a", "e"),
+    "en": ("ies", "oes", "es", "s"),
+}
+
+def stem(token: str, lang: str) -> str:
+    for suf in SUFFIXES.get(lang, ()):
+        if token.endswith(suf) and len(token) - len(suf) >= 3:
+            if lang == "en":
+                if suf == "ies":
+                    return token[:-3] + "y"
+                if suf == "oes":
+                    return token[:-2]
+                if suf == "s" and token.endswith("ss"):
+                    return token
+                if suf == "es":
+                    # "es" bara efter sibilanter: dishes, boxes
+                    return token[:-2] if token[:-2].endswith(("sh", "ch", "x", "z", "ss")) else token[:-1]
+            return token[: -len(suf)]
+    return token
+
+def analyze(text: str, lang: str) -> List[str]:
+    stop = STOPWORDS.get(lang, frozenset())
+    units = load_unit_aliases(lang)
+    out: List[str] = []
+    for w in _WORD_RE.findall(replace_fraction_chars(text).lower()):
+        if len(w) < 2 or w in stop:
+            continue
+        # Enheter normaliseras som i ingredient_utils: "matskedar" -> "msk"
+        out.append(units.get(w) or stem(w, lang))
+    return out
+
+def analyze_query(q: str, lang: Optional[str] = None) -> List[str]:
+    langs = (lang,) if lang in LANGS else LANGS
+    seen: Dict[str, None] = {}
+    for lg in langs:
+        for t in analyze(q, lg):
+            seen.setdefault(t, None)
+    return list(seen)
+
+def recipe_fields(r: Recipe) -> Dict[str, List[str]]:
+    lang = r.language if r.language in LANGS else "sv"
+    return {
+        "title": analyze(r.title, lang),
+        "ingredients": analyze(" ".join(i.name for i in r.ingredients), lang),
+        "steps": analyze(" ".join(s.text for s in r.steps), lang),
+    }
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.doc_ids: List[Optional[str]] = []
+        self.doc_slot: Dict[str, int] = {}
+        self.doc_len: List[float] = []
+        self.doc_group: List[Optional[str]] = []
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.groups: Dict[str, Set[int]] = {}
+        self.total_len = 0.0
+        self.n_docs = 0
+        # Lediga slots efter borttagna dokument; återanvänds så att listorna inte växer per uppdatering
+        self._free: List[int] = []
+        # Postningar sorterade på BM25-bidrag, byggs lat per term och hålls sedan
+        # sorterade vid skrivningar. Sparas som (medellängd vid bygget, slots, -bidrag).
+        self._impact: Dict[str, Tuple[float, List[int], List[float]]] = {}
+
+    def add(self, doc_id: str, group: str, fields: Dict[str, List[str]]) -> None:
+        self.remove(doc_id)
+        tf: Dict[str, float] = {}
+        for field, tokens in fields.items():
+            w = FIELD_WEIGHTS.get(field, 1.0)
+            for t in tokens:
+                tf[t] = tf.get(t, 0.0) + w
+        length = sum(tf.values())
+        if self._free:
+            slot = self._free.pop()
+            self.doc_ids[slot] = doc_id
+            self.doc_len[slot] = length
+            self.doc_group[slot] = group
+        else:
+            slot = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_len.append(length)
+            self.doc_group.append(group)
+        self.doc_slot[doc_id] = slot
+        self.groups.setdefault(group, set()).add(slot)
+        self.doc_terms[slot] = tuple(tf)
+        for t, f in tf.items():
+            self.postings.setdefault(t, {})[slot] = f
+            cached = self._impact.get(t)
+            if cached is not None:
+                # Insättning på rätt plats i stället för omsortering av hela listan
+                avgdl, slots, neg = cached
+                imp = -self._impact_of(slot, f, avgdl)
+                i = bisect_right(neg, imp)
+                slots.insert(i, slot)
+                neg.insert(i, imp)
+        self.total_len += length
+        self.n_docs += 1
+
+    def remove(self, doc_id: str) -> None:
+        slot = self.doc_slot.pop(doc_id, None)
+        if slot is None:
+            return
+        for t in self.doc_terms.pop(slot, ()):
+            plist = self.postings.get(t)
+            if plist is not None:
+                f = plist.pop(slot, None)
+                cached = self._impact.get(t)
+                if cached is not None and f is not None:
+                    avgdl, slots, neg = cached
+                    i = slots.index(slot, bisect_left(neg, -self._impact_of(slot, f, avgdl)))
+                    del slots[i], neg[i]
+                if not plist:
+                    del self.postings[t]
+                    self._impact.pop(t, None)
+        self.groups.get(self.doc_group[slot], set()).discard(slot)
+        self.total_len -= self.doc_len[slot]
+        self.n_docs -= 1
+        self.doc_ids[slot] = None
+        self.doc_group[slot] = None
+        self._free.append(slot)
+
+    def _tf_norm(self, avgdl: float):
+        norm_k = BM25_K1 * (1 - BM25_B)
+        len_k = BM25_K1 * BM25_B / avgdl
+        doc_len = self.doc_len
+        def part(slot: int, f: float) -> float:
+            return f * (BM25_K1 + 1) / (f + norm_k + len_k * doc_len[slot])
+        return part
+
+    def _impact_of(self, slot: int, f: float, avgdl: float) -> float:
+        return f * (BM25_K1 + 1) / (f + BM25_K1 * (1 - BM25_B) + BM25_K1 * BM25_B / avgdl * self.doc_len[slot])
+
+    def _impact_list(self, term: str, plist: Dict[int, float], avgdl: float) -> Tuple[List[int], List[float], float]:
+        # Listan är sorterad med medellängden den byggdes med. Senare skrivningar ändrar
+        # den, och ett bidrag kan då som mest växa med faktorn avgdl / byggd_avgdl: listan
+        # duger som övre gräns om tröskeln skalas med den. Först vid större drift byggs den om.
+        cached = self._impact.get(term)
+        if cached is not None:
+            drift = avgdl / cached[0]
+            if 1 / IMPACT_MAX_DRIFT <= drift <= IMPACT_MAX_DRIFT:
+                return cached[1], cached[2], max(1.0, drift)
+        ranked = sorted((-self._impact_of(slot, f, avgdl), slot) for slot, f in plist.items())
+        slots = [slot for _, slot in ranked]
+        neg = [imp for imp, _ in ranked]
+        self._impact[term] = (avgdl, slots, neg)
+        return slots, neg, 1.0
+
+    def search(self, terms: Iterable[str], group: Optional[str] = None, limit: int = 20) -> List[Tuple[str, float]]:
+        if self.n_docs == 0:
+            return []
+        n = self.n_docs
+        avgdl = self.total_len / n or 1.0
+        part = self._tf_norm(avgdl)
+        plan = []
+        for t in set(terms):
+            plist = self.postings.get(t)
+            if plist:
+                idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                plan.append((t, idf, plist))
+        if not plan:
+            return []
+
+        def score(slot: int) -> float:
+            total = 0.0
+            for _, idf, plist in plan:
+                f = plist.get(slot)
+                if f is not None:
+                    total += idf * part(slot, f)
+            return total
+
+        if group is not None:
+            # Små kokböcker: poängsätt gruppens dokument direkt
+            members = self.groups.get(group, set())
+            if len(members) <= sum(len(p) for _, _, p in plan):
+                scored = ((slot, score(slot)) for slot in members)
+                top = heapq.nlargest(limit, (kv for kv in scored if kv[1] > 0), key=lambda kv: kv[1])
+                return [(self.doc_ids[slot], sc) for slot, sc in top]
+
+        # Threshold Algorithm över impact-sorterade listor: vi slutar så fort inget
+        # osett dokument kan slå det k:te bästa
+        lists = []
+        for t, idf, plist in plan:
+            slots, neg, scale = self._impact_list(t, plist, avgdl)
+            lists.append((idf * scale, slots, neg))
+        pos = [0] * len(lists)
+        heap: List[Tuple[float, int]] = []
+        seen: Set[int] = set()
+        batch = 32
+        while True:
+            threshold = 0.0
+            exhausted = True
+            for i, (idf, slots, neg) in enumerate(lists):
+                p = pos[i]
+                end = min(p + batch, len(slots))
+                for slot in slots[p:end]:
+                    if slot in seen:
+                        continue
+                    seen.add(slot)
+                    if group is not None and self.doc_group[slot] != group:
+                        continue
+                    sc = score(slot)
+                    if len(heap) < limit:
+                        heapq.heappush(heap, (sc, slot))
+                    elif sc > heap[0][0]:
+                        heapq.heapreplace(heap, (sc, slot))
+                pos[i] = end
+                if end < len(slots):
+                    exhausted = False
+                    threshold -= idf * neg[end]
+            if exhausted or (len(heap) >= limit and heap[0][0] >= threshold):
+                break
+
+        top = sorted(heap, reverse=True)
+        return [(self.doc_ids[slot], sc) for sc, slot in top]
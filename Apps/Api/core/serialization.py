@@ -0,0 +1,116 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from Apps.Api.core.metrics import REGISTRY
+from Apps.Api.schemas.models import Recipe
+
+try:
+    import orjson
+except ImportError:  # valfritt beroende; json räcker för de små kuverten
+    orjson = None
+
+JSON_CACHE_SIZE = int(os.getenv("RECIPEER_JSON_CACHE_SIZE", "10000"))
+
+JSON_CACHE_HITS = REGISTRY.counter("recipeer_json_cache_hits_total", "Recipes served from cached JSON bytes")
+JSON_CACHE_MISSES = REGISTRY.counter("recipeer_json_cache_misses_total", "Recipes serialized because no cached JSON matched")
+
+# (id, version, updated_at): ändras varje gång receptets innehåll ändras
+RecipeStamp = Tuple[str, int, datetime]
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def model_json(m: BaseModel) -> bytes:
+    # Direkt till bytes i pydantic-core, utan model_dump_json():s str-omväg
+    return m.__pydantic_serializer__.to_json(m)
+
+def stamp_of(r: Recipe) -> RecipeStamp:
+    return r.id, r.version, r.updated_at
+
+class RecipeJsonCache:
+    def __init__(self, size: int = JSON_CACHE_SIZE):
+        self.size = size
+        self._data: "OrderedDict[str, Tuple[int, datetime, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, stamp: RecipeStamp) -> Optional[bytes]:
+        rid, version, updated_at = stamp
+        with self._lock:
+            hit = self._data.get(rid)
+            if hit is None or hit[0] != version or hit[1] != updated_at:
+                return None
+            self._data.move_to_end(rid)
+        return hit[2]
+
+    def put(self, stamp: RecipeStamp, body: bytes) -> None:
+        if self.size <= 0:
+            return
+        rid, version, updated_at = stamp
+        with self._lock:
+            self._data[rid] = (version, updated_at, body)
+            self._data.move_to_end(rid)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+RECIPE_JSON = RecipeJsonCache()
+
+def recipe_json(r: Recipe) -> bytes:
+    stamp = stamp_of(r)
+    body = RECIPE_JSON.get(stamp)
+    if body is None:
+        JSON_CACHE_MISSES.inc()
+        body = model_json(r)
+        RECIPE_JSON.put(stamp, body)
+    else:
+        JSON_CACHE_HITS.inc()
+    return body
+
+def recipes_json(stamps: List[RecipeStamp], fetch: Callable[[List[str]], List[Recipe]]) -> List[bytes]:
+    # Bara recept vars stämpel saknas i cachen hämtas och serialiseras
+    out: List[Optional[bytes]] = [RECIPE_JSON.get(s) for s in stamps]
+    missing = [s[0] for s, body in zip(stamps, out) if body is None]
+    JSON_CACHE_HITS.inc(len(stamps) - len(missing))
+    if missing:
+        JSON_CACHE_MISSES.inc(len(missing))
+        fresh: Dict[str, bytes] = {}
+        for r in fetch(missing):
+            body = model_json(r)
+            RECIPE_JSON.put(stamp_of(r), body)
+            fresh[r.id] = body
+        out = [body if body is not None else fresh.get(s[0]) for s, body in zip(stamps, out)]
+    # Ett recept som försvunnit mellan listning och hämtning utelämnas
+    return [body for body in out if body is not None]
+
+def page_json(items: Iterable[bytes], next_cursor: Optional[str]) -> bytes:
+    return b'{"items":[' + b",".join(items) + b'],"next_cursor":' + dumps(next_cursor) + b"}"
+
+def etag_for(parts: Iterable[Any]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else repr(p).encode("utf-8"))
+        h.update(b"\x00")
+    return f'"{h.hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match jämförs svagt (RFC 9110): W/-prefix ignoreras
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
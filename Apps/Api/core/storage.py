@@ -0,0 +1,719 @@
+from __future__ import annotations
+import heapq
+import json
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from Apps.Api.schemas.models import Comment, Cookbook, Rating, RatingSummary, Recipe, RecipeRevision, Request
+from Apps.Api.core.compact import CompactRecipe
+from Apps.Api.core.search import ANALYZER_VERSION, FIELD_WEIGHTS, InvertedIndex, recipe_fields
+from Apps.Api.core.ingredient_index import IngredientIndex, ingredient_terms
+from Apps.Api.core.urls import url_key
+
+# top_rated med min_count: så många av de bäst betygsatta gås igenom i snittordning.
+# Räcker de inte läses i stället bara recepten med tillräckligt många betyg, via antalet.
+TOP_RATED_SCAN = 512
+
+class StorageBackend(ABC):
+
+    #region Cookbooks
+
+    @abstractmethod
+    def put_cookbook(self, cb: Cookbook) -> None: ...
+
+    @abstractmethod
+    def get_cookbook(self, cookbook_id: str) -> Optional[Cookbook]: ...
+
+    @abstractmethod
+    def list_cookbooks(self, after: Optional[str] = None, limit: Optional[int] = None) -> List[Cookbook]: ...
+
+    #endregion
+
+    #region Recipes
+
+    @abstractmethod
+    def put_recipes(self, recipes: List[Recipe], url_keys: Optional[Dict[str, List[str]]] = None) -> None: ...
+
+    @abstractmethod
+    def get_recipe(self, recipe_id: str) -> Optional[Recipe]: ...
+
+    @abstractmethod
+    def get_recipes(self, recipe_ids: List[str]) -> List[Recipe]: ...
+
+    @abstractmethod
+    def list_recipes(self, cookbook_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[Recipe]: ...
+
+    @abstractmethod
+    def list_recipe_stamps(self, cookbook_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[str, int, datetime]]: ...
+
+    @abstractmethod
+    def put_url_keys(self, recipe_id: str, keys: List[str]) -> None: ...
+
+    @abstractmethod
+    def find_recipes_by_url_key(self, key: str) -> List[Recipe]: ...
+
+    @abstractmethod
+    def search_recipes(self, terms: List[str], cookbook_id: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, float]]: ...
+
+    @abstractmethod
+    def cover_recipes(self, pantry: List[List[Set[str]]], cookbook_id: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, int, int, List[int]]]: ...
+
+    #endregion
+
+    #region Ratings and comments
+
+    @abstractmethod
+    def add_rating(self, rating: Rating, cookbook_id: str) -> RatingSummary: ...
+
+    @abstractmethod
+    def get_rating_summary(self, recipe_id: str) -> RatingSummary: ...
+
+    @abstractmethod
+    def top_rated(self, cookbook_id: str, limit: int = 20, min_count: int = 1) -> List[RatingSummary]: ...
+
+    @abstractmethod
+    def add_comment(self, comment: Comment) -> int: ...
+
+    @abstractmethod
+    def list_comments(self, recipe_id: str, before: Optional[int] = None, limit: int = 50) -> List[Tuple[int, Comment]]: ...
+
+    #endregion
+
+    #region Change requests
+
+    @abstractmethod
+    def put_request(self, req: Request) -> None: ...
+
+    @abstractmethod
+    def get_request(self, request_id: str) -> Optional[Request]: ...
+
+    @abstractmethod
+    def list_requests(self, recipe_id: str, status: Optional[str] = None, after: Optional[str] = None, limit: Optional[int] = None) -> List[Request]: ...
+
+    @abstractmethod
+    def close_request(self, req: Request) -> bool: ...
+
+    @abstractmethod
+    def update_recipe(self, recipe: Recipe, expected_version: int, revision: RecipeRevision, request: Optional[Request] = None) -> bool: ...
+
+    @abstractmethod
+    def list_revisions(self, recipe_id: str, from_version: int, limit: int) -> List[RecipeRevision]: ...
+
+    #endregion
+
+    def close(self) -> None:
+        pass
+
+class RatingStats:
+    __slots__ = ("cookbook_id", "count", "total", "histogram")
+
+    def __init__(self, cookbook_id: str):
+        self.cookbook_id = cookbook_id
+        self.count = 0
+        self.total = 0
+        self.histogram = [0] * 5
+
+    def rank_key(self, recipe_id: str) -> Tuple[float, int, str]:
+        # Stigande sortering ger högst snitt, sedan flest betyg, först
+        return -self.total / self.count, -self.count, recipe_id
+
+    def summary(self, recipe_id: str) -> RatingSummary:
+        return RatingSummary(
+            recipe_id=recipe_id,
+            count=self.count,
+            average=self.total / self.count if self.count else None,
+            histogram=list(self.histogram),
+        )
+
+class InMemoryStorage(StorageBackend):
+    def __init__(self):
+        self.cookbooks: Dict[str, Cookbook] = {}
+        # Kompakt form internt; Pydantic-modeller skapas först när ett recept lämnar lagret
+        self.recipes: Dict[str, CompactRecipe] = {}
+        # url_key(source_url) och importerade URL-varianter -> recept-id:n
+        self.by_url_key: Dict[str, Set[str]] = {}
+        # Sorterade id-listor så att en sida kostar O(log n + limit)
+        self.cookbook_ids: List[str] = []
+        self.by_cookbook: Dict[str, List[str]] = {}
+        self.text_index = InvertedIndex()
+        self.ingredient_index = IngredientIndex()
+        # Betygsaggregat uppdateras vid varje skrivning; topplistan per kokbok hålls sorterad
+        self.ratings: Dict[str, List[Rating]] = {}
+        self.rating_stats: Dict[str, RatingStats] = {}
+        self.top_by_cookbook: Dict[str, List[Tuple[float, int, str]]] = {}
+        self.count_by_cookbook: Dict[str, List[Tuple[int, str]]] = {}
+        # Kommentarer per recept i skrivordning, med stigande löpnummer som markör
+        self.comments: Dict[str, List[Comment]] = {}
+        self.comment_seqs: Dict[str, array] = {}
+        self.comment_seq = 0
+        # Ändringsförslag, och per recept revisionerna i versionsordning (index = version - 1)
+        self.requests: Dict[str, Request] = {}
+        self.requests_by_recipe: Dict[str, List[str]] = {}
+        self.revisions: Dict[str, List[RecipeRevision]] = {}
+        # Skyddar även sökindexen: skrivningar och sökningar körs från flera trådar.
+        # Reentrant eftersom update_recipe skriver via put_recipes med låset taget.
+        self._lock = threading.RLock()
+
+    def put_cookbook(self, cb: Cookbook) -> None:
+        if cb.id not in self.cookbooks:
+            insort(self.cookbook_ids, cb.id)
+        self.cookbooks[cb.id] = cb
+
+    def get_cookbook(self, cookbook_id: str) -> Optional[Cookbook]:
+        return self.cookbooks.get(cookbook_id)
+
+    def list_cookbooks(self, after: Optional[str] = None, limit: Optional[int] = None) -> List[Cookbook]:
+        return [self.cookbooks[i] for i in _page(self.cookbook_ids, after, limit)]
+
+    def put_recipes(self, recipes: List[Recipe], url_keys: Optional[Dict[str, List[str]]] = None) -> None:
+        # Analysen görs utanför låset; bara själva indexskrivningen serialiseras
+        rows = [(r, CompactRecipe.from_model(r), recipe_fields(r), ingredient_terms(r)) for r in recipes]
+        with self._lock:
+            for r, compact, fields, terms in rows:
+                prev = self.recipes.get(r.id)
+                if prev is None:
+                    insort(self.by_cookbook.setdefault(r.cookbook_id, []), r.id)
+                self.recipes[r.id] = compact
+                self.text_index.add(r.id, r.cookbook_id, fields)
+                self.ingredient_index.add(r.id, r.cookbook_id, terms)
+                if r.source_url is not None:
+                    self.by_url_key.setdefault(url_key(str(r.source_url)), set()).add(r.id)
+            for rid, keys in (url_keys or {}).items():
+                for key in keys:
+                    self.by_url_key.setdefault(key, set()).add(rid)
+
+    def get_recipe(self, recipe_id: str) -> Optional[Recipe]:
+        c = self.recipes.get(recipe_id)
+        return c.to_model() if c is not None else None
+
+    def get_recipes(self, recipe_ids: List[str]) -> List[Recipe]:
+        return [self.recipes[i].to_model() for i in recipe_ids if i in self.recipes]
+
+    def list_recipes(self, cookbook_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[Recipe]:
+        return [self.recipes[i].to_model() for i in _page(self.by_cookbook.get(cookbook_id, []), after, limit)]
+
+    def list_recipe_stamps(self, cookbook_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[str, int, datetime]]:
+        return [self.recipes[i].stamp() for i in _page(self.by_cookbook.get(cookbook_id, []), after, limit)]
+
+    def put_url_keys(self, recipe_id: str, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self.by_url_key.setdefault(key, set()).add(recipe_id)
+
+    def find_recipes_by_url_key(self, key: str) -> List[Recipe]:
+        with self._lock:
+            found = sorted((self.recipes[rid] for rid in self.by_url_key.get(key, ())), key=lambda c: c.created_at)
+        return [c.to_model() for c in found]
+
+    def search_recipes(self, terms: List[str], cookbook_id: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, float]]:
+        with self._lock:
+            hits = [(self.recipes[rid], score) for rid, score in self.text_index.search(terms, group=cookbook_id, limit=limit)]
+        return [(c.to_model(), score) for c, score in hits]
+
+    def cover_recipes(self, pantry: List[List[Set[str]]], cookbook_id: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, int, int, List[int]]]:
+        with self._lock:
+            hits = [(self.recipes[rid], n, total, idx) for rid, n, total, idx in self.ingredient_index.cover(pantry, group=cookbook_id, limit=limit)]
+        return [(c.to_model(), n, total, idx) for c, n, total, idx in hits]
+
+    def add_rating(self, rating: Rating, cookbook_id: str) -> RatingSummary:
+        with self._lock:
+            self.ratings.setdefault(rating.recipe_id, []).append(rating)
+            stats = self.rating_stats.get(rating.recipe_id)
+            top = self.top_by_cookbook.setdefault(cookbook_id, [])
+            counts = self.count_by_cookbook.setdefault(cookbook_id, [])
+            if stats is None:
+                stats = self.rating_stats[rating.recipe_id] = RatingStats(cookbook_id)
+            else:
+                old = stats.rank_key(rating.recipe_id)
+                del top[bisect_left(top, old)]
+                del counts[bisect_left(counts, (-stats.count, rating.recipe_id))]
+            stats.count += 1
+            stats.total += rating.stars
+            stats.histogram[rating.stars - 1] += 1
+            insort(top, stats.rank_key(rating.recipe_id))
+            insort(counts, (-stats.count, rating.recipe_id))
+            return stats.summary(rating.recipe_id)
+
+    def get_rating_summary(self, recipe_id: str) -> RatingSummary:
+        stats = self.rating_stats.get(recipe_id)
+        return stats.summary(recipe_id) if stats is not None else RatingSummary(recipe_id=recipe_id)
+
+    def top_rated(self, cookbook_id: str, limit: int = 20, min_count: int = 1) -> List[RatingSummary]:
+        with self._lock:
+            top = self.top_by_cookbook.get(cookbook_id, [])
+            out: List[RatingSummary] = []
+            for _, neg_count, rid in top[:TOP_RATED_SCAN]:
+                if -neg_count >= min_count:
+                    out.append(self.rating_stats[rid].summary(rid))
+                    if len(out) >= limit:
+                        return out
+            if len(top) <= TOP_RATED_SCAN:
+                return out
+            # Få recept har min_count betyg: ta dem via antalslistan och sortera bara dem
+            counts = self.count_by_cookbook[cookbook_id]
+            enough = counts[: bisect_left(counts, (-min_count + 1,))]
+            keys = heapq.nsmallest(limit, (self.rating_stats[rid].rank_key(rid) for _, rid in enough))
+            return [self.rating_stats[rid].summary(rid) for _, _, rid in keys]
+
+    def add_comment(self, comment: Comment) -> int:
+        with self._lock:
+            self.comment_seq += 1
+            self.comments.setdefault(comment.recipe_id, []).append(comment)
+            self.comment_seqs.setdefault(comment.recipe_id, array("q")).append(self.comment_seq)
+            return self.comment_seq
+
+    def list_comments(self, recipe_id: str, before: Optional[int] = None, limit: int = 50) -> List[Tuple[int, Comment]]:
+        # Nyast först: sidan slutar strax före markören
+        seqs = self.comment_seqs.get(recipe_id)
+        if not seqs:
+            return []
+        end = bisect_left(seqs, before) if before is not None else len(seqs)
+        start = max(0, end - limit)
+        items = self.comments[recipe_id]
+        return [(seqs[i], items[i]) for i in range(end - 1, start - 1, -1)]
+
+    def put_request(self, req: Request) -> None:
+        if req.id not in self.requests:
+            insort(self.requests_by_recipe.setdefault(req.recipe_id, []), req.id)
+        self.requests[req.id] = req.model_copy(deep=True)
+
+    def get_request(self, request_id: str) -> Optional[Request]:
+        req = self.requests.get(request_id)
+        return req.model_copy(deep=True) if req is not None else None
+
+    def list_requests(self, recipe_id: str, status: Optional[str] = None, after: Optional[str] = None, limit: Optional[int] = None) -> List[Request]:
+        ids = self.requests_by_recipe.get(recipe_id, [])
+        if status is not None:
+            ids = [i for i in ids if self.requests[i].status == status]
+        return [self.requests[i].model_copy(deep=True) for i in _page(ids, after, limit)]
+
+    def close_request(self, req: Request) -> bool:
+        # Compare-and-set open -> req.status: bara en av ett parallellt godkänn/avslå vinner
+        with self._lock:
+            stored = self.requests.get(req.id)
+            if stored is None or stored.status != "open":
+                return False
+            self.requests[req.id] = req.model_copy(deep=True)
+            return True
+
+    def update_recipe(self, recipe: Recipe, expected_version: int, revision: RecipeRevision, request: Optional[Request] = None) -> bool:
+        # Compare-and-set på versionen, och på förslagets status om ett förslag stängs samtidigt
+        with self._lock:
+            current = self.recipes.get(recipe.id)
+            if current is None or current.version != expected_version:
+                return False
+            if request is not None and not self.close_request(request):
+                return False
+            self.put_recipes([recipe])
+            self.revisions.setdefault(recipe.id, []).append(revision)
+            return True
+
+    def list_revisions(self, recipe_id: str, from_version: int, limit: int) -> List[RecipeRevision]:
+        revs = self.revisions.get(recipe_id, [])
+        return revs[max(0, from_version - 1):max(0, from_version - 1) + limit]
+
+def _page(ids: List[str], after: Optional[str], limit: Optional[int]) -> List[str]:
+    start = bisect_right(ids, after) if after is not None else 0
+    return ids[start:start + limit] if limit is not None else ids[start:]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cookbooks (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recipes (
+    id TEXT PRIMARY KEY,
+    cookbook_id TEXT NOT NULL REFERENCES cookbooks(id),
+    source_url TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_recipes_cookbook_id ON recipes(cookbook_id, id);
+CREATE INDEX IF NOT EXISTS ix_recipes_source_url ON recipes(source_url);
+CREATE TABLE IF NOT EXISTS ingredient_terms (
+    rid INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    term TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ingredient_terms_term ON ingredient_terms(term, rid, idx);
+CREATE INDEX IF NOT EXISTS ix_ingredient_terms_rid ON ingredient_terms(rid);
+CREATE TABLE IF NOT EXISTS recipe_urls (
+    key TEXT NOT NULL,
+    recipe_id TEXT NOT NULL,
+    PRIMARY KEY (key, recipe_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ratings (
+    id TEXT PRIMARY KEY,
+    recipe_id TEXT NOT NULL REFERENCES recipes(id),
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rating_stats (
+    recipe_id TEXT PRIMARY KEY REFERENCES recipes(id),
+    cookbook_id TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    s1 INTEGER NOT NULL,
+    s2 INTEGER NOT NULL,
+    s3 INTEGER NOT NULL,
+    s4 INTEGER NOT NULL,
+    s5 INTEGER NOT NULL,
+    average REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_rating_stats_top ON rating_stats(cookbook_id, average DESC, n DESC, recipe_id);
+CREATE INDEX IF NOT EXISTS ix_rating_stats_count ON rating_stats(cookbook_id, n);
+CREATE TABLE IF NOT EXISTS comments (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    recipe_id TEXT NOT NULL REFERENCES recipes(id),
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_comments_feed ON comments(recipe_id, seq);
+CREATE TABLE IF NOT EXISTS change_requests (
+    id TEXT PRIMARY KEY,
+    recipe_id TEXT NOT NULL REFERENCES recipes(id),
+    status TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_change_requests_recipe ON change_requests(recipe_id, id);
+CREATE TABLE IF NOT EXISTS recipe_revisions (
+    recipe_id TEXT NOT NULL REFERENCES recipes(id),
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (recipe_id, version)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts USING fts5(
+    title, ingredients, steps,
+    tokenize = "unicode61 remove_diacritics 0"
+);
+"""
+
+# Samma fältvikter som InvertedIndex, i kolumnordning
+_FTS_RANK = "bm25(recipe_fts, {title}, {ingredients}, {steps})".format(**FIELD_WEIGHTS)
+
+class SqliteStorage(StorageBackend):
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+        self._backfill_fts()
+        self._backfill_url_keys()
+
+    def _backfill_fts(self) -> None:
+        # user_version = analysversionen termerna byggdes med; en annan version byggs om
+        conn = self._conn()
+        current = conn.execute("PRAGMA user_version").fetchone()[0] == ANALYZER_VERSION
+        if current and conn.execute("SELECT 1 FROM recipe_fts LIMIT 1").fetchone() is not None:
+            return
+        rows = conn.execute("SELECT rowid, data FROM recipes").fetchall()
+        with conn:
+            for rowid, data in rows:
+                self._index_recipe(conn, rowid, Recipe.model_validate_json(data))
+            conn.execute(f"PRAGMA user_version = {ANALYZER_VERSION}")
+
+    def _backfill_url_keys(self) -> None:
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM recipe_urls LIMIT 1").fetchone() is not None:
+            return
+        rows = conn.execute("SELECT id, source_url FROM recipes WHERE source_url IS NOT NULL").fetchall()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO recipe_urls (key, recipe_id) VALUES (?, ?)",
+                [(url_key(src), rid) for rid, src in rows],
+            )
+
+    def _index_recipe(self, conn: sqlite3.Connection, rowid: int, r: Recipe) -> None:
+        conn.execute("DELETE FROM recipe_fts WHERE rowid = ?", (rowid,))
+        conn.execute(
+            "INSERT INTO recipe_fts (rowid, title, ingredients, steps) VALUES (?, ?, ?, ?)",
+            (rowid, *_fts_row(r)),
+        )
+        conn.execute("DELETE FROM ingredient_terms WHERE rid = ?", (rowid,))
+        conn.executemany(
+            "INSERT INTO ingredient_terms (rid, idx, term) VALUES (?, ?, ?)",
+            [(rowid, idx, t) for idx, terms in ingredient_terms(r) for t in set(terms)],
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # En anslutning per tråd; sqlite3 cachar de förberedda satserna per anslutning
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def put_cookbook(self, cb: Cookbook) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cookbooks (id, data) VALUES (?, ?)",
+                (cb.id, cb.model_dump_json()),
+            )
+
+    def get_cookbook(self, cookbook_id: str) -> Optional[Cookbook]:
+        row = self._conn().execute("SELECT data FROM cookbooks WHERE id = ?", (cookbook_id,)).fetchone()
+        return Cookbook.model_validate_json(row[0]) if row else None
+
+    def list_cookbooks(self, after: Optional[str] = None, limit: Optional[int] = None) -> List[Cookbook]:
+        rows = self._conn().execute(
+            "SELECT data FROM cookbooks WHERE id > ? ORDER BY id LIMIT ?",
+            (after or "", -1 if limit is None else limit),
+        ).fetchall()
+        return [Cookbook.model_validate_json(data) for (data,) in rows]
+
+    def put_recipes(self, recipes: List[Recipe], url_keys: Optional[Dict[str, List[str]]] = None) -> None:
+        with self._conn() as conn:
+            for r in recipes:
+                # Upsert behåller rowid, som också är nyckeln i recipe_fts
+                (rowid,) = conn.execute(
+                    "INSERT INTO recipes (id, cookbook_id, source_url, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET cookbook_id = excluded.cookbook_id, "
+                    "source_url = excluded.source_url, data = excluded.data RETURNING rowid",
+                    (r.id, r.cookbook_id, str(r.source_url) if r.source_url else None, r.model_dump_json()),
+                ).fetchone()
+                self._index_recipe(conn, rowid, r)
+                if r.source_url is not None:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO recipe_urls (key, recipe_id) VALUES (?, ?)",
+                        (url_key(str(r.source_url)), r.id),
+                    )
+            if url_keys:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO recipe_urls (key, recipe_id) VALUES (?, ?)",
+                    [(key, rid) for rid, keys in url_keys.items() for key in keys],
+                )
+
+    def get_recipe(self, recipe_id: str) -> Optional[Recipe]:
+        row = self._conn().execute("SELECT data FROM recipes WHERE id = ?", (recipe_id,)).fetchone()
+        return Recipe.model_validate_json(row[0]) if row else None
+
+    def get_recipes(self, recipe_ids: List[str]) -> List[Recipe]:
+        if not recipe_ids:
+            return []
+        rows = self._conn().execute(
+            f"SELECT id, data FROM recipes WHERE id IN ({', '.join('?' * len(recipe_ids))})",
+            recipe_ids,
+        ).fetchall()
+        by_id = dict(rows)
+        return [Recipe.model_validate_json(by_id[i]) for i in recipe_ids if i in by_id]
+
+    def list_recipes(self, cookbook_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[Recipe]:
+        rows = self._conn().execute(
+            "SELECT data FROM recipes WHERE cookbook_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (cookbook_id, after or "", -1 if limit is None else limit),
+        ).fetchall()
+        return [Recipe.model_validate_json(data) for (data,) in rows]
+
+    def list_recipe_stamps(self, cookbook_id: str, after: Optional[str] = None, limit: Optional[int] = None) -> List[Tuple[str, int, datetime]]:
+        # json_extract i SQLite är billigt jämfört med att validera hela receptet
+        rows = self._conn().execute(
+            "SELECT id, json_extract(data, '$.version'), json_extract(data, '$.updated_at') FROM recipes "
+            "WHERE cookbook_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (cookbook_id, after or "", -1 if limit is None else limit),
+        ).fetchall()
+        return [(rid, version, datetime.fromisoformat(updated_at)) for rid, version, updated_at in rows]
+
+    def put_url_keys(self, recipe_id: str, keys: List[str]) -> None:
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO recipe_urls (key, recipe_id) VALUES (?, ?)",
+                [(key, recipe_id) for key in keys],
+            )
+
+    def find_recipes_by_url_key(self, key: str) -> List[Recipe]:
+        rows = self._conn().execute(
+            "SELECT r.data FROM recipe_urls u JOIN recipes r ON r.id = u.recipe_id WHERE u.key = ? ORDER BY r.rowid",
+            (key,),
+        ).fetchall()
+        return [Recipe.model_validate_json(data) for (data,) in rows]
+
+    def search_recipes(self, terms: List[str], cookbook_id: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, float]]:
+        if not terms:
+            return []
+        match = " OR ".join(f'"{t}"' for t in terms)
+        sql = (
+            f"SELECT r.data, -{_FTS_RANK} FROM recipe_fts JOIN recipes r ON r.rowid = recipe_fts.rowid "
+            "WHERE recipe_fts MATCH ?"
+        )
+        args: list = [match]
+        if cookbook_id is not None:
+            sql += " AND r.cookbook_id = ?"
+            args.append(cookbook_id)
+        sql += f" ORDER BY {_FTS_RANK} LIMIT ?"
+        args.append(limit)
+        rows = self._conn().execute(sql, args).fetchall()
+        return [(Recipe.model_validate_json(data), score) for data, score in rows]
+
+    def cover_recipes(self, pantry: List[List[Set[str]]], cookbook_id: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, int, int, List[int]]]:
+        # Varje alternativ är ett snitt över termerna; allt slås ihop med UNION
+        parts: List[str] = []
+        args: list = []
+        for alts in pantry:
+            for terms in alts:
+                inner = " INTERSECT ".join("SELECT rid, idx FROM ingredient_terms WHERE term = ?" for _ in terms)
+                parts.append(f"SELECT rid, idx FROM ({inner})")
+                args.extend(terms)
+        if not parts:
+            return []
+        sql = (
+            f"WITH matched(rid, idx) AS ({' UNION '.join(parts)}) "
+            "SELECT r.data, COUNT(*) AS hit, "
+            "(SELECT COUNT(DISTINCT t.idx) FROM ingredient_terms t WHERE t.rid = m.rid) AS total, "
+            "group_concat(m.idx) "
+            "FROM matched m JOIN recipes r ON r.rowid = m.rid"
+        )
+        if cookbook_id is not None:
+            sql += " WHERE r.cookbook_id = ?"
+            args.append(cookbook_id)
+        sql += " GROUP BY m.rid ORDER BY CAST(hit AS REAL) / total DESC, hit DESC LIMIT ?"
+        args.append(limit)
+        rows = self._conn().execute(sql, args).fetchall()
+        return [
+            (Recipe.model_validate_json(data), hit, total, sorted(int(i) for i in idx.split(",")))
+            for data, hit, total, idx in rows
+        ]
+
+    def add_rating(self, rating: Rating, cookbook_id: str) -> RatingSummary:
+        hist = [int(rating.stars == s) for s in range(1, 6)]
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO ratings (id, recipe_id, data) VALUES (?, ?, ?)",
+                (rating.id, rating.recipe_id, rating.model_dump_json()),
+            )
+            # I DO UPDATE avser kolumnnamnen de gamla värdena, excluded de nya
+            row = conn.execute(
+                "INSERT INTO rating_stats (recipe_id, cookbook_id, n, total, s1, s2, s3, s4, s5, average) "
+                "VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(recipe_id) DO UPDATE SET n = n + 1, total = total + excluded.total, "
+                "s1 = s1 + excluded.s1, s2 = s2 + excluded.s2, s3 = s3 + excluded.s3, "
+                "s4 = s4 + excluded.s4, s5 = s5 + excluded.s5, "
+                "average = CAST(total + excluded.total AS REAL) / (n + 1) "
+                "RETURNING n, total, s1, s2, s3, s4, s5",
+                (rating.recipe_id, cookbook_id, rating.stars, *hist, float(rating.stars)),
+            ).fetchone()
+        return _rating_summary(rating.recipe_id, row)
+
+    def get_rating_summary(self, recipe_id: str) -> RatingSummary:
+        row = self._conn().execute(
+            "SELECT n, total, s1, s2, s3, s4, s5 FROM rating_stats WHERE recipe_id = ?", (recipe_id,),
+        ).fetchone()
+        return _rating_summary(recipe_id, row) if row else RatingSummary(recipe_id=recipe_id)
+
+    def top_rated(self, cookbook_id: str, limit: int = 20, min_count: int = 1) -> List[RatingSummary]:
+        conn = self._conn()
+        # Som i minnet: högst TOP_RATED_SCAN rader i snittordning, annars via antalsindexet
+        rows = conn.execute(
+            "SELECT recipe_id, n, total, s1, s2, s3, s4, s5 FROM ("
+            "SELECT * FROM rating_stats WHERE cookbook_id = ? ORDER BY average DESC, n DESC, recipe_id LIMIT ?"
+            ") WHERE n >= ? ORDER BY average DESC, n DESC, recipe_id LIMIT ?",
+            (cookbook_id, TOP_RATED_SCAN, min_count, limit),
+        ).fetchall()
+        if len(rows) < limit:
+            rows = conn.execute(
+                "SELECT recipe_id, n, total, s1, s2, s3, s4, s5 FROM rating_stats INDEXED BY ix_rating_stats_count "
+                "WHERE cookbook_id = ? AND n >= ? ORDER BY average DESC, n DESC, recipe_id LIMIT ?",
+                (cookbook_id, min_count, limit),
+            ).fetchall()
+        return [_rating_summary(row[0], row[1:]) for row in rows]
+
+    def add_comment(self, comment: Comment) -> int:
+        with self._conn() as conn:
+            (seq,) = conn.execute(
+                "INSERT INTO comments (id, recipe_id, data) VALUES (?, ?, ?) RETURNING seq",
+                (comment.id, comment.recipe_id, comment.model_dump_json()),
+            ).fetchone()
+        return seq
+
+    def list_comments(self, recipe_id: str, before: Optional[int] = None, limit: int = 50) -> List[Tuple[int, Comment]]:
+        rows = self._conn().execute(
+            "SELECT seq, data FROM comments WHERE recipe_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (recipe_id, before if before is not None else _MAX_SEQ, limit),
+        ).fetchall()
+        return [(seq, Comment.model_validate_json(data)) for seq, data in rows]
+
+    def put_request(self, req: Request) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO change_requests (id, recipe_id, status, data) VALUES (?, ?, ?, ?)",
+                (req.id, req.recipe_id, req.status, _request_json(req)),
+            )
+
+    def get_request(self, request_id: str) -> Optional[Request]:
+        row = self._conn().execute("SELECT data FROM change_requests WHERE id = ?", (request_id,)).fetchone()
+        return Request.model_validate_json(row[0]) if row else None
+
+    def list_requests(self, recipe_id: str, status: Optional[str] = None, after: Optional[str] = None, limit: Optional[int] = None) -> List[Request]:
+        sql = "SELECT data FROM change_requests WHERE recipe_id = ? AND id > ?"
+        args: list = [recipe_id, after or ""]
+        if status is not None:
+            sql += " AND status = ?"
+            args.append(status)
+        sql += " ORDER BY id LIMIT ?"
+        args.append(-1 if limit is None else limit)
+        return [Request.model_validate_json(data) for (data,) in self._conn().execute(sql, args).fetchall()]
+
+    def close_request(self, req: Request) -> bool:
+        with self._conn() as conn:
+            return self._close_request(conn, req)
+
+    def _close_request(self, conn: sqlite3.Connection, req: Request) -> bool:
+        cur = conn.execute(
+            "UPDATE change_requests SET status = ?, data = ? WHERE id = ? AND status = 'open'",
+            (req.status, _request_json(req), req.id),
+        )
+        return cur.rowcount == 1
+
+    def update_recipe(self, recipe: Recipe, expected_version: int, revision: RecipeRevision, request: Optional[Request] = None) -> bool:
+        with self._conn() as conn:
+            # Förslaget stängs i samma transaktion som receptet skrivs; misslyckas något rullas allt tillbaka
+            if request is not None and not self._close_request(conn, request):
+                return False
+            row = conn.execute(
+                "UPDATE recipes SET source_url = ?, data = ? WHERE id = ? AND json_extract(data, '$.version') = ? RETURNING rowid",
+                (str(recipe.source_url) if recipe.source_url else None, recipe.model_dump_json(), recipe.id, expected_version),
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return False
+            self._index_recipe(conn, row[0], recipe)
+            conn.execute(
+                "INSERT INTO recipe_revisions (recipe_id, version, data) VALUES (?, ?, ?)",
+                (revision.recipe_id, revision.version, revision.model_dump_json()),
+            )
+        return True
+
+    def list_revisions(self, recipe_id: str, from_version: int, limit: int) -> List[RecipeRevision]:
+        rows = self._conn().execute(
+            "SELECT data FROM recipe_revisions WHERE recipe_id = ? AND version >= ? ORDER BY version LIMIT ?",
+            (recipe_id, from_version, limit),
+        ).fetchall()
+        return [RecipeRevision.model_validate_json(data) for (data,) in rows]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+def _fts_row(r: Recipe) -> Tuple[str, str, str]:
+    f = recipe_fields(r)
+    return " ".join(f["title"]), " ".join(f["ingredients"]), " ".join(f["steps"])
+
+_MAX_SEQ = 2 ** 63 - 1
+
+def _request_json(req: Request) -> str:
+    # Bara fälten förslaget faktiskt sätter sparas, så att None inte tolkas som "töm fältet"
+    data = req.model_dump(mode="json")
+    data["changes"] = req.changes.model_dump(mode="json", exclude_unset=True)
+    return json.dumps(data, ensure_ascii=False)
+
+def _rating_summary(recipe_id: str, row: Tuple[int, ...]) -> RatingSummary:
+    n, total, *hist = row
+    return RatingSummary(recipe_id=recipe_id, count=n, average=total / n if n else None, histogram=hist)
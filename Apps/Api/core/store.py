@@ -1,6 +1,30 @@
-from typing import Dict, List
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
-from Apps.Api.schemas.models import Cookbook, CookbookCreate, Recipe, RecipeBase
+from pydantic import ValidationError
+from Apps.Api.core.metrics import REGISTRY, timed_stage
+from Apps.Api.schemas.models import (
+    Comment, CommentCreate, Cookbook, CookbookCreate, Rating, RatingCreate, RatingSummary, Recipe, RecipeBase,
+    RecipeRevision, Request, RequestChange, RequestCreate,
+)
+from Apps.Api.core.diffs import apply_patch, diff
+from Apps.Api.core.storage import InMemoryStorage, SqliteStorage, StorageBackend
+from Apps.Api.core.search import analyze_query
+from Apps.Api.core.ingredient_index import pantry_term_sets
+from Apps.Api.core.urls import url_key
+
+RECIPES_REUSED = REGISTRY.counter("recipeer_import_reused_total", "URL imports answered with an existing recipe in the same cookbook")
+RECIPES_CLONED = REGISTRY.counter("recipeer_import_cloned_total", "URL imports cloned from another cookbook without fetching")
+REQUEST_CONFLICTS = REGISTRY.counter("recipeer_request_conflicts_total", "Change request accepts rejected by the version check")
+
+# Var N:e revision sparas hel, så att en gammal version aldrig kräver fler än N diffar
+SNAPSHOT_EVERY = int(os.getenv("RECIPEER_SNAPSHOT_EVERY", "16"))
+
+class ConflictError(Exception):
+    pass
+
+class InvalidChangeError(Exception):
+    pass
 
 class Store: 
     _instance = None
@@ -8,32 +32,313 @@ class Store:
     @classmethod
     def instance(cls): 
         if cls._instance is None: 
-            cls._instance = Store()
+            db_path = os.getenv("RECIPEER_DB_PATH")
+            cls._instance = Store(SqliteStorage(db_path) if db_path else None)
         return cls._instance
     
-    def __init__(self):
-        self.cookbooks: Dict[str, Cookbook] = {}
-        self.recipes: Dict[str, Recipe] = {}
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend: StorageBackend = backend or InMemoryStorage()
 
     #region Cookbooks
 
     def create_cookbook(self, payload: CookbookCreate) -> Cookbook:
         cb = Cookbook(name=payload.name, is_premium=payload.is_premium)
-        self.cookbooks[cb.id] = cb
+        self.backend.put_cookbook(cb)
         return cb
-    
-    def list_cookbooks(self) -> List[Cookbook]:
-        return list(self.cookbooks.values())
+
+    def get_cookbook(self, cookbook_id: str) -> Optional[Cookbook]:
+        return self.backend.get_cookbook(cookbook_id)
+
+    def list_cookbooks(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Cookbook], Optional[str]]:
+        items = self.backend.list_cookbooks(after=cursor, limit=limit + 1)
+        return _paginate(items, limit)
     
     #endregion
 
     #region Recipes
 
     def add_recipe(self, cookbook_id: str, data: RecipeBase) -> Recipe:
-        if cookbook_id not in self.cookbooks: 
+        return self.add_recipes(cookbook_id, [data])[0]
+
+    @timed_stage("store_add_recipe")
+    def add_recipes(self, cookbook_id: str, items: List[RecipeBase]) -> List[Recipe]:
+        if self.backend.get_cookbook(cookbook_id) is None: 
+            raise ValueError("Cookbook not found")
+        created = [Recipe(cookbook_id=cookbook_id, **data.model_dump()) for data in items]
+        self.backend.put_recipes(created)
+        return created
+
+    def get_recipe(self, recipe_id: str) -> Optional[Recipe]:
+        return self.backend.get_recipe(recipe_id)
+
+    def list_recipes(self, cookbook_id: str, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Recipe], Optional[str]]:
+        if self.backend.get_cookbook(cookbook_id) is None: 
+            raise ValueError("Cookbook not found")
+        items = self.backend.list_recipes(cookbook_id, after=cursor, limit=limit + 1)
+        return _paginate(items, limit)
+
+    def get_recipes(self, recipe_ids: List[str]) -> List[Recipe]:
+        return self.backend.get_recipes(recipe_ids)
+
+    def list_recipe_stamps(self, cookbook_id: str, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Tuple[str, int, datetime]], Optional[str]]:
+        # Som list_recipes men bara (id, version, updated_at), för ETag och JSON-cache
+        if self.backend.get_cookbook(cookbook_id) is None:
+            raise ValueError("Cookbook not found")
+        stamps = self.backend.list_recipe_stamps(cookbook_id, after=cursor, limit=limit + 1)
+        if len(stamps) > limit:
+            stamps = stamps[:limit]
+            return stamps, stamps[-1][0]
+        return stamps, None
+
+    def iter_recipes(self, cookbook_id: str, chunk: int = 500) -> Iterator[Recipe]:
+        # Sida för sida via markören, så att bara en sida i taget finns i minnet
+        if self.backend.get_cookbook(cookbook_id) is None:
+            raise ValueError("Cookbook not found")
+        after: Optional[str] = None
+        while True:
+            page = self.backend.list_recipes(cookbook_id, after=after, limit=chunk)
+            yield from page
+            if len(page) < chunk:
+                return
+            after = page[-1].id
+
+    def find_imported(self, cookbook_id: str, urls: List[str]) -> Optional[Recipe]:
+        return self.find_imported_many(cookbook_id, [urls])[0]
+
+    def find_imported_many(self, cookbook_id: str, url_lists: List[List[str]]) -> List[Optional[Recipe]]:
+        # Redan importerat till samma kokbok: samma recept tillbaka. Finns det i en
+        # annan kokbok klonas den redan parsade datan, utan nätverk.
+        return self._import_many(cookbook_id, [(None, urls) for urls in url_lists])
+
+    def _lookup_imported(self, cookbook_id: str, keys: List[str]) -> Tuple[Optional[Recipe], Optional[RecipeBase]]:
+        # (receptet i kokboken, eller datan att klona från en annan kokbok)
+        for key in keys:
+            found = self.backend.find_recipes_by_url_key(key)
+            if not found:
+                continue
+            # Ett alias kan sakna kokbokens egen kopia; den hittas via originalets kanoniska adress
+            direct = len(found)
+            src = found[0].source_url
+            if src is not None and url_key(str(src)) != key:
+                found += self.backend.find_recipes_by_url_key(url_key(str(src)))
+            for i, r in enumerate(found):
+                if r.cookbook_id == cookbook_id:
+                    RECIPES_REUSED.inc()
+                    if i >= direct:
+                        self.backend.put_url_keys(r.id, keys)
+                    return r, None
+            RECIPES_CLONED.inc()
+            return None, RecipeBase(**found[0].model_dump(include=set(RecipeBase.model_fields)))
+        return None, None
+
+    def add_imported(self, cookbook_id: str, data: RecipeBase, urls: List[str]) -> Recipe:
+        return self.add_imported_many(cookbook_id, [(data, urls)])[0]
+
+    def add_imported_many(self, cookbook_id: str, items: List[Tuple[RecipeBase, List[str]]]) -> List[Recipe]:
+        return self._import_many(cookbook_id, items)
+
+    @timed_stage("store_add_recipe")
+    def _import_many(self, cookbook_id: str, items: List[Tuple[Optional[RecipeBase], List[str]]]) -> List[Optional[Recipe]]:
+        # Alla nya recept och kloner i batchen skrivs med ett put_recipes, URL-nycklarna i
+        # samma transaktion. Poster som delar URL-nyckel blir ett och samma recept.
+        # Utan data (None) slås posten bara upp: befintligt recept, klon eller None.
+        if self.backend.get_cookbook(cookbook_id) is None:
+            raise ValueError("Cookbook not found")
+        out: List[Optional[Recipe]] = []
+        created: List[Recipe] = []
+        created_keys: Dict[str, List[str]] = {}
+        pending: Dict[str, Recipe] = {}
+        for data, urls in items:
+            # Den kanoniska adressen kan peka ut ett recept som importerats under en annan URL
+            keys = _url_keys([str(data.source_url), *urls] if data is not None and data.source_url else urls)
+            recipe = next((pending[k] for k in keys if k in pending), None)
+            if recipe is None:
+                existing, clone = self._lookup_imported(cookbook_id, keys)
+                if existing is not None or (clone or data) is None:
+                    out.append(existing)
+                    continue
+                recipe = Recipe(cookbook_id=cookbook_id, **(clone or data).model_dump())
+                created.append(recipe)
+                created_keys[recipe.id] = []
+            for k in keys:
+                pending.setdefault(k, recipe)
+                if k not in created_keys[recipe.id]:
+                    created_keys[recipe.id].append(k)
+            out.append(recipe)
+        if created:
+            self.backend.put_recipes(created, url_keys=created_keys)
+        return out
+
+    def search_recipes(self, q: str, cookbook_id: Optional[str] = None, lang: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, float]]:
+        return self.backend.search_recipes(analyze_query(q, lang), cookbook_id=cookbook_id, limit=limit)
+
+    def recipes_by_ingredients(self, have: List[str], cookbook_id: Optional[str] = None, lang: Optional[str] = None, limit: int = 20) -> List[Tuple[Recipe, int, int, List[int]]]:
+        return self.backend.cover_recipes(pantry_term_sets(have, lang), cookbook_id=cookbook_id, limit=limit)
+
+    #endregion
+
+    #region Ratings and comments
+
+    def _cookbook_of(self, recipe_id: str) -> str:
+        recipe = self.backend.get_recipe(recipe_id)
+        if recipe is None:
+            raise ValueError("Recipe not found")
+        return recipe.cookbook_id
+
+    def rate_recipe(self, recipe_id: str, payload: RatingCreate) -> Tuple[Rating, RatingSummary]:
+        cookbook_id = self._cookbook_of(recipe_id)
+        rating = Rating(recipe_id=recipe_id, stars=payload.stars, note=payload.note)
+        return rating, self.backend.add_rating(rating, cookbook_id)
+
+    def rating_summary(self, recipe_id: str) -> RatingSummary:
+        self._cookbook_of(recipe_id)
+        return self.backend.get_rating_summary(recipe_id)
+
+    def top_rated(self, cookbook_id: str, limit: int = 20, min_count: int = 1) -> List[Tuple[Recipe, RatingSummary]]:
+        # Aggregaten är redan sorterade per kokbok; bara de limit första recepten läses
+        if self.backend.get_cookbook(cookbook_id) is None:
             raise ValueError("Cookbook not found")
-        r = Recipe(cookbook_id=cookbook_id, **data.model_dump())
-        self.recipes[r.id] = r
-        return r
+        summaries = self.backend.top_rated(cookbook_id, limit=limit, min_count=min_count)
+        recipes = {r.id: r for r in self.backend.get_recipes([s.recipe_id for s in summaries])}
+        return [(recipes[s.recipe_id], s) for s in summaries if s.recipe_id in recipes]
+
+    def add_comment(self, recipe_id: str, payload: CommentCreate) -> Comment:
+        self._cookbook_of(recipe_id)
+        comment = Comment(recipe_id=recipe_id, text=payload.text)
+        self.backend.add_comment(comment)
+        return comment
+
+    def list_comments(self, recipe_id: str, cursor: Optional[int] = None, limit: int = 50) -> Tuple[List[Comment], Optional[str]]:
+        self._cookbook_of(recipe_id)
+        rows = self.backend.list_comments(recipe_id, before=cursor, limit=limit + 1)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return [c for _, c in rows], str(rows[-1][0])
+        return [c for _, c in rows], None
 
     #endregion
+
+    #region Change requests
+
+    def open_request(self, recipe_id: str, payload: RequestCreate) -> Request:
+        recipe = self.backend.get_recipe(recipe_id)
+        if recipe is None:
+            raise ValueError("Recipe not found")
+        req = Request(recipe_id=recipe_id, message=payload.message, changes=payload.changes, base_version=recipe.version)
+        self.backend.put_request(req)
+        return req
+
+    def get_request(self, request_id: str) -> Optional[Request]:
+        return self.backend.get_request(request_id)
+
+    def list_requests(self, recipe_id: str, status: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Request], Optional[str]]:
+        if self.backend.get_recipe(recipe_id) is None:
+            raise ValueError("Recipe not found")
+        items = self.backend.list_requests(recipe_id, status=status, after=cursor, limit=limit + 1)
+        return _paginate(items, limit)
+
+    def accept_request(self, request_id: str, expected_version: Optional[int] = None) -> Recipe:
+        req = self._open_request(request_id)
+        current = self.backend.get_recipe(req.recipe_id)
+        if current is None:
+            raise ValueError("Recipe not found")
+        expected = expected_version if expected_version is not None else req.base_version
+        if current.version != expected:
+            REQUEST_CONFLICTS.inc()
+            raise ConflictError(f"Recipe is at version {current.version}, expected {expected}")
+
+        # Validering före skrivning: ett ogiltigt förslag får aldrig nå lagret
+        try:
+            updated = Recipe.model_validate({
+                **current.model_dump(),
+                **_set_changes(req.changes),
+                "version": current.version + 1,
+                "updated_at": datetime.utcnow(),
+            })
+        except ValidationError as e:
+            err = e.errors(include_url=False)[0]
+            field = ".".join(str(p) for p in err["loc"])
+            raise InvalidChangeError(f"Request would make the recipe invalid: {field}: {err['msg']}") from None
+        old, new = _content(current), _content(updated)
+        revision = RecipeRevision(
+            recipe_id=current.id,
+            version=current.version,
+            updated_at=current.updated_at,
+            request_id=req.id,
+            patch=diff(new, old),
+            snapshot=old if current.version % SNAPSHOT_EVERY == 0 else None,
+        )
+        req.status = "accepted"
+        req.updated_at = datetime.utcnow()
+        # Versionen och förslagets status kontrolleras igen atomärt i lagret, och receptet
+        # och förslaget skrivs tillsammans; förlorar vi racet ändras ingenting
+        if not self.backend.update_recipe(updated, current.version, revision, request=req):
+            REQUEST_CONFLICTS.inc()
+            # Stängt av ett parallellt anrop ger det felet; annars var det versionen
+            self._open_request(request_id)
+            raise ConflictError("Recipe was changed concurrently")
+        return updated
+
+    def reject_request(self, request_id: str) -> Request:
+        req = self._open_request(request_id)
+        req.status = "rejected"
+        req.updated_at = datetime.utcnow()
+        if not self.backend.close_request(req):
+            # Godkänt eller avslaget sedan vi läste det
+            self._open_request(request_id)
+            raise ConflictError("Request was closed concurrently")
+        return req
+
+    def _open_request(self, request_id: str) -> Request:
+        req = self.backend.get_request(request_id)
+        if req is None:
+            raise ValueError("Request not found")
+        if req.status != "open":
+            raise ConflictError(f"Request is already {req.status}")
+        return req
+
+    def recipe_version(self, recipe_id: str, version: int) -> Recipe:
+        head = self.backend.get_recipe(recipe_id)
+        if head is None:
+            raise ValueError("Recipe not found")
+        if version == head.version:
+            return head
+        if not 1 <= version < head.version:
+            raise ValueError("Version not found")
+        # Inom SNAPSHOT_EVERY revisioner finns antingen en hel kopia eller huvudversionen
+        revs = self.backend.list_revisions(recipe_id, from_version=version, limit=SNAPSHOT_EVERY)
+        if not revs or revs[0].version != version:
+            raise ValueError("Version not found")
+        start = next((i for i, rev in enumerate(revs) if rev.snapshot is not None), None)
+        if start is not None:
+            state, chain = revs[start].snapshot, revs[:start]
+        else:
+            state, chain = _content(head), revs
+        for rev in reversed(chain):
+            state = apply_patch(state, rev.patch)
+        return Recipe(
+            **state,
+            id=head.id,
+            cookbook_id=head.cookbook_id,
+            version=version,
+            created_at=head.created_at,
+            updated_at=revs[0].updated_at,
+        )
+
+    #endregion
+
+def _set_changes(changes: RequestChange) -> dict:
+    return {name: getattr(changes, name) for name in changes.model_fields_set}
+
+def _content(r: Recipe) -> dict:
+    return r.model_dump(mode="json", include=set(RecipeBase.model_fields))
+
+def _url_keys(urls: List[str]) -> List[str]:
+    return list(dict.fromkeys(url_key(u) for u in urls if u))
+
+def _paginate(items: list, limit: int) -> tuple:
+    # Vi hämtar limit + 1 för att veta om det finns en nästa sida
+    if len(items) > limit:
+        items = items[:limit]
+        return items, items[-1].id
+    return items, None
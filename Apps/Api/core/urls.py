@@ -0,0 +1,63 @@
+from __future__ import annotations
+import re
+from typing import Any, Optional
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urljoin, urlsplit
+
+# Spårningsparametrar som aldrig ändrar vilket recept sidan visar
+TRACKING_PARAMS = frozenset({
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "igshid", "twclid", "ttclid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "ref", "ref_src", "spm", "si",
+})
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_", "vero_")
+
+# Samma sajt även om kanonisk länk och begärd URL skiljer sig i de här prefixen
+_SITE_PREFIXES = ("www.", "m.", "amp.")
+_SLASHES_RE = re.compile(r"/{2,}")
+_PATH_SAFE = "/:@!$&'()*+,;=-._~"
+
+def _is_tracking(param: str) -> bool:
+    p = param.lower()
+    return p in TRACKING_PARAMS or p.startswith(TRACKING_PREFIXES)
+
+def _host(parts) -> str:
+    host = (parts.hostname or "").lower().rstrip(".")
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    return host
+
+def site_of(url: str) -> str:
+    host = _host(urlsplit(url.strip()))
+    for prefix in _SITE_PREFIXES:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+def url_key(url: str) -> str:
+    # Dedupliceringsnyckel, ingen hämtbar URL: utan schema, www, fragment,
+    # avslutande snedstreck och spårningsparametrar, med sorterad query
+    parts = urlsplit(url.strip())
+    path = quote(unquote(_SLASHES_RE.sub("/", parts.path)), safe=_PATH_SAFE).rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(k))
+    return site_of(url) + path + ("?" + urlencode(query) if query else "")
+
+def _absolute(base: str, href: Any) -> Optional[str]:
+    if isinstance(href, dict):
+        href = href.get("@id") or href.get("url")
+    if not isinstance(href, str) or not href.strip():
+        return None
+    out = urljoin(base, href.strip())
+    return out if urlsplit(out).scheme in ("http", "https") else None
+
+def canonical_source(url: str, link_canonical: Any = None, jsonld_url: Any = None) -> str:
+    # Sidans egen kanoniska adress vinner, men bara inom samma sajt: en sida
+    # får inte kunna peka ut ett annat receptsajts URL som sin
+    site = site_of(url)
+    for cand in (link_canonical, jsonld_url):
+        out = _absolute(url, cand)
+        if out and site_of(out) == site:
+            return out
+    return url
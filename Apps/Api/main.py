@@ -1,42 +1,185 @@
-from fastapi import FastAPI, HTTPException, Depends
-import requests
+import time
+from contextlib import asynccontextmanager
+
+from typing import Optional
+
+# Starttiden räknas från här; interpreterns egen uppstart ingår inte
+_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi import Request as HttpRequest
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from Apps.Api.schemas.models import CookbookCreate, Cookbook, RecipeBase, Recipe
-from Apps.Api.core.store import Store
-from Apps.Api.services.parsers import extract_recipe_from_url
+from Apps.Api.schemas.models import (
+    CookbookCreate, Cookbook, CookbookPage, RecipeBase, Recipe, RecipePage,
+    SearchResults, CoverageHit, CoverageResults, RecipeImportBatch, RecipeImportBatchResult, RecipeImportError, RecipeImportResult,
+    ImportJob, ShoppingList, ShoppingListRequest,
+    Comment, CommentCreate, CommentPage, RatingCreate, RatingSummary, TopRatedHit, TopRatedResults,
+    Request, RequestAccept, RequestCreate, RequestPage, CookbookImportResult,
+)
+from Apps.Api.core.store import ConflictError, InvalidChangeError, Store
+from Apps.Api.core.ingredient_index import ingredient_terms
+from Apps.Api.core.metrics import REGISTRY
+from Apps.Api.core.instrumentation import RequestMetricsMiddleware
+from Apps.Api.core.serialization import (
+    dumps, etag_for, etag_matches, model_json, page_json, recipe_json, recipes_json,
+)
+from Apps.Api.services import http_client, jobs, parse_pool, warmup
+from Apps.Api.services.importer import (
+    IMPORT_MAX_URLS, InvalidUrlError, import_error_status, import_recipe, import_recipes, normalize_import_url,
+)
+from Apps.Api.services.shopping import build_shopping_list
+from Apps.Api.services.transfer import BadGzip, LineTooLong, import_ndjson, iter_export
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Regeldata laddas och valideras innan första requesten; parserstacken bara med RECIPEER_PRELOAD_PARSERS
+    warmup.warm()
+    # Köade importjobb från förra körningen plockas upp direkt
+    jobs.start()
+    warmup.started(_STARTED)
+    yield
+    await jobs.stop()
+    http_client.close()
+    parse_pool.close()
 
-app = FastAPI(title="Recipeer API", version="0.0.1")
+app = FastAPI(title="Recipeer API", version="0.0.1", lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
 
 def get_store(): 
     return Store.instance()
 
+def json_bytes(body: bytes, etag: Optional[str] = None, if_none_match: Optional[str] = None) -> Response:
+    # Färdigserialiserade bytes: ingen ny validering mot response_model, som bara styr OpenAPI
+    if etag is None:
+        return Response(body, media_type="application/json")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
 @app.get("/health")
 def health(): 
     return {"ok": True}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 class RecipeCreateUrl(BaseModel): 
     url: str
 
-@app.post("/cookbooks/{cookbook_id}/recipes:url", response_model=Recipe)
-def add_recipe_via_url(cookbook_id: str, payload: RecipeCreateUrl, store: Store = Depends(get_store)):
+@app.post("/cookbooks/{cookbook_id}/recipes:url", response_model=Recipe, responses={202: {"model": ImportJob}})
+async def add_recipe_via_url(
+    cookbook_id: str,
+    payload: RecipeCreateUrl,
+    run_async: bool = Query(False, alias="async"),
+    store: Store = Depends(get_store),
+):
+    if run_async:
+        if store.get_cookbook(cookbook_id) is None:
+            raise HTTPException(status_code=404, detail="Cookbook not found")
+        try:
+            url = normalize_import_url(payload.url)
+        except InvalidUrlError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        job = await jobs.submit(cookbook_id, url)
+        return JSONResponse(status_code=202, content=job.model_dump(mode="json"), headers={"Location": f"/jobs/{job.id}"})
+    # Importeras här och inte överst: requests ska inte laddas vid start
+    import requests
     try: 
-        data = extract_recipe_from_url(payload.url)
-        return store.add_recipe(cookbook_id, data)
-    except requests.HTTPError as e:
-        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
-    except requests.RequestException as e:
-        raise HTTPException(status_code=504, detail=f"Failed to fetch URL: {e}")
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        return await import_recipe(store, cookbook_id, payload.url)
+    except (requests.RequestException, ValueError) as e:
+        code, detail = import_error_status(e)
+        raise HTTPException(status_code=code, detail=detail)
+
+@app.post("/cookbooks/{cookbook_id}/recipes:batch", response_model=RecipeImportBatchResult)
+async def add_recipes_via_urls(cookbook_id: str, payload: RecipeImportBatch, store: Store = Depends(get_store)):
+    if store.get_cookbook(cookbook_id) is None:
+        raise HTTPException(status_code=404, detail="Cookbook not found")
+    if len(payload.urls) > IMPORT_MAX_URLS:
+        raise HTTPException(status_code=413, detail=f"At most {IMPORT_MAX_URLS} URLs per batch")
+
+    imported = await import_recipes(store, cookbook_id, payload.urls)
+    results: list[RecipeImportResult] = []
+    for url, res in zip(payload.urls, imported):
+        if isinstance(res, Recipe):
+            results.append(RecipeImportResult(url=url, recipe=res))
+        else:
+            code, detail = import_error_status(res)
+            results.append(RecipeImportResult(url=url, error=RecipeImportError(status_code=code, detail=detail)))
+    created = sum(1 for r in results if r.recipe is not None)
+    return RecipeImportBatchResult(created=created, failed=len(results) - created, results=results)
+
+@app.get("/jobs/{job_id}", response_model=ImportJob)
+def get_import_job(job_id: str, store: Store = Depends(get_store)):
+    job = jobs.get_job(job_id, store)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.post("/cookbooks", response_model=Cookbook)
 def create_cookbook(payload: CookbookCreate, store: Store = Depends(get_store)):
     return store.create_cookbook(payload)
 
-@app.get("/cookbooks", response_model=list[Cookbook])
-def list_cookbooks(store: Store = Depends(get_store)):
-    return store.list_cookbooks()
+@app.get("/cookbooks", response_model=CookbookPage)
+def list_cookbooks(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    if_none_match: Optional[str] = Header(None),
+    store: Store = Depends(get_store),
+):
+    items, next_cursor = store.list_cookbooks(cursor=cursor, limit=limit)
+    # Kokböcker saknar version, så ETag:en är en hash av själva svaret
+    body = page_json([model_json(cb) for cb in items], next_cursor)
+    return json_bytes(body, etag_for([body]), if_none_match)
+
+@app.get("/cookbooks/{cookbook_id}/recipes", response_model=RecipePage)
+def list_recipes(
+    cookbook_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    if_none_match: Optional[str] = Header(None),
+    store: Store = Depends(get_store),
+):
+    try:
+        stamps, next_cursor = store.list_recipe_stamps(cookbook_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # ETag ur (id, version, updated_at): en oförändrad sida ger 304 utan att ett enda recept läses
+    etag = etag_for([*stamps, next_cursor])
+    if etag_matches(if_none_match, etag):
+        return json_bytes(b"", etag, if_none_match)
+    return json_bytes(page_json(recipes_json(stamps, store.get_recipes), next_cursor), etag)
+
+@app.get("/search", response_model=SearchResults)
+def search(
+    q: str = Query(..., min_length=1),
+    cookbook_id: Optional[str] = None,
+    lang: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    store: Store = Depends(get_store),
+):
+    hits = store.search_recipes(q, cookbook_id=cookbook_id, lang=lang, limit=limit)
+    items = b",".join(b'{"recipe":' + recipe_json(r) + b',"score":' + dumps(score) + b"}" for r, score in hits)
+    return json_bytes(b'{"items":[' + items + b"]}")
+
+@app.get("/search/by-ingredients", response_model=CoverageResults)
+def search_by_ingredients(
+    have: list[str] = Query(..., min_length=1),
+    cookbook_id: Optional[str] = None,
+    lang: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    store: Store = Depends(get_store),
+):
+    hits = store.recipes_by_ingredients(have, cookbook_id=cookbook_id, lang=lang, limit=limit)
+    items = []
+    for r, matched, total, idx in hits:
+        got = set(idx)
+        # Samma positioner som total räknas över: ingredienser utan sökbara termer är varken träff eller saknade
+        missing = [r.ingredients[i].name for i, _ in ingredient_terms(r) if i not in got]
+        items.append(CoverageHit(recipe=r, coverage=matched / total, matched=matched, total=total, missing=missing))
+    return CoverageResults(items=items)
 
 @app.post("/cookbooks/{cookbook_id}/recipes", response_model=Recipe)
 def add_recipe(cookbook_id: str, payload: RecipeBase, store: Store = Depends(get_store)):
@@ -45,3 +188,128 @@ def add_recipe(cookbook_id: str, payload: RecipeBase, store: Store = Depends(get
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@app.post("/shopping-list", response_model=ShoppingList)
+def shopping_list(payload: ShoppingListRequest, store: Store = Depends(get_store)):
+    try:
+        return build_shopping_list(store, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/recipes/{recipe_id}/ratings", response_model=RatingSummary)
+def rate_recipe(recipe_id: str, payload: RatingCreate, store: Store = Depends(get_store)):
+    try:
+        _, summary = store.rate_recipe(recipe_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return summary
+
+@app.get("/recipes/{recipe_id}/ratings", response_model=RatingSummary)
+def get_rating_summary(recipe_id: str, store: Store = Depends(get_store)):
+    try:
+        return store.rating_summary(recipe_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/recipes/{recipe_id}/comments", response_model=Comment)
+def add_comment(recipe_id: str, payload: CommentCreate, store: Store = Depends(get_store)):
+    try:
+        return store.add_comment(recipe_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/recipes/{recipe_id}/comments", response_model=CommentPage)
+def list_comments(
+    recipe_id: str,
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    store: Store = Depends(get_store),
+):
+    try:
+        items, next_cursor = store.list_comments(recipe_id, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return CommentPage(items=items, next_cursor=next_cursor)
+
+@app.get("/cookbooks/{cookbook_id}/top-rated", response_model=TopRatedResults)
+def top_rated(
+    cookbook_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    min_count: int = Query(1, ge=1),
+    store: Store = Depends(get_store),
+):
+    try:
+        hits = store.top_rated(cookbook_id, limit=limit, min_count=min_count)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return TopRatedResults(items=[TopRatedHit(recipe=r, rating=s) for r, s in hits])
+
+@app.post("/recipes/{recipe_id}/requests", response_model=Request)
+def open_change_request(recipe_id: str, payload: RequestCreate, store: Store = Depends(get_store)):
+    try:
+        return store.open_request(recipe_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/recipes/{recipe_id}/requests", response_model=RequestPage)
+def list_change_requests(
+    recipe_id: str,
+    status: Optional[str] = Query(None, pattern="^(open|accepted|rejected)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    store: Store = Depends(get_store),
+):
+    try:
+        items, next_cursor = store.list_requests(recipe_id, status=status, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return RequestPage(items=items, next_cursor=next_cursor)
+
+@app.post("/requests/{request_id}/accept", response_model=Recipe)
+def accept_change_request(request_id: str, payload: Optional[RequestAccept] = None, store: Store = Depends(get_store)):
+    try:
+        return store.accept_request(request_id, expected_version=payload.version if payload else None)
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except InvalidChangeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/requests/{request_id}/reject", response_model=Request)
+def reject_change_request(request_id: str, store: Store = Depends(get_store)):
+    try:
+        return store.reject_request(request_id)
+    except ConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/recipes/{recipe_id}/versions/{version}", response_model=Recipe)
+def get_recipe_version(recipe_id: str, version: int, store: Store = Depends(get_store)):
+    try:
+        return store.recipe_version(recipe_id, version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/cookbooks/{cookbook_id}/export")
+def export_cookbook(cookbook_id: str, gzip: bool = False, store: Store = Depends(get_store)):
+    if store.get_cookbook(cookbook_id) is None:
+        raise HTTPException(status_code=404, detail="Cookbook not found")
+    name = f"cookbook-{cookbook_id}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iter_export(store, cookbook_id, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+@app.post("/cookbooks/{cookbook_id}/import", response_model=CookbookImportResult)
+async def import_cookbook(cookbook_id: str, request: HttpRequest, store: Store = Depends(get_store)):
+    # Kroppen läses som ström: NDJSON, eller gzip-komprimerad NDJSON
+    try:
+        return await import_ndjson(store, cookbook_id, request.stream())
+    except LineTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BadGzip as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
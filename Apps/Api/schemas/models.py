@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, HttpUrl
-from typing import Optional, List
+from pydantic import BaseModel, Field, HttpUrl, field_validator
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 import uuid
 
@@ -25,6 +25,7 @@ class RecipeBase(BaseModel):
     total_time: Optional[str] = None
     source_url: Optional[HttpUrl] = None
     images: List[str] = Field(default_factory=list)
+    language: Optional[str] = None
 
 class Recipe(RecipeBase): 
     id: str=Field(default_factory=gen_id)
@@ -33,6 +34,45 @@ class Recipe(RecipeBase):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class RecipeImportBatch(BaseModel):
+    urls: List[str] = Field(min_length=1)
+
+class RecipeImportError(BaseModel):
+    status_code: int
+    detail: str
+
+class RecipeImportResult(BaseModel):
+    url: str
+    recipe: Optional[Recipe] = None
+    error: Optional[RecipeImportError] = None
+
+class RecipeImportBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[RecipeImportResult]
+
+class CookbookImportLineError(BaseModel):
+    line: int
+    detail: str
+
+class CookbookImportResult(BaseModel):
+    imported: int
+    failed: int
+    errors: List[CookbookImportLineError] = Field(default_factory=list)
+
+class ImportJob(BaseModel):
+    id: str = Field(default_factory=gen_id)
+    cookbook_id: str
+    url: str
+    status: str = "queued"
+    attempts: int = 0
+    next_attempt_at: Optional[datetime] = None
+    recipe_id: Optional[str] = None
+    recipe: Optional[Recipe] = None
+    error: Optional[RecipeImportError] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class CookbookCreate(BaseModel):
     name: str
     is_premium: bool = False
@@ -43,6 +83,50 @@ class Cookbook(BaseModel):
     is_premium: bool = False
     member_ids: List[str] = Field(default_factory=list)
 
+class CookbookPage(BaseModel):
+    items: List[Cookbook]
+    next_cursor: Optional[str] = None
+
+class RecipePage(BaseModel):
+    items: List[Recipe]
+    next_cursor: Optional[str] = None
+
+class SearchHit(BaseModel):
+    recipe: Recipe
+    score: float
+
+class SearchResults(BaseModel):
+    items: List[SearchHit]
+
+class CoverageHit(BaseModel):
+    recipe: Recipe
+    coverage: float
+    matched: int
+    total: int
+    missing: List[str] = Field(default_factory=list)
+
+class CoverageResults(BaseModel):
+    items: List[CoverageHit]
+
+class ShoppingListItem(BaseModel):
+    recipe_id: str
+    servings: Optional[float] = Field(default=None, gt=0)
+    scale: Optional[float] = Field(default=None, gt=0)
+
+class ShoppingListRequest(BaseModel):
+    items: List[ShoppingListItem] = Field(min_length=1)
+    servings: Optional[float] = Field(default=None, gt=0)
+
+class ShoppingListEntry(BaseModel):
+    name: str
+    quantity: Optional[float] = None
+    quantity_max: Optional[float] = None
+    unit: Optional[str] = None
+    recipe_ids: List[str] = Field(default_factory=list)
+
+class ShoppingList(BaseModel):
+    items: List[ShoppingListEntry]
+
 class RequestChange(BaseModel): 
     title: Optional[str] = None
     description: Optional[str] = None
@@ -57,9 +141,41 @@ class Request(BaseModel):
     message: str
     changes: RequestChange
     status: str = "open"
+    # Receptversionen förslaget skrevs mot; accept kräver att den fortfarande gäller
+    base_version: int = 1
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class RequestCreate(BaseModel):
+    message: str
+    changes: RequestChange
+
+    @field_validator("changes")
+    @classmethod
+    def _no_null_required(cls, v: RequestChange) -> RequestChange:
+        # null i ett obligatoriskt receptfält skulle ge ett recept som inte går att läsa
+        nulls = sorted(f for f in ("title", "ingredients", "steps") if f in v.model_fields_set and getattr(v, f) is None)
+        if nulls:
+            raise ValueError(f"{', '.join(nulls)} cannot be null")
+        return v
+
+class RequestAccept(BaseModel):
+    # Utelämnad: den version förslaget öppnades mot
+    version: Optional[int] = None
+
+class RequestPage(BaseModel):
+    items: List[Request]
+    next_cursor: Optional[str] = None
+
+class RecipeRevision(BaseModel):
+    recipe_id: str
+    version: int
+    updated_at: datetime
+    request_id: Optional[str] = None
+    # Omvänd diff: gör version + 1 till den här versionen
+    patch: Dict[str, Any]
+    snapshot: Optional[Dict[str, Any]] = None
+
 class Rating(BaseModel): 
     id: str = Field(default_factory=gen_id)
     recipe_id: str
@@ -71,4 +187,29 @@ class Comment(BaseModel):
     id: str = Field(default_factory=gen_id)
     recipe_id: str
     text: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class RatingCreate(BaseModel):
+    stars: int = Field(ge=1, le=5)
+    note: Optional[str] = None
+
+class CommentCreate(BaseModel):
+    text: str = Field(min_length=1)
+
+class RatingSummary(BaseModel):
+    recipe_id: str
+    count: int = 0
+    average: Optional[float] = None
+    # Antal betyg per stjärna, index 0 = 1 stjärna
+    histogram: List[int] = Field(default_factory=lambda: [0] * 5)
+
+class CommentPage(BaseModel):
+    items: List[Comment]
+    next_cursor: Optional[str] = None
+
+class TopRatedHit(BaseModel):
+    recipe: Recipe
+    rating: RatingSummary
+
+class TopRatedResults(BaseModel):
+    items: List[TopRatedHit]
@@ -0,0 +1,106 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import requests
+
+T = TypeVar("T")
+
+USER_AGENT = "Recipeer/0.1 (+educational-parser)"
+
+HTTP_TIMEOUT = float(os.getenv("RECIPEER_HTTP_TIMEOUT", "15"))
+HTTP_MAX_CONCURRENCY = int(os.getenv("RECIPEER_HTTP_MAX_CONCURRENCY", "16"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("RECIPEER_HTTP_PER_HOST_LIMIT", "4"))
+HTTP_POOL_HOSTS = int(os.getenv("RECIPEER_HTTP_POOL_HOSTS", "64"))
+
+_session: Optional[requests.Session] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+class _HostLimit:
+    __slots__ = ("sem", "users")
+
+    def __init__(self):
+        self.sem = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+        # Anrop som håller eller väntar på semaforen; vid noll tas värden bort
+        self.users = 0
+
+_host_limits: Dict[str, _HostLimit] = {}
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                # requests laddas med första anropet, inte när API:t startar
+                import requests
+                from requests.adapters import HTTPAdapter
+                s = requests.Session()
+                # Keep-alive-pool per värd; pool_block håller oss på högst HTTP_PER_HOST_LIMIT sockets per sajt
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_HOSTS,
+                    pool_maxsize=HTTP_PER_HOST_LIMIT,
+                    pool_block=True,
+                )
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers["User-Agent"] = USER_AGENT
+                _session = s
+    return _session
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HTTP_MAX_CONCURRENCY, thread_name_prefix="recipeer-http")
+    return _executor
+
+def http_get(
+    url: str,
+    timeout: Optional[float] = None,
+    headers: Optional[Dict[str, str]] = None,
+    stream: bool = False,
+) -> requests.Response:
+    return get_session().get(url, headers=headers, timeout=timeout or HTTP_TIMEOUT, stream=stream)
+
+@asynccontextmanager
+async def _host_slot(url: str) -> AsyncIterator[None]:
+    # Bara värdar med anrop i gång har en post, så tabellen växer inte med varje sajt som importerats
+    host = (urlsplit(url).hostname or "").lower()
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = _HostLimit()
+    limit.users += 1
+    try:
+        async with limit.sem:
+            yield
+    finally:
+        limit.users -= 1
+        if not limit.users and _host_limits.get(host) is limit:
+            del _host_limits[host]
+
+async def run_io(url: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # Blockerande I/O körs i en egen begränsad pool, aldrig i FastAPI:s trådpool, och varje
+    # värd får högst HTTP_PER_HOST_LIMIT samtidiga anrop så att en långsam sajt inte fyller den
+    async with _host_slot(url):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), partial(fn, *args, **kwargs))
+
+def close() -> None:
+    global _session, _executor
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        _host_limits.clear()
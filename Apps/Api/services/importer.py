@@ -0,0 +1,145 @@
+from __future__ import annotations
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from pydantic import HttpUrl, TypeAdapter, ValidationError
+
+from Apps.Api.core.store import Store
+from Apps.Api.core.urls import url_key
+from Apps.Api.schemas.models import Recipe, RecipeBase
+
+IMPORT_WORKERS = int(os.getenv("RECIPEER_IMPORT_WORKERS", "8"))
+IMPORT_DOMAIN_DELAY = float(os.getenv("RECIPEER_IMPORT_DOMAIN_DELAY", "0.5"))
+IMPORT_MAX_URLS = int(os.getenv("RECIPEER_IMPORT_MAX_URLS", "500"))
+
+_HTTP_URL = TypeAdapter(HttpUrl)
+
+class InvalidUrlError(ValueError):
+    pass
+
+def normalize_import_url(url: str) -> str:
+    # Kontrolleras innan något hämtas: ett felskrivet värde är klientens fel, inte ett nätverksfel
+    try:
+        return str(_HTTP_URL.validate_python(url.strip()))
+    except ValidationError:
+        raise InvalidUrlError(f"Invalid URL: {url!r}, expected an absolute http(s) URL") from None
+
+def extract_recipe(url: str, slot: Optional[Callable[[str], AsyncContextManager]] = None) -> Awaitable[RecipeBase]:
+    # Parserstacken (requests, bs4, lxml) importeras först när en import faktiskt körs,
+    # så att API:t startar utan den
+    from Apps.Api.services.parsers import extract_recipe_from_url_async
+    return extract_recipe_from_url_async(url, slot=slot)
+
+def import_error_status(e: Exception) -> Tuple[int, str]:
+    # Ett requests-fel kan bara finnas om requests redan är laddat
+    import requests
+    if isinstance(e, requests.HTTPError):
+        return 502, f"Upstream error: {e}"
+    if isinstance(e, requests.RequestException):
+        return 504, f"Failed to fetch URL: {e}"
+    if isinstance(e, InvalidUrlError):
+        return 422, str(e)
+    if isinstance(e, ValueError):
+        return 404, str(e)
+    return 500, f"Import failed: {e}"
+
+def domain_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower().removeprefix("www.")
+
+class DomainGate:
+    # En förfrågan åt gången per domän, med minsta avstånd mellan dem
+    def __init__(self, delay: float = IMPORT_DOMAIN_DELAY):
+        self.delay = delay
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        host = domain_of(url)
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        loop = asyncio.get_running_loop()
+        async with lock:
+            wait = self._last.get(host, 0.0) + self.delay - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                yield
+            finally:
+                self._last[host] = loop.time()
+
+async def fetch_recipes(
+    urls: List[str],
+    workers: int = IMPORT_WORKERS,
+    gate: Optional[DomainGate] = None,
+) -> List[Union[RecipeBase, Exception]]:
+    gate = gate or DomainGate()
+    sem = asyncio.Semaphore(max(1, workers))
+
+    @asynccontextmanager
+    async def slot(url: str) -> AsyncIterator[None]:
+        # Domänslot först så att en långsam domän inte håller alla workers
+        async with gate.slot(url):
+            async with sem:
+                yield
+
+    async def one(url: str) -> Union[RecipeBase, Exception]:
+        try:
+            return await extract_recipe(url, slot=slot)
+        except Exception as e:
+            return e
+
+    return await asyncio.gather(*(one(u) for u in urls))
+
+async def import_recipe(
+    store: Store,
+    cookbook_id: str,
+    url: str,
+    slot: Optional[Callable[[str], AsyncContextManager]] = None,
+) -> Recipe:
+    url = normalize_import_url(url)
+    existing = await asyncio.to_thread(store.find_imported, cookbook_id, [url])
+    if existing is not None:
+        return existing
+    rb = await extract_recipe(url, slot=slot)
+    return await asyncio.to_thread(store.add_imported, cookbook_id, rb, [url])
+
+async def import_recipes(
+    store: Store,
+    cookbook_id: str,
+    urls: List[str],
+    workers: int = IMPORT_WORKERS,
+    gate: Optional[DomainGate] = None,
+) -> List[Union[Recipe, Exception]]:
+    # Ogiltiga URL:er får sitt fel direkt och hämtas aldrig
+    checked: List[Union[str, Exception]] = []
+    for u in urls:
+        try:
+            checked.append(normalize_import_url(u))
+        except InvalidUrlError as e:
+            checked.append(e)
+    # Varianter av samma URL i en batch hämtas bara en gång
+    reps: Dict[str, str] = {}
+    for u in checked:
+        if isinstance(u, str):
+            reps.setdefault(url_key(u), u)
+    todo = list(reps.values())
+    found = await asyncio.to_thread(store.find_imported_many, cookbook_id, [[u] for u in todo])
+    missing = [u for u, r in zip(todo, found) if r is None]
+    fetched = dict(zip(missing, await fetch_recipes(missing, workers, gate)))
+
+    def add_all() -> Dict[str, Union[Recipe, Exception]]:
+        out: Dict[str, Union[Recipe, Exception]] = {u: r if r is not None else fetched[u] for u, r in zip(todo, found)}
+        # Alla lyckade hämtningar sparas i en bulkoperation
+        new = [u for u, res in out.items() if isinstance(res, RecipeBase) and not isinstance(res, Recipe)]
+        try:
+            added = store.add_imported_many(cookbook_id, [(out[u], [u]) for u in new])
+        except ValueError as e:
+            added = [e] * len(new)
+        out.update(zip(new, added))
+        return out
+
+    by_rep = await asyncio.to_thread(add_all)
+    return [by_rep[reps[url_key(u)]] if isinstance(u, str) else u for u in checked]
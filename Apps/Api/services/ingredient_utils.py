@@ -1,25 +1,117 @@
 from __future__ import annotations
 import json
+import logging
+import os
 import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Tuple
+from typing import Iterable, List, Optional, Dict, Tuple
 
+from Apps.Api.core.metrics import REGISTRY
 from Apps.Api.schemas.models import Ingredient
 
-@lru_cache(maxsize=4)
+# Hur ofta (sekunder) regelfilerna stat:as för hot reload; < 0 stänger av omläsning
+RULES_RELOAD_INTERVAL = float(os.getenv("RECIPEER_RULES_RELOAD_INTERVAL", "2"))
+INGREDIENT_CACHE_SIZE = int(os.getenv("RECIPEER_INGREDIENT_CACHE_SIZE", "8192"))
+
+PARSE_CACHE_HITS = REGISTRY.counter("recipeer_ingredient_cache_hits_total", "Ingredient lines served from the parse cache")
+PARSE_CACHE_MISSES = REGISTRY.counter("recipeer_ingredient_cache_misses_total", "Ingredient lines parsed by the rule pipeline")
+PARSE_CACHE_EVICTIONS = REGISTRY.counter("recipeer_ingredient_cache_evictions_total", "Parse cache entries evicted by LRU")
+
+FileStamp = Optional[Tuple[int, int]]
+
+_API_DIR = Path(__file__).resolve().parents[1]
+
+log = logging.getLogger("recipeer.rules")
+
+# Senaste fel per regelfil; tom när allt laddats. warm_rules() vägrar starta med fel här
+_load_errors: Dict[Path, str] = {}
+
+_stamps: Dict[Path, Tuple[float, FileStamp]] = {}
+_stamps_lock = threading.Lock()
+
+def _file_stamp(p: Path) -> FileStamp:
+    # (mtime_ns, storlek), stat:as högst var RULES_RELOAD_INTERVAL sekund per fil
+    now = time.monotonic()
+    cached = _stamps.get(p)
+    if cached is not None and (RULES_RELOAD_INTERVAL < 0 or now - cached[0] < RULES_RELOAD_INTERVAL):
+        return cached[1]
+    try:
+        st = p.stat()
+        stamp: FileStamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    with _stamps_lock:
+        _stamps[p] = (now, stamp)
+    return stamp
+
+@lru_cache(maxsize=None)
+def _notes_rules_path(lang: str) -> Path:
+    return _API_DIR / "data" / f"notes_rules.{lang}.json"
+
+@lru_cache(maxsize=None)
+def _unit_aliases_path(lang: str) -> Path:
+    return _API_DIR / "data" / f"units.{lang}.json"
+
+def _compile_any(patterns: List[str], wrap: str) -> Optional[re.Pattern]:
+    if not patterns:
+        return None
+    return re.compile(wrap.format("|".join(f"(?:{r})" for r in patterns)), re.IGNORECASE)
+
+_PAREN_RE = re.compile(r"\(([^)]+)\)")
+_A_PACK_RE = re.compile(r"\bà\b\s*([0-9]+)\s*([a-zA-Z]+)", re.IGNORECASE)
+
 def load_notes_rules(lang: str) -> dict:
-    data_dir = Path(__file__).resolve().parents[1] / "data"
-    p = data_dir / f"notes_rules.{lang}.json"
+    p = _notes_rules_path(lang)
+    return _load_notes_rules(p, _file_stamp(p))
+
+def _string_list(raw: dict, key: str, name: str) -> List[str]:
+    items = raw.get(key, [])
+    if not isinstance(items, list) or not all(isinstance(r, str) for r in items):
+        raise ValueError(f"{name}: {key} must be a list of strings")
+    return items
+
+def _compile(pattern: str, name: str) -> re.Pattern:
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"{name}: bad pattern {pattern!r}: {e}") from None
+
+def _compile_notes_rules(raw: dict, name: str) -> dict:
+    if not isinstance(raw, dict):
+        raise ValueError(f"{name}: expected a JSON object")
+    trailing = _string_list(raw, "trailing_phrases", name)
+    leading = _string_list(raw, "leading_adverbs", name)
+    cleanup = raw.get("cleanup", {})
+    if not isinstance(cleanup, dict):
+        raise ValueError(f"{name}: cleanup must be an object")
+    return {
+        "trailing_phrases": [_compile(r, name) for r in trailing],
+        "leading_adverbs": [_compile(rf"^(?:{r})\b", name) for r in leading],
+        # Sammanslagna alternationer: en sökning avgör om någon regel alls kan slå till
+        "trailing_any": _compile_any(trailing, "{}"),
+        "leading_any": _compile_any(leading, r"^(?:{})\b"),
+        "cleanup": cleanup,
+    }
+
+def _load_failed(p: Path, e: Exception) -> None:
+    _load_errors[p] = str(e)
+    log.warning("Could not load %s, falling back to empty rules: %s", p.name, e)
+
+# Stämpeln ingår i nyckeln: en ändrad fil ger en ny post, den gamla faller ur LRU:n
+@lru_cache(maxsize=8)
+def _load_notes_rules(p: Path, stamp: FileStamp) -> dict:
     try: 
-        raw = json.loads(p.read_text(encoding="utf-8"))
-        return {
-            "trailing_phrases": [re.compile(r, re.IGNORECASE) for r in raw.get("trailing_phrases", [])],
-            "leading_adverbs": [re.compile(rf"^(?:{r})\b", re.IGNORECASE) for r in raw.get("leading_adverbs", [])],
-            "cleanup": raw.get("cleanup", {})
-        }
-    except Exception:
-        return {"trailing_phrases": [], "leading_adverbs": [], "cleanup": {}}
+        rules = _compile_notes_rules(json.loads(p.read_text(encoding="utf-8")), p.name)
+    except (OSError, ValueError) as e:
+        _load_failed(p, e)
+        return {"trailing_phrases": [], "leading_adverbs": [], "trailing_any": None, "leading_any": None, "cleanup": {}}
+    _load_errors.pop(p, None)
+    return rules
 
 def extract_parentheticals_to_notes(name: str) -> tuple[str, list[str]]:
     notes: list[str] = []
@@ -28,11 +120,16 @@ def extract_parentheticals_to_notes(name: str) -> tuple[str, list[str]]:
         if content: 
             notes.append(content)
         return ""
-    clean = re.sub(r"\(([^)]+)\)", repl, name).strip()
+    if "(" not in name:
+        return name.strip(), notes
+    clean = _PAREN_RE.sub(repl, name).strip()
     return clean, notes
 
 def extract_trailing_phrases(name: str, rules: dict) -> tuple [str, list[str]]:
     notes: list[str] = []
+    gate = rules.get("trailing_any")
+    if gate is not None and not gate.search(name):
+        return name, notes
     for rx in rules["trailing_phrases"]:
         m = rx.search(name)
         if m:
@@ -42,6 +139,9 @@ def extract_trailing_phrases(name: str, rules: dict) -> tuple [str, list[str]]:
 
 def extract_leading_adverbs(name: str, rules: dict) -> tuple[str, list[str]]:
     notes: list[str] = []
+    gate = rules.get("leading_any")
+    if gate is not None and not gate.search(name):
+        return name, notes
     for rx in rules["leading_adverbs"]:
         m = rx.search(name)
         if m: 
@@ -52,24 +152,69 @@ def extract_leading_adverbs(name: str, rules: dict) -> tuple[str, list[str]]:
 def normalize_phrase_in_name(name: str, enabled: bool) -> tuple[str, Optional[str]]:
     if not enabled:
         return name, None
-    m = re.search(r"\bà\b\s*([0-9]+)\s*([a-zA-Z]+)", name, flags=re.IGNORECASE)
+    if "à" not in name and "À" not in name:
+        return name, None
+    m = _A_PACK_RE.search(name)
     if not m:
         return name, None
     note = f"à {m.group(1)} {m.group(2)}"
     clean = (name[:m.start()] + name[m.end():]).strip().rstrip(",;.")
     return clean, note
 
-@lru_cache(maxsize=4)
 def load_unit_aliases(lang: str) -> Dict[str, str]:
-    data_dir = Path(__file__).resolve().parents[1]
-    p = data_dir / f"units.{lang}.json"
+    p = _unit_aliases_path(lang)
+    return _load_unit_aliases(p, _file_stamp(p))
+
+@lru_cache(maxsize=8)
+def _load_unit_aliases(p: Path, stamp: FileStamp) -> Dict[str, str]:
     try: 
-        text = p.read_text(encoding="utf-8")
-        raw = json.loads(text)
-        return {k.lower().rstrip("."): v for k, v in raw.items()}
-    except (FileNotFoundError, json.JSONDecodeError):
+        raw = json.loads(p.read_text(encoding="utf-8"))
+        if not isinstance(raw, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in raw.items()):
+            raise ValueError(f"{p.name}: expected an object of alias -> unit strings")
+    except (OSError, ValueError) as e:
+        _load_failed(p, e)
         return {}
-    
+    _load_errors.pop(p, None)
+    return {k.lower().rstrip("."): v for k, v in raw.items()}
+
+def rules_version(lang: str) -> Tuple[FileStamp, FileStamp]:
+    return _file_stamp(_notes_rules_path(lang)), _file_stamp(_unit_aliases_path(lang))
+
+@lru_cache(maxsize=8)
+def _fingerprint(paths: Tuple[Path, ...], stamps: Tuple[FileStamp, ...]) -> int:
+    crc = 0
+    for p in paths:
+        try:
+            crc = zlib.crc32(p.read_bytes(), crc)
+        except OSError:
+            crc = zlib.crc32(b"-", crc)
+    return crc
+
+def rules_fingerprint(langs: Iterable[str] = ("sv", "en")) -> int:
+    # Innehållsbaserad, så att den är densamma på alla maskiner med samma regelfiler
+    paths = tuple(f(lang) for lang in langs for f in (_notes_rules_path, _unit_aliases_path))
+    return _fingerprint(paths, tuple(_file_stamp(p) for p in paths))
+
+def reload_rules() -> None:
+    # Tvingar omläsning direkt, utan att vänta på nästa stat-intervall
+    with _stamps_lock:
+        _stamps.clear()
+    _load_notes_rules.cache_clear()
+    _load_unit_aliases.cache_clear()
+    _fingerprint.cache_clear()
+    PARSE_CACHE.clear()
+
+def warm_rules(langs: Iterable[str] = ("sv", "en")) -> None:
+    # Läser, validerar och kompilerar alla regelfiler i förväg så att första
+    # parsningen inte betalar för det; trasiga filer stoppar starten i stället för
+    # att tyst ge tomma regler
+    for lang in langs:
+        load_notes_rules(lang)
+        load_unit_aliases(lang)
+    rules_fingerprint(langs)
+    if _load_errors:
+        raise ValueError("Invalid rule data: " + "; ".join(_load_errors.values()))
+
 def normalize_unit(u: Optional[str], lang: str) -> Optional[str]: 
     if not u: 
         return None
@@ -88,14 +233,19 @@ FRACTION_CHAR_MAP = {
     "⅛":"1/8","⅜":"3/8","⅝":"5/8","⅞":"7/8",
 }
 
+_FRACTION_TABLE = str.maketrans(FRACTION_CHAR_MAP)
+_FRACTION_CHARS_RE = re.compile("[" + "".join(FRACTION_CHAR_MAP) + "]")
+_MIXED_FRACTION_RE = re.compile(r"^\s*(\d+)?(?:\s+)?(\d+/\d+)\s*$")
+_RANGE_SPLIT_RE = re.compile(r"[-–]")
+
 def replace_fraction_chars(s: str) -> str:
-    for ch, rep in FRACTION_CHAR_MAP.items():
-        s = s.replace(ch, rep)
-    return s
+    if _FRACTION_CHARS_RE.search(s) is None:
+        return s
+    return s.translate(_FRACTION_TABLE)
 
 def fraction_to_float(s: str) -> Optional[float]: 
     s = s.strip()
-    m = re.match(r"^\s*(\d+)?(?:\s+)?(\d+/\d+)\s*$", s)
+    m = _MIXED_FRACTION_RE.match(s)
     if m:
         whole, frac = m.groups()
         num, den = frac.split("/")
@@ -109,8 +259,10 @@ def fraction_to_float(s: str) -> Optional[float]:
 def parse_quantity(qty_raw: Optional[str]) -> Optional[str]:
     if not qty_raw:
         return None
+    if qty_raw.isdigit():
+        return f"{int(qty_raw):g}"
     s = replace_fraction_chars(qty_raw)
-    parts = [p.strip() for p in re.split(r"[-–]", s) if p.strip()]
+    parts = [p.strip() for p in _RANGE_SPLIT_RE.split(s) if p.strip()]
     vals = []
     for p in parts:
         v = fraction_to_float(p)
@@ -145,7 +297,81 @@ LINE_RE = re.compile(r"""
     \s*$
 """, re.VERBOSE)
 
+class ParseCache:
+    # LRU över färdigparsade rader; nyckeln innehåller regelversionen, så
+    # ändrade regelfiler ger missar och gamla poster trängs ut
+    def __init__(self, size: int = INGREDIENT_CACHE_SIZE):
+        self.size = size
+        self._data: "OrderedDict[tuple, Ingredient]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Ingredient]:
+        with self._lock:
+            ing = self._data.get(key)
+            if ing is not None:
+                self._data.move_to_end(key)
+        return ing
+
+    def put(self, key: tuple, ing: Ingredient) -> None:
+        if self.size <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._data[key] = ing
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+                evicted += 1
+        if evicted:
+            PARSE_CACHE_EVICTIONS.inc(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        hits, misses = PARSE_CACHE_HITS.value, PARSE_CACHE_MISSES.value
+        return {
+            "size": len(self._data),
+            "capacity": self.size,
+            "hits": hits,
+            "misses": misses,
+            "evictions": PARSE_CACHE_EVICTIONS.value,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+PARSE_CACHE = ParseCache()
+
+def normalize_line(line: str) -> str:
+    return " ".join(line.split())
+
 def parse_ingredient_line(line: str, lang: str = "sv") -> Ingredient:
+    return parse_ingredient_lines([line], lang)[0]
+
+def parse_ingredient_lines(lines: Iterable[str], lang: str = "sv") -> List[Ingredient]:
+    # Regler och enhetstabell slås upp en gång per batch i stället för per rad
+    rules = load_notes_rules(lang)
+    aliases = load_unit_aliases(lang)
+    a_pack = rules["cleanup"].get("normalize_a_pack", False)
+    version = rules_version(lang)
+    out: List[Ingredient] = []
+    hits = 0
+    for line in lines:
+        norm = normalize_line(line)
+        key = (lang, version, norm)
+        ing = PARSE_CACHE.get(key)
+        if ing is None:
+            ing = _parse_line(norm, rules, aliases, a_pack)
+            PARSE_CACHE.put(key, ing)
+        else:
+            hits += 1
+        # Kopia: recepten får inte dela (muterbara) Ingredient-objekt med cachen
+        out.append(ing.model_copy())
+    PARSE_CACHE_HITS.inc(hits)
+    PARSE_CACHE_MISSES.inc(len(out) - hits)
+    return out
+
+def _parse_line(line: str, rules: dict, aliases: Dict[str, str], a_pack: bool) -> Ingredient:
     raw = replace_fraction_chars(line.strip())
     m = LINE_RE.match(raw)
     if not m: 
@@ -157,18 +383,15 @@ def parse_ingredient_line(line: str, lang: str = "sv") -> Ingredient:
     notes_s = m.group("notes")
 
     qty = parse_quantity(qty_s)
-    unit = normalize_unit(unit_s, lang)
-    
-    if unit_s and not is_known_unit(unit_s, lang): 
-        name_s = f"{unit_s} {name_s}".strip()
-        unit = None
-
-    if qty is None and unit_s:
-        name_s = f"{unit_s} {name_s}".strip()
-        unit = None
+    unit = None
+    if unit_s:
+        key = unit_s.strip().lower().rstrip(".")
+        unit = aliases.get(key, key)
+        if key not in aliases or qty is None:
+            name_s = f"{unit_s} {name_s}".strip()
+            unit = None
 
-    rules = load_notes_rules(lang)
-    name_s, a_note = normalize_phrase_in_name(name_s, enabled=rules["cleanup"].get("normalize_a_pack", False))
+    name_s, a_note = normalize_phrase_in_name(name_s, enabled=a_pack)
     name_s, parent_notes = extract_parentheticals_to_notes(name_s)
     name_s, lead_notes = extract_leading_adverbs(name_s, rules)
     name_s, trail_notes = extract_trailing_phrases(name_s, rules)
@@ -184,4 +407,4 @@ def parse_ingredient_line(line: str, lang: str = "sv") -> Ingredient:
         quantity=qty,
         unit=unit,
         notes=notes_joined,
-    )
\ No newline at end of file
+    )
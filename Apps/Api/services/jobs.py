@@ -0,0 +1,335 @@
+from __future__ import annotations
+import asyncio
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from Apps.Api.core.metrics import REGISTRY
+from Apps.Api.core.store import Store
+from Apps.Api.schemas.models import ImportJob, RecipeImportError
+from Apps.Api.services.importer import domain_of, import_error_status, import_recipe
+
+# Utan egen sökväg hamnar kön i samma fil som receptdatabasen, annars i en fil i appens
+# datakatalog: köade och körande jobb ska finnas kvar efter en omstart
+JOBS_PATH = (
+    os.getenv("RECIPEER_JOBS_PATH")
+    or os.getenv("RECIPEER_DB_PATH")
+    or str(Path(__file__).resolve().parents[1] / "data" / "jobs.sqlite")
+)
+JOB_WORKERS = int(os.getenv("RECIPEER_JOB_WORKERS", "4"))
+JOB_PER_DOMAIN = int(os.getenv("RECIPEER_JOB_PER_DOMAIN", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("RECIPEER_JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF = float(os.getenv("RECIPEER_JOB_BACKOFF", "2"))
+JOB_BACKOFF_MAX = float(os.getenv("RECIPEER_JOB_BACKOFF_MAX", "300"))
+# Ett körande jobb är lånat så här länge; förnyas medan det körs, och tas över av
+# en annan process först när lånet gått ut (dvs. ägaren har dött)
+JOB_LEASE = float(os.getenv("RECIPEER_JOB_LEASE", "60"))
+
+JOBS_SUCCEEDED = REGISTRY.counter("recipeer_import_jobs_succeeded_total", "Background imports that created a recipe")
+JOBS_RETRIED = REGISTRY.counter("recipeer_import_jobs_retried_total", "Background import attempts rescheduled after a transient error")
+JOBS_FAILED = REGISTRY.counter("recipeer_import_jobs_failed_total", "Background imports that gave up")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    status TEXT NOT NULL,
+    not_before REAL NOT NULL,
+    data TEXT NOT NULL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS ix_import_jobs_due ON import_jobs(status, not_before);
+"""
+
+_LEASE_COLUMNS = (("owner", "TEXT"), ("lease_until", "REAL"))
+
+def is_retryable(e: Exception) -> bool:
+    # Nätverksfel, timeouts, 429 och 5xx är tillfälliga; 4xx och parsningsfel är det inte
+    import requests
+    if isinstance(e, requests.HTTPError):
+        code = e.response.status_code if e.response is not None else 0
+        return code == 429 or code >= 500
+    return isinstance(e, requests.RequestException)
+
+def backoff_delay(attempts: int) -> float:
+    # 2, 4, 8 ... sekunder med ±50 % jitter så att en domän inte får alla omförsök samtidigt
+    return min(JOB_BACKOFF_MAX, JOB_BACKOFF * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+
+class JobQueue:
+    # Flera processer (uvicorn-workers) kan dela köfilen: varje claim tar ett lån med
+    # ägare och utgångstid, och bara utgångna lån tas över
+    def __init__(self, path: str = JOBS_PATH, lease: float = JOB_LEASE):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        have = {row[1] for row in self._db.execute("PRAGMA table_info(import_jobs)")}
+        for name, kind in _LEASE_COLUMNS:
+            if name not in have:
+                # Köfiler från före lånen; deras "running"-jobb har inget lån och tas över direkt
+                self._db.execute(f"ALTER TABLE import_jobs ADD COLUMN {name} {kind}")
+
+    def enqueue(self, cookbook_id: str, url: str) -> ImportJob:
+        job = ImportJob(cookbook_id=cookbook_id, url=url)
+        job.updated_at = datetime.utcnow()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO import_jobs (id, host, status, not_before, data) VALUES (?, ?, ?, ?, ?)",
+                (job.id, domain_of(job.url), job.status, time.time(), job.model_dump_json(exclude={"recipe"})),
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            row = self._db.execute("SELECT status, data FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = ImportJob.model_validate_json(row[1])
+        job.status = row[0]
+        return job
+
+    def claim(self, limit: int, busy: Dict[str, int], per_domain: int) -> List[ImportJob]:
+        held = dict(busy)
+        full = [h for h, n in held.items() if n >= per_domain]
+        now = time.time()
+        sql = (
+            "SELECT id, host, data FROM import_jobs WHERE "
+            "((status = 'queued' AND not_before <= ?) OR (status = 'running' AND IFNULL(lease_until, 0) < ?))"
+        )
+        if full:
+            sql += f" AND host NOT IN ({', '.join('?' * len(full))})"
+        sql += " ORDER BY not_before LIMIT ?"
+        out: List[ImportJob] = []
+        with self._lock:
+            rows = self._db.execute(sql, (now, now, *full, limit * 16)).fetchall()
+            for job_id, host, data in rows:
+                if len(out) >= limit:
+                    break
+                if held.get(host, 0) >= per_domain:
+                    continue
+                job = ImportJob.model_validate_json(data)
+                job.status = "running"
+                job.attempts += 1
+                job.updated_at = datetime.utcnow()
+                # Villkoret upprepas i UPDATE:n: en annan process kan ha hunnit före
+                cur = self._db.execute(
+                    "UPDATE import_jobs SET status = 'running', owner = ?, lease_until = ?, data = ? "
+                    "WHERE id = ? AND ((status = 'queued' AND not_before <= ?) OR (status = 'running' AND IFNULL(lease_until, 0) < ?))",
+                    (self.owner, now + self.lease, job.model_dump_json(exclude={"recipe"}), job_id, now, now),
+                )
+                if cur.rowcount == 1:
+                    held[host] = held.get(host, 0) + 1
+                    out.append(job)
+        return out
+
+    def renew(self) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE import_jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                (time.time() + self.lease, self.owner),
+            )
+
+    def next_due(self) -> Optional[float]:
+        # Nästa köade jobb, eller nästa främmande lån som går ut
+        with self._lock:
+            return self._db.execute(
+                "SELECT MIN(CASE status WHEN 'queued' THEN not_before ELSE IFNULL(lease_until, 0) END) FROM import_jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND IFNULL(owner, '') != ?)",
+                (self.owner,),
+            ).fetchone()[0]
+
+    def finish(self, job: ImportJob, recipe_id: str) -> None:
+        job.status = "succeeded"
+        job.recipe_id = recipe_id
+        job.error = None
+        job.next_attempt_at = None
+        self._save(job, 0.0)
+
+    def retry(self, job: ImportJob, delay: float, error: RecipeImportError) -> None:
+        job.status = "queued"
+        job.error = error
+        job.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        self._save(job, time.time() + delay)
+
+    def fail(self, job: ImportJob, error: RecipeImportError) -> None:
+        job.status = "failed"
+        job.error = error
+        job.next_attempt_at = None
+        self._save(job, 0.0)
+
+    def release(self, job: ImportJob) -> None:
+        # Avbrutet vid nedstängning: försöket räknas inte
+        job.status = "queued"
+        job.attempts -= 1
+        self._save(job, time.time())
+
+    def _save(self, job: ImportJob, not_before: float) -> bool:
+        # Bara lånets ägare får flytta jobbet vidare; har lånet gått ut och tagits
+        # över av en annan process kastas resultatet
+        job.updated_at = datetime.utcnow()
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE import_jobs SET status = ?, not_before = ?, data = ?, owner = NULL, lease_until = NULL "
+                "WHERE id = ? AND owner = ?",
+                (job.status, not_before, job.model_dump_json(exclude={"recipe"}), job.id, self.owner),
+            )
+        return cur.rowcount == 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class JobRunner:
+    def __init__(
+        self,
+        queue: JobQueue,
+        workers: int = JOB_WORKERS,
+        per_domain: int = JOB_PER_DOMAIN,
+        store: Optional[Store] = None,
+    ):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.per_domain = max(1, per_domain)
+        self._store = store
+        self._busy: Dict[str, int] = {}
+        self._running: Set[asyncio.Task] = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._renewed = 0.0
+
+    @property
+    def store(self) -> Store:
+        return self._store or Store.instance()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        tasks = [self._task, *self._running]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._wake = None
+        self._running.clear()
+        self._busy.clear()
+
+    def notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        # Alla köanrop är blockerande sqlite och körs i trådpoolen, aldrig på event-loopen
+        renew_every = self.queue.lease / 3
+        while True:
+            self._wake.clear()
+            free = self.workers - len(self._running)
+            if free > 0:
+                for job in await asyncio.to_thread(self.queue.claim, free, dict(self._busy), self.per_domain):
+                    host = domain_of(job.url)
+                    self._busy[host] = self._busy.get(host, 0) + 1
+                    task = asyncio.create_task(self._execute(job, host))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+
+            now = time.time()
+            if self._running and now - self._renewed >= renew_every:
+                await asyncio.to_thread(self.queue.renew)
+                self._renewed = now
+
+            # Sov tills nästa jobb blir aktuellt, eller tills ett jobb läggs till eller blir klart;
+            # med egna jobb igång vaknar vi också i tid för att förnya lånen
+            due = await asyncio.to_thread(self.queue.next_due)
+            now = time.time()
+            if due is None or (due <= now and self._running):
+                timeout = None
+            else:
+                timeout = max(0.05, due - now)
+            if self._running:
+                timeout = min(timeout or renew_every, renew_every)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: ImportJob, host: str) -> None:
+        try:
+            recipe = await import_recipe(self.store, job.cookbook_id, job.url)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.queue.release, job)
+            raise
+        except Exception as e:
+            code, detail = import_error_status(e)
+            error = RecipeImportError(status_code=code, detail=detail)
+            if is_retryable(e) and job.attempts < JOB_MAX_ATTEMPTS:
+                JOBS_RETRIED.inc()
+                await asyncio.to_thread(self.queue.retry, job, backoff_delay(job.attempts), error)
+            else:
+                JOBS_FAILED.inc()
+                await asyncio.to_thread(self.queue.fail, job, error)
+        else:
+            JOBS_SUCCEEDED.inc()
+            await asyncio.to_thread(self.queue.finish, job, recipe.id)
+        finally:
+            self._busy[host] -= 1
+            if not self._busy[host]:
+                del self._busy[host]
+            self.notify()
+
+_queue: Optional[JobQueue] = None
+_runner: Optional[JobRunner] = None
+_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                _queue = JobQueue(JOBS_PATH)
+    return _queue
+
+def get_runner() -> JobRunner:
+    global _runner
+    if _runner is None:
+        queue = get_job_queue()
+        with _lock:
+            if _runner is None:
+                _runner = JobRunner(queue)
+    return _runner
+
+async def submit(cookbook_id: str, url: str) -> ImportJob:
+    # INSERT:en körs i trådpoolen; väckningen av köraren sker på event-loopen
+    queue = get_job_queue()
+    job = await asyncio.to_thread(queue.enqueue, cookbook_id, url)
+    get_runner().notify()
+    return job
+
+def get_job(job_id: str, store: Store) -> Optional[ImportJob]:
+    job = get_job_queue().get(job_id)
+    if job is not None and job.recipe_id:
+        job.recipe = store.get_recipe(job.recipe_id)
+    return job
+
+def start() -> None:
+    get_runner().start()
+
+async def stop() -> None:
+    if _runner is not None:
+        await _runner.stop()
@@ -0,0 +1,189 @@
+from __future__ import annotations
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterable, List, Optional
+
+import requests
+from lxml import etree
+
+from Apps.Api.core.metrics import STAGE_SECONDS, timed_stage
+from Apps.Api.services.http_client import http_get
+from Apps.Api.services.parsers_jsonld import FetchedPage, find_first_recipe, is_complete_recipe, try_load_json_candidates
+
+STREAMING_PARSE = os.getenv("RECIPEER_STREAMING_PARSE", "1") == "1"
+SCAN_CHUNK_SIZE = 16 * 1024
+
+LD_JSON = "application/ld+json"
+
+@dataclass
+class PageScan:
+    html_lang: Optional[str] = None
+    og_locale: Optional[str] = None
+    og_title: Optional[str] = None
+    title: Optional[str] = None
+    canonical: Optional[str] = None
+    blocks: List[str] = field(default_factory=list)
+    candidates: List[Any] = field(default_factory=list)
+    recipe: Optional[dict] = None
+    head_closed: bool = False
+    complete: bool = False
+    bytes_read: int = 0
+
+class JsonLdScanner:
+    # Händelsebaserad genomläsning: vi behåller bara det vi behöver och
+    # kastar varje element när det stängts, så inget fullt DOM-träd byggs
+    def __init__(self, encoding: Optional[str] = None):
+        self.scan = PageScan()
+        self._parser = etree.HTMLPullParser(events=("start", "end"), encoding=encoding)
+        # Stegtider som i den DOM-baserade vägen, rapporteras en gång per sida i finish()
+        self._parse_s = 0.0
+        self._walk_s = 0.0
+        self._decode_s = 0.0
+        self._observed = False
+
+    @property
+    def done(self) -> bool:
+        s = self.scan
+        # Ett ofullständigt recept kan ersättas av ett bättre block längre ner
+        if s.recipe is None or not is_complete_recipe(s.recipe):
+            return False
+        return s.head_closed or s.html_lang is not None or s.og_locale is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        self.scan.bytes_read += len(chunk)
+        t0 = time.perf_counter()
+        self._parser.feed(chunk)
+        self._parse_s += time.perf_counter() - t0
+        self._drain()
+        return self.done
+
+    def close(self) -> PageScan:
+        t0 = time.perf_counter()
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        self._parse_s += time.perf_counter() - t0
+        self._drain()
+        self.scan.complete = True
+        return self.finish()
+
+    def finish(self) -> PageScan:
+        # lxml:s parsning räknas som parse_html, genomgången av händelserna som
+        # find_jsonld_blocks; JSON-avkodningen mäts redan i try_load_json_candidates
+        if not self._observed:
+            self._observed = True
+            STAGE_SECONDS.observe(self._parse_s, "parse_html")
+            STAGE_SECONDS.observe(self._walk_s - self._decode_s, "find_jsonld_blocks")
+        return self.scan
+
+    def _drain(self) -> None:
+        t0 = time.perf_counter()
+        s = self.scan
+        for event, el in self._parser.read_events():
+            tag = el.tag if isinstance(el.tag, str) else ""
+            if event == "start":
+                if tag == "html" and s.html_lang is None:
+                    s.html_lang = el.get("lang")
+                continue
+
+            if tag == "meta":
+                prop = el.get("property")
+                if prop == "og:locale" and s.og_locale is None:
+                    s.og_locale = el.get("content")
+                elif prop == "og:title" and s.og_title is None:
+                    s.og_title = el.get("content")
+            elif tag == "link" and s.canonical is None and "canonical" in (el.get("rel") or "").lower().split():
+                s.canonical = el.get("href")
+            elif tag == "title" and s.title is None:
+                s.title = (el.text or "").strip()
+            elif tag == "script" and (el.get("type") or "").strip().lower() == LD_JSON:
+                text = (el.text or "").strip()
+                if text:
+                    s.blocks.append(text)
+                    td = time.perf_counter()
+                    found = try_load_json_candidates(text)
+                    self._decode_s += time.perf_counter() - td
+                    s.candidates.extend(found)
+                    if s.recipe is None or not is_complete_recipe(s.recipe):
+                        s.recipe = find_first_recipe([s.recipe, *found] if s.recipe else found)
+            elif tag == "head":
+                s.head_closed = True
+
+            if tag in ("html", "head", "body"):
+                continue
+            el.clear(keep_tail=False)
+            parent = el.getparent()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+        self._walk_s += time.perf_counter() - t0
+
+def scan_html(chunks: Iterable[bytes], encoding: Optional[str] = None, stop_early: bool = True) -> PageScan:
+    scanner = JsonLdScanner(encoding=encoding)
+    for chunk in chunks:
+        if scanner.feed(chunk) and stop_early:
+            return scanner.finish()
+    return scanner.close()
+
+def _header_charset(resp: requests.Response) -> Optional[str]:
+    ctype = resp.headers.get("Content-Type", "")
+    for part in ctype.split(";")[1:]:
+        k, _, v = part.strip().partition("=")
+        if k.lower() == "charset" and v:
+            return v.strip("\"' ")
+    return None
+
+def _decode(body: bytes, charset: Optional[str]) -> str:
+    if charset:
+        try:
+            return body.decode(charset, errors="replace")
+        except LookupError:
+            pass
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body.decode("latin-1")
+
+# Strömmande hämtning inkluderar genomläsningen av sidan medan den laddas ner
+@timed_stage("fetch_stream")
+def fetch_page_streaming(
+    url: str,
+    timeout: Optional[float] = None,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> FetchedPage:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    resp = http_get(url, timeout=timeout, headers=headers or None, stream=True)
+    try:
+        if resp.status_code == 304:
+            return FetchedPage(url=url, status=304, etag=etag, last_modified=last_modified,
+                               cache_control=resp.headers.get("Cache-Control"))
+        resp.raise_for_status()
+
+        scanner = JsonLdScanner(encoding=_header_charset(resp))
+        buf = bytearray()
+        for chunk in resp.iter_content(chunk_size=SCAN_CHUNK_SIZE):
+            buf += chunk
+            if scanner.feed(chunk):
+                # Receptet är hittat: resten av sidan (annonser, footer) läses aldrig
+                break
+        else:
+            scanner.close()
+    finally:
+        resp.close()
+
+    return FetchedPage(
+        url=url,
+        status=resp.status_code,
+        text=_decode(bytes(buf), _header_charset(resp)),
+        etag=resp.headers.get("ETag"),
+        last_modified=resp.headers.get("Last-Modified"),
+        cache_control=resp.headers.get("Cache-Control"),
+        scan=scanner.finish(),
+    )
@@ -0,0 +1,195 @@
+from __future__ import annotations
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from Apps.Api.core.metrics import REGISTRY
+from Apps.Api.schemas.models import RecipeBase
+from Apps.Api.services.ingredient_utils import rules_fingerprint
+from Apps.Api.services.parsers_jsonld import FetchedPage
+
+PAGE_CACHE_PATH = os.getenv("RECIPEER_PAGE_CACHE_PATH")
+PAGE_CACHE_TTL = float(os.getenv("RECIPEER_PAGE_CACHE_TTL", "3600"))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("RECIPEER_PAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Bumpas när parsningen ändras så att sparade recept parsas om från sparad HTML
+PARSER_VERSION = 4
+
+CACHE_HITS = REGISTRY.counter("recipeer_page_cache_hits_total", "Imports served from a fresh cache entry")
+CACHE_MISSES = REGISTRY.counter("recipeer_page_cache_misses_total", "Imports with no usable cache entry")
+CACHE_REVALIDATED = REGISTRY.counter("recipeer_page_cache_revalidated_total", "Stale entries confirmed unchanged by a 304")
+CACHE_EVICTIONS = REGISTRY.counter("recipeer_page_cache_evictions_total", "Entries evicted to stay under the size limit")
+
+def parser_version() -> int:
+    # Ändrade regelfiler (hot reload) ska också ge omparsning, inte bara ny kod
+    return PARSER_VERSION << 32 | rules_fingerprint()
+
+_MAX_AGE_RE = re.compile(r"max-age\s*=\s*(\d+)", re.IGNORECASE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    recipe TEXT,
+    parser_version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pages_last_access ON pages(last_access);
+-- Löpande summa av size, hålls av triggers så att _evict slipper SUM över hela tabellen
+CREATE TABLE IF NOT EXISTS pages_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL);
+INSERT OR IGNORE INTO pages_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM pages;
+CREATE TRIGGER IF NOT EXISTS pages_size_insert AFTER INSERT ON pages BEGIN
+    UPDATE pages_size SET total = total + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS pages_size_delete AFTER DELETE ON pages BEGIN
+    UPDATE pages_size SET total = total - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS pages_size_update AFTER UPDATE OF size ON pages BEGIN
+    UPDATE pages_size SET total = total + NEW.size - OLD.size WHERE id = 0;
+END;
+"""
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+@dataclass
+class CachedPage:
+    url: str
+    html: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+    recipe: Optional[RecipeBase]
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+class PageCache:
+    def __init__(self, path: str, ttl: float = PAGE_CACHE_TTL, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        key = normalize_url(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url, body, etag, last_modified, expires_at, recipe, parser_version FROM pages WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE pages SET last_access = ? WHERE key = ?", (time.time(), key))
+        src, body, etag, last_modified, expires_at, recipe, version = row
+        rb = RecipeBase.model_validate_json(recipe) if recipe and version == parser_version() else None
+        return CachedPage(
+            url=src,
+            html=zlib.decompress(body).decode("utf-8"),
+            etag=etag,
+            last_modified=last_modified,
+            expires_at=expires_at,
+            recipe=rb,
+        )
+
+    def put(self, url: str, page: FetchedPage, recipe: Optional[RecipeBase]) -> None:
+        ttl = self._ttl_for(page.cache_control)
+        if ttl is None:
+            return
+        body = zlib.compress(page.text.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            # Upsert, inte OR REPLACE: REPLACE:s radering triggar inte pages_size_delete
+            self._db.execute(
+                "INSERT INTO pages (key, url, body, size, etag, last_modified, expires_at, last_access, recipe, parser_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET url = excluded.url, body = excluded.body, size = excluded.size, "
+                "etag = excluded.etag, last_modified = excluded.last_modified, expires_at = excluded.expires_at, "
+                "last_access = excluded.last_access, recipe = excluded.recipe, parser_version = excluded.parser_version",
+                (normalize_url(url), url, body, len(body), page.etag, page.last_modified,
+                 now + ttl, now, recipe.model_dump_json() if recipe else None, parser_version()),
+            )
+            self._evict()
+
+    def refresh(self, url: str, page: FetchedPage) -> None:
+        ttl = self._ttl_for(page.cache_control)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET expires_at = ?, last_access = ? WHERE key = ?",
+                (now + (ttl or 0), now, normalize_url(url)),
+            )
+
+    def store_recipe(self, url: str, recipe: RecipeBase) -> None:
+        # Omparsat med nyare parser: spara receptet men låt giltighetstiden vara
+        with self._lock:
+            self._db.execute(
+                "UPDATE pages SET recipe = ?, parser_version = ? WHERE key = ?",
+                (recipe.model_dump_json(), parser_version(), normalize_url(url)),
+            )
+
+    def _ttl_for(self, cache_control: Optional[str]) -> Optional[float]:
+        cc = (cache_control or "").lower()
+        if "no-store" in cc:
+            return None
+        if "no-cache" in cc:
+            return 0.0
+        m = _MAX_AGE_RE.search(cc)
+        if m:
+            return min(float(m.group(1)), self.ttl)
+        return self.ttl
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT total FROM pages_size WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # LRU: släng äldst använda tills vi är under 90 % av taket
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in self._db.execute("SELECT key, size FROM pages ORDER BY last_access"):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM pages WHERE key = ?", victims)
+        CACHE_EVICTIONS.inc(len(victims))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+_cache: Optional[PageCache] = None
+_cache_lock = threading.Lock()
+
+def get_page_cache() -> Optional[PageCache]:
+    global _cache
+    if not PAGE_CACHE_PATH:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PageCache(PAGE_CACHE_PATH)
+    return _cache
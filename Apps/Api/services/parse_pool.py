@@ -0,0 +1,82 @@
+from __future__ import annotations
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional, TypeVar
+
+from Apps.Api.core.metrics import REGISTRY
+
+T = TypeVar("T")
+
+# 0 = parsning i trådar som tidigare; >0 = så många parse-processer
+PARSE_WORKERS = int(os.getenv("RECIPEER_PARSE_WORKERS", "0"))
+PARSE_QUEUE_SIZE = int(os.getenv("RECIPEER_PARSE_QUEUE_SIZE", str(max(1, PARSE_WORKERS) * 4)))
+
+PARSE_TASKS = REGISTRY.counter("recipeer_parse_pool_tasks_total", "Pages parsed in the process pool")
+PARSE_WAITS = REGISTRY.counter("recipeer_parse_pool_waits_total", "Parse submissions that waited for a free queue slot")
+PARSE_RESTARTS = REGISTRY.counter("recipeer_parse_pool_restarts_total", "Times the process pool broke and was recreated")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_queue_slots: Optional[asyncio.Semaphore] = None
+
+def enabled() -> bool:
+    return PARSE_WORKERS > 0
+
+def _init_worker() -> None:
+    # En ny process laddar parserstacken och regelfilerna innan första sidan, inte under den
+    from Apps.Api.services import warmup
+    warmup.warm(parsers=True)
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                # spawn: processerna ärver inga trådar eller öppna sockets från API:t
+                _executor = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+    return _executor
+
+def _discard_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+async def run_cpu(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # Högst PARSE_QUEUE_SIZE sidor köade eller under parsning; fler anropare väntar här
+    # så att importen bromsas i stället för att processkön växer utan gräns.
+    global _queue_slots
+    if _queue_slots is None:
+        _queue_slots = asyncio.Semaphore(PARSE_QUEUE_SIZE)
+    if _queue_slots.locked():
+        PARSE_WAITS.inc()
+    async with _queue_slots:
+        executor = _get_executor()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # En process dog (t.ex. OOM): bygg en ny pool nästa gång, parsa den här sidan i en tråd
+            PARSE_RESTARTS.inc()
+            _discard_executor(executor)
+            return await asyncio.to_thread(fn, *args, **kwargs)
+    PARSE_TASKS.inc()
+    return result
+
+def close() -> None:
+    global _executor, _queue_slots
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        _queue_slots = None
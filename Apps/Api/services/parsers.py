@@ -1,26 +1,143 @@
+import asyncio
+from contextlib import nullcontext
+from dataclasses import replace
+from typing import AsyncContextManager, Callable, Optional
+
 from pydantic import HttpUrl
 from bs4 import BeautifulSoup
-import requests
 
+from Apps.Api.core.metrics import timed_stage
+from Apps.Api.core.urls import canonical_source
 from Apps.Api.schemas.models import RecipeBase, Ingredient, InstructionStep
-from Apps.Api.services.parsers_jsonld import extract_recipe_from_jsonld
+from Apps.Api.services import parse_pool
+from Apps.Api.services.http_client import run_io
+from Apps.Api.services.parsers_jsonld import (
+    FetchedPage, build_recipe, extract_recipe_from_document, fetch_page, find_canonical_link, lang_from_hints, parse_html,
+)
+from Apps.Api.services.jsonld_stream import STREAMING_PARSE, PageScan, fetch_page_streaming
+from Apps.Api.services.page_cache import (
+    CACHE_HITS, CACHE_MISSES, CACHE_REVALIDATED, CachedPage, PageCache, get_page_cache,
+)
 
-def extract_recipe_from_url(url: HttpUrl) -> RecipeBase:
-    rb = extract_recipe_from_jsonld(str(url))
-    if rb: 
-        return rb
-    
-    html = requests.get(str(url), headers={"User-Agent": "Recipeer/0.1"}, timeout=15).text
-    soup = BeautifulSoup(html, "lxml")
+def extract_fallback_title(soup: BeautifulSoup) -> str:
     title = (soup.find("meta", property="og:title") or soup.find("title"))
-    title_text = title.get("content") if title and title.has_attr("content") else (title.text.strip() if title else "Untitled Recipe")
+    return title.get("content") if title and title.has_attr("content") else (title.text.strip() if title else "Untitled Recipe")
+
+def extract_recipe_from_html(html: str, url: str) -> RecipeBase:
+    # En parse per sida: JSON-LD, språk och og:title delar samma träd
+    soup = parse_html(html)
+    rb = extract_recipe_from_document(html, url, soup=soup)
+    if rb:
+        return rb
+
+    return fallback_recipe(extract_fallback_title(soup), canonical_source(url, find_canonical_link(soup)))
+
+def extract_recipe_from_scan(scan: PageScan, url: str) -> RecipeBase:
+    if scan.recipe:
+        return build_recipe(scan.recipe, url, _scan_lang(scan, url), canonical=scan.canonical)
+    title = scan.og_title if scan.og_title is not None else (scan.title or "Untitled Recipe")
+    return fallback_recipe(title, canonical_source(url, scan.canonical))
+
+@timed_stage("detect_lang")
+def _scan_lang(scan: PageScan, url: str) -> str:
+    # Ledtrådarna samlades under genomläsningen; här väljs bara språket
+    return lang_from_hints(scan.html_lang, scan.og_locale, url)
+
+def fallback_recipe(title: str, url: str) -> RecipeBase:
     return RecipeBase(
-        title=title_text,
+        title=title,
         description=None,
         ingredients=[Ingredient(name="(parse me)")],
         steps=[InstructionStep(order=1, text="(parse me)")],
         servings=None,
         total_time=None,
-        source_url=str(url),
+        source_url=url,
         images=[]
-    )
\ No newline at end of file
+    )
+
+def _fetch(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchedPage:
+    if STREAMING_PARSE:
+        return fetch_page_streaming(url, etag=etag, last_modified=last_modified)
+    return fetch_page(url, etag=etag, last_modified=last_modified)
+
+def _cached_recipe(cache: PageCache, entry: CachedPage) -> RecipeBase:
+    # source_url är redan sidans kanoniska adress, samma för alla URL-varianter av sidan
+    if entry.recipe:
+        return entry.recipe
+    # Sparat av en äldre parser: parsa om en gång och skriv tillbaka, inte vid varje träff
+    rb = extract_recipe_from_html(entry.html, entry.url)
+    cache.store_recipe(entry.url, rb)
+    return rb
+
+def _cache_lookup(url: str) -> tuple[Optional[PageCache], Optional[CachedPage]]:
+    cache = get_page_cache()
+    return cache, (cache.get(url) if cache else None)
+
+def _parse_page(scan: Optional[PageScan], html: str, url: str) -> RecipeBase:
+    return extract_recipe_from_scan(scan, url) if scan else extract_recipe_from_html(html, url)
+
+def _parse_page_json(scan: Optional[PageScan], html: str, url: str) -> str:
+    # Körs i parse-processerna; receptet skickas tillbaka som JSON
+    return _parse_page(scan, html, url).model_dump_json()
+
+async def _parse_in_pool(page: FetchedPage, url: str) -> RecipeBase:
+    if page.scan:
+        # Genomläsningen är redan gjord; skicka bara receptobjektet och språkledtrådarna
+        args = (replace(page.scan, blocks=[], candidates=[]), "", url)
+    else:
+        args = (None, page.text, url)
+    return RecipeBase.model_validate_json(await parse_pool.run_cpu(_parse_page_json, *args))
+
+def _recipe_from_fetch(
+    cache: Optional[PageCache],
+    entry: Optional[CachedPage],
+    url: str,
+    page: FetchedPage,
+    rb: Optional[RecipeBase] = None,
+) -> RecipeBase:
+    if page.not_modified and entry is not None:
+        CACHE_REVALIDATED.inc()
+        rb = _cached_recipe(cache, entry)
+        cache.refresh(url, page)
+        return rb
+    if rb is None:
+        rb = _parse_page(page.scan, page.text, url)
+    if cache:
+        CACHE_MISSES.inc()
+        cache.put(url, page, rb)
+    return rb
+
+def extract_recipe_from_url(url: HttpUrl) -> RecipeBase:
+    url = str(url)
+    cache, entry = _cache_lookup(url)
+    if entry and entry.is_fresh:
+        CACHE_HITS.inc()
+        return _cached_recipe(cache, entry)
+    page = _fetch(
+        url,
+        etag=entry.etag if entry else None,
+        last_modified=entry.last_modified if entry else None,
+    )
+    return _recipe_from_fetch(cache, entry, url, page)
+
+async def extract_recipe_from_url_async(
+    url: HttpUrl,
+    slot: Optional[Callable[[str], AsyncContextManager]] = None,
+) -> RecipeBase:
+    url = str(url)
+    cache, entry = await asyncio.to_thread(_cache_lookup, url)
+    if entry and entry.is_fresh:
+        CACHE_HITS.inc()
+        return await asyncio.to_thread(_cached_recipe, cache, entry)
+    async with (slot(url) if slot else nullcontext()):
+        # Med strömmande parsning sker genomläsningen redan här, medan bytes kommer in
+        page = await run_io(
+            url, _fetch, url,
+            etag=entry.etag if entry else None,
+            last_modified=entry.last_modified if entry else None,
+        )
+    rb = None
+    if parse_pool.enabled() and not (page.not_modified and entry is not None):
+        rb = await _parse_in_pool(page, url)
+    # Parsningen är CPU-bunden och hålls borta från event-loopen
+    return await asyncio.to_thread(_recipe_from_fetch, cache, entry, url, page, rb)
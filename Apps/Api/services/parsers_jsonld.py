@@ -1,49 +1,112 @@
 from __future__ import annotations
-from typing import Any, Iterable, List, Optional, Union
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Union
+from html import unescape
 import json
 import re
 
-import requests
 from bs4 import BeautifulSoup
 
+from Apps.Api.core.metrics import timed_stage
+from Apps.Api.core.urls import canonical_source
 from Apps.Api.schemas.models import RecipeBase, Ingredient, InstructionStep
-from Apps.Api.services.ingredient_utils import parse_ingredient_line
+from Apps.Api.services.ingredient_utils import parse_ingredient_lines
+from Apps.Api.services.http_client import http_get, run_io
 
-def fetch_html(url: str, timeout: float = 15.0) -> str: 
-    resp = requests.get(
-        url,
-        headers={"User-Agent": "Recipeer/0.1 (+educational-parser)"}, 
-        timeout=timeout,
-    )
+if TYPE_CHECKING:
+    from Apps.Api.services.jsonld_stream import PageScan
+
+@dataclass
+class FetchedPage:
+    url: str
+    status: int
+    text: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    cache_control: Optional[str] = None
+    scan: Optional["PageScan"] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+@timed_stage("fetch_html")
+def fetch_page(
+    url: str,
+    timeout: Optional[float] = None,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> FetchedPage:
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    resp = http_get(url, timeout=timeout, headers=headers or None)
+    if resp.status_code == 304:
+        return FetchedPage(url=url, status=304, etag=etag, last_modified=last_modified,
+                           cache_control=resp.headers.get("Cache-Control"))
     resp.raise_for_status()
-    return resp.text
+    return FetchedPage(
+        url=url,
+        status=resp.status_code,
+        text=resp.text,
+        etag=resp.headers.get("ETag"),
+        last_modified=resp.headers.get("Last-Modified"),
+        cache_control=resp.headers.get("Cache-Control"),
+    )
 
-def detect_lang(html: str, url: str) -> str:
+async def fetch_page_async(
+    url: str,
+    timeout: Optional[float] = None,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> FetchedPage:
+    return await run_io(url, fetch_page, url, timeout, etag, last_modified)
+
+def fetch_html(url: str, timeout: Optional[float] = None) -> str: 
+    return fetch_page(url, timeout=timeout).text
+
+async def fetch_html_async(url: str, timeout: Optional[float] = None) -> str:
+    return (await fetch_page_async(url, timeout=timeout)).text
+
+@timed_stage("parse_html")
+def parse_html(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, "lxml")
+
+@timed_stage("detect_lang")
+def detect_lang(html: str, url: str, soup: Optional[BeautifulSoup] = None) -> str:
+    html_lang = og_locale = None
     try:
-        soup = BeautifulSoup(html, "lxml")
+        if soup is None:
+            soup = parse_html(html)
         html_tag = soup.find("html")
         if(html_tag and html_tag.has_attr("lang")):
-            val = (html_tag["lang"] or "").lower()
-            if val.startswith("sv"):
-                return "sv"
-            if val.startswith("en"):
-                return "en"
+            html_lang = html_tag["lang"]
         og = soup.find("meta", attrs={"property": "og:locale"})
         if og and og.has_attr("content"):
-            loc = (og["content"] or "").lower()
-            if loc.startswith("sv"):
-                return "sv"
-            if loc.startswith("en"):
-                return "en"
+            og_locale = og["content"]
     except Exception:
         pass
+    return lang_from_hints(html_lang, og_locale, url)
+
+def lang_from_hints(html_lang: Optional[str], og_locale: Optional[str], url: str) -> str:
+    for val in (html_lang, og_locale):
+        val = (val or "").lower()
+        if val.startswith("sv"):
+            return "sv"
+        if val.startswith("en"):
+            return "en"
 
     if url.lower().endswith(".se") or ".se/" in url.lower():
         return "sv"
     return "en"
 
-def find_jsonld_blocks(html: str) -> List[str]: 
-    soup = BeautifulSoup(html, "lxml")
+@timed_stage("find_jsonld_blocks")
+def find_jsonld_blocks(html: str, soup: Optional[BeautifulSoup] = None) -> List[str]: 
+    if soup is None:
+        soup = parse_html(html)
     blocks: List[str] = []
     for tag in soup.find_all("script", attrs={"type": "application/ld+json"}):
         if not tag.string: 
@@ -54,20 +117,86 @@ def find_jsonld_blocks(html: str) -> List[str]:
             blocks.append(text.strip())
     return blocks
 
+_LENIENT_JSON = json.JSONDecoder(strict=False)
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_ENCODED_QUOTE_RE = re.compile(r"&(?:quot|#34|#x22);", re.IGNORECASE)
+_WRAPPER_RE = re.compile(r"^\s*(?:<!--|<!\[CDATA\[)|(?:-->|\]\]>)\s*$")
+# Strängar hoppas över i ett svep; kommatecken matchas bara när de är avslutande
+_JSON_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"?|[{}\[\]]|,(?=\s*[}\]])')
+_NO_VALUE = object()
+
+def _clean_json_text(text: str) -> str:
+    # Vissa sajter entitetskodar hela blocket: {&quot;@type&quot;: ...}
+    if '"' not in text and _ENCODED_QUOTE_RE.search(text):
+        text = unescape(text)
+    text = _WRAPPER_RE.sub("", text)
+    return _CONTROL_RE.sub("", text)
+
+def _decode_span(text: str, start: int, end: int, cuts: List[int]) -> Any:
+    lo = bisect_left(cuts, start)
+    hi = bisect_left(cuts, end, lo)
+    if lo == hi:
+        frag = text[start:end]
+    else:
+        parts, prev = [], start
+        for c in cuts[lo:hi]:
+            parts.append(text[prev:c])
+            prev = c + 1
+        parts.append(text[prev:end])
+        frag = "".join(parts)
+    try:
+        return _LENIENT_JSON.decode(frag)
+    except (ValueError, RecursionError):
+        # RecursionError: extremt djup nästling, värdet hoppas över som annat skräp
+        return _NO_VALUE
+
+def recover_json_values(text: str) -> List[Any]:
+    # Ett enda svep med hakparentesbalansering: varje toppnivåvärde avkodas en gång,
+    # så tiden är linjär i blockets storlek även för trasig indata
+    text = _clean_json_text(text)
+    out: List[Any] = []
+    cuts: List[int] = []
+    # Öppna klamrars positioner och, per nivå, platta [start, slut, ...] för stängda barn
+    opens: List[int] = []
+    children: List[Optional[List[int]]] = []
+    for m in _JSON_TOKEN_RE.finditer(text):
+        pos = m.start()
+        c = text[pos]
+        if c == '"':
+            continue
+        if c == ",":
+            if opens:
+                cuts.append(pos)
+        elif c == "{" or c == "[":
+            opens.append(pos)
+            children.append(None)
+        elif opens:
+            start = opens.pop()
+            children.pop()
+            if opens:
+                kids = children[-1]
+                if kids is None:
+                    kids = children[-1] = []
+                kids += (start, pos + 1)
+            else:
+                value = _decode_span(text, start, pos + 1, cuts)
+                if value is not _NO_VALUE:
+                    out.append(value)
+
+    # Avhugget block: rädda de kompletta barnen till de värden som aldrig stängdes
+    for kids in children:
+        for i in range(0, len(kids or ()), 2):
+            value = _decode_span(text, kids[i], kids[i + 1], cuts)
+            if value is not _NO_VALUE:
+                out.append(value)
+    return out
+
+@timed_stage("try_load_json_candidates")
 def try_load_json_candidates(text: str) -> List[Any]:
-    candidates: List[Any] = []
-    try: 
-        data = json.loads(text)
-        candidates.append(data)
-    except json.JSONDecodeError:
-        for m in re.finditer(r"(\{.*\}|\[.*\])", text, flags=re.DOTALL):
-            frag = m.group(1)
-            try:
-                candidates.append(json.loads(frag))
-            except Exception:
-                pass
-        
-    return candidates
+    try:
+        return [json.loads(text)]
+    except (json.JSONDecodeError, RecursionError):
+        return recover_json_values(text)
 
 def is_type_recipe(obj: Any) -> bool:
     t = obj.get("@type") if isinstance(obj, dict) else None
@@ -79,32 +208,97 @@ def is_type_recipe(obj: Any) -> bool:
         return any(isinstance(x, str) and x.lower() == "recipe" for x in t)
     return False
 
-def flatten_graph(obj: Any) -> List[dict]:
-    out: List[dict] = []
-    def rec(x: Any):
-        if isinstance(x, dict):
-            out.append(x)
-            for v in x.values():
-                rec(v)
-        elif isinstance(x, list):
-            for v in x: 
-                rec(v)
-    rec(obj)
-    return out
+# Fält som avgör hur komplett ett Recipe-objekt är; de tre första krävs för att sluta leta
+_RECIPE_FIELDS = ("name", "recipeIngredient", "recipeInstructions", "recipeYield", "totalTime", "image")
+_REQUIRED_FIELDS = 3
 
-def find_first_recipe(objs: Iterable[Any]) -> Optional[dict]:
+def iter_recipes(obj: Any) -> Iterator[dict]:
+    # Lat djupet-först-vandring i dokumentordning; går aldrig ner i ett Recipe
+    stack = [iter((obj,))]
+    push, pop = stack.append, stack.pop
+    while stack:
+        for x in stack[-1]:
+            if type(x) is dict:
+                if "@type" in x and is_type_recipe(x):
+                    yield x
+                    continue
+                push(iter(x.values()))
+                break
+            if type(x) is list:
+                push(iter(x))
+                break
+        else:
+            pop()
+
+def _ref_id(x: Any) -> Optional[str]:
+    # En referens är {"@id": ...}, ibland med @type
+    if isinstance(x, dict) and "@id" in x and (len(x) == 1 or (len(x) == 2 and "@type" in x)):
+        return x["@id"]
+    return None
+
+def _graph_ids(objs: List[Any]) -> Dict[str, dict]:
+    # Bara toppnivån och @graph indexeras: där lägger sajterna sina noder med @id
+    ids: Dict[str, dict] = {}
     for o in objs:
         if isinstance(o, dict):
-            if is_type_recipe(o):
-                return o
-            for cand in flatten_graph(o):
-                if is_type_recipe(cand):
-                    return cand
+            nodes = [o, *as_list(o.get("@graph"))]
         elif isinstance(o, list):
-            for item in o:
-                if isinstance(item, dict) and is_type_recipe(item):
-                    return item
-    return None
+            nodes = o
+        else:
+            continue
+        for n in nodes:
+            if isinstance(n, dict) and isinstance(n.get("@id"), str):
+                prev = ids.get(n["@id"])
+                if prev is None or len(n) > len(prev):
+                    ids[n["@id"]] = n
+    return ids
+
+def _needs_refs(recipe: dict) -> bool:
+    if _ref_id(recipe) is not None:
+        return True
+    for v in recipe.values():
+        if _ref_id(v) is not None or (isinstance(v, list) and any(_ref_id(x) is not None for x in v)):
+            return True
+    return False
+
+def resolve_refs(recipe: dict, ids: Dict[str, dict]) -> dict:
+    rid = _ref_id(recipe)
+    if rid is not None and rid in ids:
+        recipe = {**ids[rid], **recipe}
+    out = {}
+    for k, v in recipe.items():
+        if k == "@id":
+            out[k] = v
+        elif isinstance(v, list):
+            out[k] = [ids.get(_ref_id(x), x) if _ref_id(x) is not None else x for x in v]
+        else:
+            ref = _ref_id(v)
+            out[k] = ids.get(ref, v) if ref is not None else v
+    return out
+
+def recipe_completeness(recipe: dict) -> int:
+    return sum(1 for f in _RECIPE_FIELDS if recipe.get(f))
+
+def is_complete_recipe(recipe: dict) -> bool:
+    return all(recipe.get(f) for f in _RECIPE_FIELDS[:_REQUIRED_FIELDS])
+
+@timed_stage("find_first_recipe")
+def find_first_recipe(objs: Iterable[Any]) -> Optional[dict]:
+    objs = objs if isinstance(objs, list) else list(objs)
+    ids: Optional[Dict[str, dict]] = None
+    best, best_score = None, -1
+    for recipe in iter_recipes(objs):
+        if _needs_refs(recipe):
+            if ids is None:
+                ids = _graph_ids(objs)
+            recipe = resolve_refs(recipe, ids)
+        # Första kompletta receptet vinner direkt; annars det mest kompletta
+        if is_complete_recipe(recipe):
+            return recipe
+        score = recipe_completeness(recipe)
+        if score > best_score:
+            best, best_score = recipe, score
+    return best
 
 def as_list(x: Any) -> List[Any]: 
     if x is None: 
@@ -119,18 +313,19 @@ def extract_title(recipe: dict) -> str:
         return name.strip()
     return "Untitled Recipe"
 
+@timed_stage("extract_ingredients")
 def extract_ingredients(recipe: dict, lang: str) -> List[Ingredient]:
     raw_list = as_list(recipe.get("recipeIngredient"))
-    out: List[Ingredient] = []
+    lines: List[str] = []
     for raw in raw_list:
         if isinstance(raw, str):
-            out.append(parse_ingredient_line(raw, lang=lang))
+            lines.append(raw)
         elif isinstance(raw, dict):
             nm = raw.get("name") or raw.get("text") or ""
-            out.append(parse_ingredient_line(str(nm), lang=lang))
+            lines.append(str(nm))
         else:
-            out.append(parse_ingredient_line(str(raw), lang=lang))
-    return out
+            lines.append(str(raw))
+    return parse_ingredient_lines(lines, lang=lang)
 
 def _flatten_instructions(instr: Any) -> List[str]: 
     steps: List[str] = []
@@ -240,8 +435,13 @@ def extract_total_time(recipe: dict) -> Optional[str]:
 
 def extract_recipe_from_jsonld(url: str) -> Optional[RecipeBase]:
     html = fetch_html(url)
-    lang = detect_lang(html, url)
-    blocks = find_jsonld_blocks(html)
+    return extract_recipe_from_document(html, url)
+
+def extract_recipe_from_document(html: str, url: str, soup: Optional[BeautifulSoup] = None) -> Optional[RecipeBase]:
+    if soup is None:
+        soup = parse_html(html)
+    lang = detect_lang(html, url, soup=soup)
+    blocks = find_jsonld_blocks(html, soup=soup)
 
     candidates: List[Any] = []
     for block in blocks:
@@ -250,7 +450,13 @@ def extract_recipe_from_jsonld(url: str) -> Optional[RecipeBase]:
     recipe_obj = find_first_recipe(candidates)
     if not recipe_obj:
         return None
+    return build_recipe(recipe_obj, url, lang, canonical=find_canonical_link(soup))
 
+def find_canonical_link(soup: BeautifulSoup) -> Optional[str]:
+    link = soup.find("link", rel="canonical", href=True)
+    return link["href"] if link else None
+
+def build_recipe(recipe_obj: dict, url: str, lang: str, canonical: Optional[str] = None) -> RecipeBase:
     title = extract_title(recipe_obj)
     ingredients = extract_ingredients(recipe_obj, lang=lang)
     steps = extract_steps(recipe_obj)
@@ -264,7 +470,7 @@ def extract_recipe_from_jsonld(url: str) -> Optional[RecipeBase]:
         steps=steps,
         servings=servings,
         total_time=total_time,
-        source_url=url,
+        source_url=canonical_source(url, canonical, recipe_obj.get("url") or recipe_obj.get("mainEntityOfPage")),
         images=[],
+        language=lang,
     )
-
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import json
+import math
+import operator
+import re
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from Apps.Api.core.search import LANGS, analyze
+from Apps.Api.schemas.models import Ingredient
+from Apps.Api.services.ingredient_utils import fraction_to_float, load_unit_aliases, replace_fraction_chars
+
+_CONVERSIONS_PATH = Path(__file__).resolve().parents[1] / "data" / "unit_conversions.json"
+
+_RANGE_SPLIT_RE = re.compile(r"[-–]")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+# Dimension för rader utan enhet ("3 ägg"); räknas ihop med st/pc
+COUNT = "count"
+NAN = float("nan")
+
+@lru_cache(maxsize=1)
+def load_unit_conversions() -> Dict[str, Tuple[str, float]]:
+    # Kanonisk enhet -> (dimension, faktor till dimensionens basenhet: g, ml, st)
+    raw = json.loads(_CONVERSIONS_PATH.read_text(encoding="utf-8"))
+    out: Dict[str, Tuple[str, float]] = {}
+    for dim, units in raw.items():
+        for unit, factor in units.items():
+            if not isinstance(factor, (int, float)) or factor <= 0:
+                raise ValueError(f"Bad conversion factor for {unit!r} in {_CONVERSIONS_PATH.name}")
+            out[unit] = (dim, float(factor))
+    return out
+
+def unit_dimension(unit: Optional[str], lang: str) -> Tuple[str, float, Optional[str]]:
+    # (dimension, faktor, kanonisk enhet). Okända enheter (burk, klyfta ...) blir
+    # en egen dimension och summeras bara med sig själva.
+    if not unit:
+        return COUNT, 1.0, None
+    u = unit.strip().lower().rstrip(".")
+    canon = load_unit_aliases(lang).get(u, u)
+    dim = load_unit_conversions().get(canon)
+    if dim is None:
+        return f"unit:{canon}", 1.0, canon
+    return dim[0], dim[1], canon
+
+def quantity_range(quantity: Optional[str]) -> Optional[Tuple[float, float]]:
+    # Ingredient.quantity som parse_quantity lämnar den: "2", "1.5", "1-2" eller råtext
+    if not quantity:
+        return None
+    vals = []
+    for part in _RANGE_SPLIT_RE.split(replace_fraction_chars(quantity)):
+        if part.strip():
+            v = fraction_to_float(part)
+            if v is None or not math.isfinite(v):
+                return None
+            vals.append(v)
+    if not vals:
+        return None
+    return min(vals), max(vals)
+
+def servings_count(servings: Optional[str]) -> Optional[float]:
+    m = _NUMBER_RE.search(servings or "")
+    if m is None:
+        return None
+    n = float(m.group(0).replace(",", "."))
+    return n if n > 0 else None
+
+@lru_cache(maxsize=8192)
+def ingredient_key(name: str, lang: str) -> str:
+    # Samma stamning som sökindexet, så att "tomat" och "tomater" hamnar på samma rad
+    terms = analyze(name, lang if lang in LANGS else "sv")
+    return " ".join(terms) if terms else " ".join(name.lower().split())
+
+class IngredientColumns:
+    # En hel batch ingredienser i kolumnform: en rad per ingrediens, mängder i
+    # basenheter i array('d'), och gruppindex (namn + dimension) per rad
+    __slots__ = ("group", "recipe", "lo", "hi", "group_names", "group_dims", "group_units")
+
+    def __init__(self):
+        self.group = array("l")
+        self.recipe = array("l")
+        self.lo = array("d")
+        self.hi = array("d")
+        self.group_names: List[str] = []
+        self.group_dims: List[Optional[str]] = []
+        # Enheterna som faktiskt användes per grupp, kanonisk enhet -> faktor
+        self.group_units: List[Dict[Optional[str], float]] = []
+
+    @classmethod
+    def build(cls, recipes: Iterable[Tuple[Sequence[Ingredient], str]]) -> "IngredientColumns":
+        cols = cls()
+        index: Dict[Tuple[str, Optional[str]], int] = {}
+        for ri, (ingredients, lang) in enumerate(recipes):
+            for ing in ingredients:
+                qty = quantity_range(ing.quantity)
+                if qty is None:
+                    # Utan mängd ("salt") går det inte att räkna; raden slås ihop per namn
+                    dim, factor, canon = None, 1.0, None
+                    lo = hi = NAN
+                else:
+                    dim, factor, canon = unit_dimension(ing.unit, lang)
+                    lo, hi = qty[0] * factor, qty[1] * factor
+                key = (ingredient_key(ing.name, lang), dim)
+                g = index.get(key)
+                if g is None:
+                    g = index[key] = len(cols.group_names)
+                    cols.group_names.append(ing.name)
+                    cols.group_dims.append(dim)
+                    cols.group_units.append({})
+                if dim is not None:
+                    cols.group_units[g][canon] = factor
+                cols.group.append(g)
+                cols.recipe.append(ri)
+                cols.lo.append(lo)
+                cols.hi.append(hi)
+        return cols
+
+    def __len__(self) -> int:
+        return len(self.group)
+
+    def scaled(self, factors: Sequence[float]) -> Tuple[array, array]:
+        # Faktor per recept utspridd på raderna; multiplikationen sker i C via map
+        per_row = list(map(factors.__getitem__, self.recipe))
+        return (
+            array("d", map(operator.mul, self.lo, per_row)),
+            array("d", map(operator.mul, self.hi, per_row)),
+        )
+
+    def totals(self, factors: Sequence[float]) -> Tuple[array, array]:
+        lo, hi = self.scaled(factors)
+        n = len(self.group_names)
+        sum_lo = array("d", bytes(8 * n))
+        sum_hi = array("d", bytes(8 * n))
+        for g, a, b in zip(self.group, lo, hi):
+            sum_lo[g] += a
+            sum_hi[g] += b
+        return sum_lo, sum_hi
+
+def display_unit(base_amount: float, units: Dict[Optional[str], float]) -> Tuple[Optional[str], float]:
+    # Största enheten som receptet självt använde där mängden blir minst 1,
+    # annars den minsta: 2 dl + 3 msk blir 2.45 dl, 1 tsk + 1 krm blir 1.2 tsk
+    ranked = sorted(units.items(), key=lambda kv: (kv[1], kv[0] is not None), reverse=True)
+    for unit, factor in ranked:
+        if base_amount / factor >= 1:
+            return unit, factor
+    return ranked[-1]
@@ -0,0 +1,45 @@
+from __future__ import annotations
+import math
+from typing import List, Optional, Set
+
+from Apps.Api.core.store import Store
+from Apps.Api.schemas.models import Recipe, ShoppingList, ShoppingListEntry, ShoppingListItem, ShoppingListRequest
+from Apps.Api.services.quantities import IngredientColumns, display_unit, servings_count
+
+def scale_factor(item: ShoppingListItem, recipe: Recipe, servings: Optional[float] = None) -> float:
+    # Uttrycklig skala vinner; annars önskat antal portioner genom receptets egna
+    if item.scale is not None:
+        return item.scale
+    want = item.servings or servings
+    have = servings_count(recipe.servings)
+    if want is None or have is None:
+        return 1.0
+    return want / have
+
+def build_shopping_list(store: Store, req: ShoppingListRequest) -> ShoppingList:
+    ids = list(dict.fromkeys(item.recipe_id for item in req.items))
+    found = {r.id: r for r in store.get_recipes(ids)}
+    for rid in ids:
+        if rid not in found:
+            raise ValueError(f"Recipe not found: {rid}")
+    # Samma recept två gånger i planen räknas två gånger
+    recipes = [found[item.recipe_id] for item in req.items]
+    factors = [scale_factor(item, r, req.servings) for item, r in zip(req.items, recipes)]
+
+    cols = IngredientColumns.build((r.ingredients, r.language or "sv") for r in recipes)
+    lo, hi = cols.totals(factors)
+    used_by: List[Set[int]] = [set() for _ in cols.group_names]
+    for g, ri in zip(cols.group, cols.recipe):
+        used_by[g].add(ri)
+
+    items: List[ShoppingListEntry] = []
+    for g, name in enumerate(cols.group_names):
+        entry = ShoppingListEntry(name=name, recipe_ids=list(dict.fromkeys(recipes[ri].id for ri in sorted(used_by[g]))))
+        if cols.group_dims[g] is not None and not math.isnan(lo[g]):
+            unit, factor = display_unit(lo[g], cols.group_units[g])
+            entry.unit = unit
+            entry.quantity = round(lo[g] / factor, 2)
+            if hi[g] > lo[g]:
+                entry.quantity_max = round(hi[g] / factor, 2)
+        items.append(entry)
+    return ShoppingList(items=items)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import asyncio
+import os
+import zlib
+from typing import AsyncIterator, Iterator, List, Tuple
+
+from pydantic import ValidationError
+
+from Apps.Api.core.metrics import REGISTRY
+from Apps.Api.core.serialization import model_json
+from Apps.Api.core.store import Store
+from Apps.Api.schemas.models import CookbookImportLineError, CookbookImportResult, RecipeBase
+
+EXPORT_CHUNK = int(os.getenv("RECIPEER_EXPORT_CHUNK", "500"))
+IMPORT_CHUNK = int(os.getenv("RECIPEER_IMPORT_CHUNK", "500"))
+# En rad längre än så avbryter importen i stället för att buffras utan gräns
+IMPORT_MAX_LINE = int(os.getenv("RECIPEER_IMPORT_MAX_LINE", str(4 * 1024 * 1024)))
+IMPORT_MAX_ERRORS = 20
+
+EXPORTED = REGISTRY.counter("recipeer_export_recipes_total", "Recipes written by cookbook exports")
+IMPORTED = REGISTRY.counter("recipeer_ndjson_imported_total", "Recipes created by NDJSON cookbook imports")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_READ_SIZE = 64 * 1024
+
+class LineTooLong(ValueError):
+    pass
+
+class BadGzip(ValueError):
+    pass
+
+def iter_export(store: Store, cookbook_id: str, compress: bool = False) -> Iterator[bytes]:
+    # Synkron generator: StreamingResponse itererar den i trådpoolen, så lagrets
+    # anrop blockerar inte event-loopen. Ett block per sida recept.
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf: List[bytes] = []
+    for recipe in store.iter_recipes(cookbook_id, chunk=EXPORT_CHUNK):
+        buf.append(model_json(recipe))
+        buf.append(b"\n")
+        if len(buf) >= 2 * EXPORT_CHUNK:
+            EXPORTED.inc(len(buf) // 2)
+            block = b"".join(buf)
+            buf.clear()
+            yield gz.compress(block) if gz else block
+    EXPORTED.inc(len(buf) // 2)
+    block = b"".join(buf)
+    if gz:
+        block = gz.compress(block) + gz.flush()
+    if block:
+        yield block
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line: int = IMPORT_MAX_LINE) -> AsyncIterator[bytes]:
+    # Delar upp en byteström i rader; gzip känns igen på de två första byten.
+    # Dekomprimeringen sker i bitar om högst _READ_SIZE, så en gzip-bomb växer inte i minnet.
+    gz = None
+    first = True
+    pending = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if first:
+            first = False
+            if chunk[:2] == _GZIP_MAGIC:
+                gz = zlib.decompressobj(31)
+        data = chunk
+        while data:
+            if gz is not None:
+                # Flera gzip-medlemmar efter varandra är en giltig ström (t.ex. hopslagna
+                # exporter): när en tar slut fortsätter nästa på resten av indatan
+                if gz.eof:
+                    gz = zlib.decompressobj(31)
+                try:
+                    piece = gz.decompress(data, _READ_SIZE)
+                except zlib.error as e:
+                    raise BadGzip(f"Invalid gzip body: {e}") from e
+                data = gz.unused_data if gz.eof else gz.unconsumed_tail
+            else:
+                piece, data = data, b""
+            pending += piece
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line
+            if len(pending) > max_line:
+                raise LineTooLong(f"Line longer than {max_line} bytes")
+    if gz is not None:
+        pending += gz.flush()
+        if not gz.eof:
+            raise BadGzip("Truncated gzip body")
+    if pending:
+        yield pending
+
+def _parse_chunk(lines: List[Tuple[int, bytes]]) -> Tuple[List[RecipeBase], List[CookbookImportLineError]]:
+    items: List[RecipeBase] = []
+    errors: List[CookbookImportLineError] = []
+    for no, line in lines:
+        try:
+            # Exporterade rader har id, kokbok och versioner; de ignoreras och receptet får nya
+            items.append(RecipeBase.model_validate_json(line))
+        except ValidationError as e:
+            errors.append(CookbookImportLineError(line=no, detail=_first_error(e)))
+    return items, errors
+
+def _first_error(e: ValidationError) -> str:
+    err = e.errors(include_url=False)[0]
+    loc = ".".join(str(p) for p in err.get("loc", ()))
+    return f"{loc}: {err['msg']}" if loc else err["msg"]
+
+def _insert_chunk(store: Store, cookbook_id: str, lines: List[Tuple[int, bytes]]) -> Tuple[int, List[CookbookImportLineError]]:
+    items, errors = _parse_chunk(lines)
+    if items:
+        store.add_recipes(cookbook_id, items)
+        IMPORTED.inc(len(items))
+    return len(items), errors
+
+async def import_ndjson(store: Store, cookbook_id: str, chunks: AsyncIterator[bytes], chunk: int = IMPORT_CHUNK) -> CookbookImportResult:
+    if store.get_cookbook(cookbook_id) is None:
+        raise ValueError("Cookbook not found")
+    imported = failed = 0
+    errors: List[CookbookImportLineError] = []
+    batch: List[Tuple[int, bytes]] = []
+
+    async def flush() -> None:
+        nonlocal imported, failed
+        # Validering och skrivning i en tråd; en sida i taget håller minnet platt
+        n, errs = await asyncio.to_thread(_insert_chunk, store, cookbook_id, batch[:])
+        batch.clear()
+        imported += n
+        failed += len(errs)
+        errors.extend(errs[: IMPORT_MAX_ERRORS - len(errors)])
+
+    no = 0
+    async for line in iter_lines(chunks):
+        no += 1
+        if line.strip():
+            batch.append((no, line))
+            if len(batch) >= chunk:
+                await flush()
+    if batch:
+        await flush()
+    return CookbookImportResult(imported=imported, failed=failed, errors=errors)
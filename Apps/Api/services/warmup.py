@@ -0,0 +1,41 @@
+from __future__ import annotations
+import importlib
+import os
+import time
+from typing import Iterable, Optional
+
+from Apps.Api.core.metrics import REGISTRY
+from Apps.Api.core.search import LANGS
+from Apps.Api.services.ingredient_utils import warm_rules
+from Apps.Api.services.quantities import load_unit_conversions
+
+# 1 = parserstacken (requests, bs4, lxml) importeras vid start; annars vid första URL-importen.
+# Värt det för processer som nästan bara importerar, annars förlängs bara kallstarten.
+PRELOAD_PARSERS = os.getenv("RECIPEER_PRELOAD_PARSERS", "0") == "1"
+
+PARSER_MODULES = ("Apps.Api.services.parsers",)
+
+STARTUP_SECONDS = REGISTRY.gauge("recipeer_startup_seconds", "Seconds from importing the API module until it accepted requests")
+WARMUP_SECONDS = REGISTRY.gauge("recipeer_warmup_seconds", "Seconds spent loading rule data and preloading modules at startup")
+
+def preload_parsers() -> None:
+    for name in PARSER_MODULES:
+        importlib.import_module(name)
+
+def warm(langs: Iterable[str] = LANGS, parsers: Optional[bool] = None) -> float:
+    # Allt som annars laddas vid första anropet: regelfiler (validerade och
+    # kompilerade) och omräkningstabellen
+    t0 = time.perf_counter()
+    langs = tuple(langs)
+    warm_rules(langs)
+    load_unit_conversions()
+    if PRELOAD_PARSERS if parsers is None else parsers:
+        preload_parsers()
+    elapsed = time.perf_counter() - t0
+    WARMUP_SECONDS.set(elapsed)
+    return elapsed
+
+def started(since: float) -> float:
+    elapsed = time.perf_counter() - since
+    STARTUP_SECONDS.set(elapsed)
+    return elapsed
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from Apps.Api.core.storage import InMemoryStorage, SqliteStorage
+from Apps.Api.core.store import ConflictError, Store
+from Apps.Api.schemas.models import (
+    CookbookCreate, Ingredient, InstructionStep, RecipeBase, RequestChange, RequestCreate,
+)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    backend = InMemoryStorage() if request.param == "memory" else SqliteStorage(str(tmp_path / "t.sqlite"))
+    yield Store(backend)
+    backend.close()
+
+def _recipe(store):
+    cb = store.create_cookbook(CookbookCreate(name="Test")).id
+    [r] = store.add_recipes(cb, [RecipeBase(
+        title="Pannkakor",
+        ingredients=[Ingredient(name="mjölk")],
+        steps=[InstructionStep(order=1, text="Vispa.")],
+    )])
+    return r
+
+def _open(store, recipe_id, title):
+    return store.open_request(recipe_id, RequestCreate(message="m", changes=RequestChange(title=title)))
+
+def _race(*calls):
+    # Alla anrop släpps samtidigt; returnerar resultat eller undantag per anrop
+    barrier = threading.Barrier(len(calls))
+    out = [None] * len(calls)
+
+    def run(i, fn):
+        barrier.wait()
+        try:
+            out[i] = fn()
+        except Exception as e:
+            out[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, fn)) for i, fn in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return out
+
+def test_accept_twice_with_explicit_version_applies_once(store):
+    r = _recipe(store)
+    req = _open(store, r.id, "Plättar")
+    store.accept_request(req.id)
+    with pytest.raises(ConflictError):
+        store.accept_request(req.id, expected_version=2)
+    assert store.get_recipe(r.id).version == 2
+
+def test_reject_after_accept_is_a_conflict(store):
+    r = _recipe(store)
+    req = _open(store, r.id, "Plättar")
+    store.accept_request(req.id)
+    with pytest.raises(ConflictError):
+        store.reject_request(req.id)
+    assert store.get_request(req.id).status == "accepted"
+
+@pytest.mark.parametrize("round_", range(20))
+def test_concurrent_accept_and_reject_agree(store, round_):
+    r = _recipe(store)
+    req = _open(store, r.id, "Plättar")
+    accepted, rejected = _race(lambda: store.accept_request(req.id), lambda: store.reject_request(req.id))
+    wins = [res for res in (accepted, rejected) if not isinstance(res, Exception)]
+    assert len(wins) == 1
+    assert all(isinstance(res, ConflictError) for res in (accepted, rejected) if res not in wins)
+    status = store.get_request(req.id).status
+    recipe = store.get_recipe(r.id)
+    if status == "accepted":
+        assert (recipe.title, recipe.version) == ("Plättar", 2)
+    else:
+        assert (status, recipe.title, recipe.version) == ("rejected", "Pannkakor", 1)
+
+@pytest.mark.parametrize("round_", range(10))
+def test_concurrent_accepts_with_explicit_version_apply_once(store, round_):
+    r = _recipe(store)
+    req = _open(store, r.id, "Plättar")
+    results = _race(*[lambda: store.accept_request(req.id, expected_version=1)] * 4)
+    assert sum(not isinstance(res, Exception) for res in results) == 1
+    assert store.get_recipe(r.id).version == 2
+    assert len(store.backend.list_revisions(r.id, 1, 10)) == 1
@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from Apps.Api.core.storage import InMemoryStorage
+from Apps.Api.core.store import Store
+from Apps.Api.main import app, get_store
+from Apps.Api.schemas.models import Ingredient, InstructionStep, RecipeBase
+from Apps.Api.services import importer
+from Apps.Api.services.importer import InvalidUrlError, import_error_status, normalize_import_url
+
+@pytest.mark.parametrize("url, want", [
+    ("https://www.ICA.se", "https://www.ica.se/"),
+    ("  https://example.se/recept?id=1 ", "https://example.se/recept?id=1"),
+    ("http://localhost:8000/a", "http://localhost:8000/a"),
+])
+def test_normalize_import_url(url, want):
+    assert normalize_import_url(url) == want
+
+@pytest.mark.parametrize("url", ["not a url", "", "example.se/recept", "ftp://example.se/recept", "https://"])
+def test_invalid_url_is_a_client_error(url):
+    with pytest.raises(InvalidUrlError) as exc:
+        normalize_import_url(url)
+    assert import_error_status(exc.value)[0] == 422
+
+@pytest.fixture
+def client(monkeypatch):
+    fetched = []
+
+    async def fake_extract(url, slot=None):
+        fetched.append(url)
+        return RecipeBase(title=url, ingredients=[Ingredient(name="salt")], steps=[InstructionStep(order=1, text="x")])
+
+    monkeypatch.setattr(importer, "extract_recipe", fake_extract)
+    store = Store(InMemoryStorage())
+    app.dependency_overrides[get_store] = lambda: store
+    try:
+        yield TestClient(app), fetched
+    finally:
+        app.dependency_overrides.clear()
+
+def test_batch_reports_invalid_urls_per_item_without_fetching(client):
+    c, fetched = client
+    cb = c.post("/cookbooks", json={"name": "Test"}).json()["id"]
+    res = c.post(f"/cookbooks/{cb}/recipes:batch", json={"urls": ["not a url", " https://example.se/a ", "ftp://example.se/b"]}).json()
+    assert (res["created"], res["failed"]) == (1, 2)
+    bad, ok, ftp = res["results"]
+    assert bad["error"]["status_code"] == ftp["error"]["status_code"] == 422
+    assert ok["recipe"] is not None and ok["url"] == " https://example.se/a "
+    assert fetched == ["https://example.se/a"]
+
+def test_single_import_rejects_invalid_url(client):
+    c, fetched = client
+    cb = c.post("/cookbooks", json={"name": "Test"}).json()["id"]
+    for run_async in ("false", "true"):
+        r = c.post(f"/cookbooks/{cb}/recipes:url", params={"async": run_async}, json={"url": "not a url"})
+        assert r.status_code == 422
+    assert fetched == []
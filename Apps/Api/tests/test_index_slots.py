@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from Apps.Api.core.ingredient_index import IngredientIndex
+from Apps.Api.core.search import InvertedIndex
+
+WORDS = ["tomat", "lök", "vitlök", "pasta", "grädde", "ost", "basilika", "salt", "peppar", "citron"]
+
+def _fields(rng):
+    return {
+        "title": rng.sample(WORDS, 2),
+        "ingredients": rng.sample(WORDS, 4),
+        "steps": [rng.choice(WORDS) for _ in range(6)],
+    }
+
+def test_reindexing_reuses_slots():
+    rng = random.Random(7)
+    index = InvertedIndex()
+    for i in range(50):
+        index.add(f"r{i}", "cb", _fields(rng))
+    # Varje godkänt ändringsförslag indexerar om receptet
+    for _ in range(2000):
+        index.add(f"r{rng.randrange(50)}", "cb", _fields(rng))
+    assert len(index.doc_ids) == len(index.doc_len) == len(index.doc_group) == 50
+    assert index.n_docs == 50
+
+def test_removed_slots_are_reused():
+    rng = random.Random(3)
+    index = InvertedIndex()
+    for i in range(20):
+        index.add(f"r{i}", "cb", _fields(rng))
+    for i in range(10):
+        index.remove(f"r{i}")
+    for i in range(20, 30):
+        index.add(f"r{i}", "cb", _fields(rng))
+    assert len(index.doc_ids) == 20
+    assert sorted(d for d in index.doc_ids if d) == sorted(f"r{i}" for i in range(10, 30))
+
+@pytest.mark.parametrize("terms", [["tomat"], ["pasta", "ost"], ["citron", "peppar", "salt"]])
+def test_search_after_reuse_matches_full_rebuild(terms):
+    rng = random.Random(11)
+    index = InvertedIndex()
+    docs = {}
+    for i in range(300):
+        docs[f"r{i}"] = _fields(rng)
+        index.add(f"r{i}", "cb", docs[f"r{i}"])
+    index.search(terms, limit=5)  # bygger impact-listorna som sedan hålls uppdaterade
+    for _ in range(500):
+        doc_id = f"r{rng.randrange(300)}"
+        docs[doc_id] = _fields(rng)
+        index.add(doc_id, "cb", docs[doc_id])
+    fresh = InvertedIndex()
+    for doc_id, fields in docs.items():
+        fresh.add(doc_id, "cb", fields)
+    got = index.search(terms, limit=10)
+    want = fresh.search(terms, limit=10)
+    assert [round(sc, 9) for _, sc in got] == [round(sc, 9) for _, sc in want]
+
+def test_ingredient_index_reuses_slots():
+    index = IngredientIndex()
+    for i in range(10):
+        index.add(f"r{i}", "cb", [(0, ["tomat"]), (1, ["lök"])])
+    for _ in range(100):
+        index.add("r3", "cb", [(0, ["tomat"]), (1, ["ost"]), (2, ["salt"])])
+    assert len(index.doc_ids) == len(index.doc_total) == len(index.doc_group) == 10
+    [(doc_id, n, total, idx)] = index.cover([[{"ost"}], [{"salt"}]])
+    assert (doc_id, n, total, idx) == ("r3", 2, 3, [1, 2])
@@ -0,0 +1,93 @@
+import json
+import time
+
+import pytest
+
+from Apps.Api.services.parsers_jsonld import recover_json_values, try_load_json_candidates
+
+RECIPE = {
+    "@context": "https://schema.org",
+    "@type": "Recipe",
+    "name": "Pasta med tomatsås",
+    "recipeIngredient": ["400 g pasta", "1 burk krossade tomater", "1 gul lök", "salt"],
+    "recipeInstructions": [{"@type": "HowToStep", "text": "Koka pastan."}, {"@type": "HowToStep", "text": "Blanda."}],
+}
+
+def _recipes(values):
+    return [v for v in values if isinstance(v, dict) and v.get("@type") == "Recipe"]
+
+def test_trailing_commas():
+    text = json.dumps(RECIPE).replace("]", ",]").replace("}", ",}")
+    assert _recipes(try_load_json_candidates(text)) == [RECIPE]
+
+def test_trailing_comma_inside_string_is_kept():
+    recipe = {**RECIPE, "name": "Soppa, ,} med ,]"}
+    text = json.dumps(recipe).replace("]}", "],}")
+    assert _recipes(try_load_json_candidates(text)) == [recipe]
+
+def test_html_entities():
+    text = json.dumps(RECIPE, ensure_ascii=False).replace('"', "&quot;")
+    assert _recipes(try_load_json_candidates(text)) == [RECIPE]
+
+def test_control_characters():
+    text = json.dumps(RECIPE, ensure_ascii=False).replace("Koka", "Ko\x02ka\x0b")
+    [found] = _recipes(try_load_json_candidates(text))
+    assert found["recipeInstructions"][0]["text"] == "Koka pastan."
+
+def test_raw_newline_in_string():
+    text = json.dumps(RECIPE, ensure_ascii=False).replace("Koka pastan.", "Koka\npastan.")
+    [found] = _recipes(try_load_json_candidates(text))
+    assert found["recipeInstructions"][0]["text"] == "Koka\npastan."
+
+def test_truncated_block_keeps_complete_children():
+    text = '{"@graph": [' + json.dumps(RECIPE) + ', {"@type": "BreadcrumbList", "itemListElement": ['
+    assert _recipes(try_load_json_candidates(text)) == [RECIPE]
+
+def test_truncated_recipe_is_not_invented():
+    text = json.dumps(RECIPE)[:-20]
+    assert _recipes(try_load_json_candidates(text)) == []
+
+def test_several_top_level_values():
+    text = json.dumps({"@type": "WebSite"}) + "\n" + json.dumps(RECIPE) + json.dumps([1, 2])
+    values = try_load_json_candidates(text)
+    assert values == [{"@type": "WebSite"}, RECIPE, [1, 2]]
+
+def test_comment_wrapped_block():
+    text = "<!--\n" + json.dumps(RECIPE) + "\n-->"
+    assert _recipes(try_load_json_candidates(text)) == [RECIPE]
+
+@pytest.mark.parametrize("text", [
+    '{"a":' * 10000,
+    "[" * 5000 + "]" * 5000 + ",",
+    "[" * 5000 + "]" * 5000,
+    '{"a": ' + "[" * 5000 + "]" * 5000 + "}",
+])
+def test_deep_nesting_is_skipped(text):
+    assert try_load_json_candidates(text) == []
+
+def test_deep_nesting_does_not_hide_other_values():
+    text = "[" * 5000 + "]" * 5000 + json.dumps(RECIPE)
+    assert _recipes(try_load_json_candidates(text)) == [RECIPE]
+
+def _best_of(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+@pytest.mark.parametrize("make", [
+    lambda n: "{" * n,
+    lambda n: '["x", ' * (n // 6),
+    lambda n: '{"a": 1}' * (n // 8),
+    lambda n: "[" + ",".join([json.dumps(RECIPE).replace("}", ",}")] * (n // 300)) + "]",
+    lambda n: "[" * (n // 2) + "]" * (n // 2) + ",",
+], ids=["open_braces", "open_brackets_with_strings", "many_small_objects", "trailing_commas", "deep_nesting"])
+def test_adversarial_input_is_linear(make):
+    # Fyra gånger så mycket indata får inte ta mer än ungefär fyra gånger så lång tid;
+    # en kvadratisk väg skulle ge ~16x. Marginal för brus i delade CI-maskiner.
+    small, large = make(64 * 1024), make(256 * 1024)
+    t_small = _best_of(lambda: recover_json_values(small))
+    t_large = _best_of(lambda: recover_json_values(large))
+    assert t_large < max(t_small, 1e-3) * 8
@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+from Apps.Api.core.storage import InMemoryStorage
+from Apps.Api.core.store import Store
+from Apps.Api.main import app, get_store
+
+def test_missing_counts_the_same_ingredients_as_total():
+    store = Store(InMemoryStorage())
+    app.dependency_overrides[get_store] = lambda: store
+    try:
+        c = TestClient(app)
+        cb = c.post("/cookbooks", json={"name": "Test"}).json()["id"]
+        c.post(f"/cookbooks/{cb}/recipes", json={
+            "title": "Sallad",
+            # "1/2" har inga sökbara termer och räknas varken i total eller missing
+            "ingredients": [{"name": "gurka"}, {"name": "1/2"}, {"name": "äpple"}, {"name": "salt"}],
+            "steps": [{"order": 1, "text": "Blanda."}],
+        })
+        [hit] = c.get("/search/by-ingredients", params={"have": ["gurka"], "cookbook_id": cb}).json()["items"]
+    finally:
+        app.dependency_overrides.clear()
+    assert (hit["matched"], hit["total"], hit["missing"]) == (1, 3, ["äpple", "salt"])
+    assert hit["coverage"] == 1 / 3
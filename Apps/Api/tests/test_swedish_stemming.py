@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from Apps.Api.core.search import stem
+from Apps.Api.core.storage import InMemoryStorage, SqliteStorage
+from Apps.Api.core.store import Store
+from Apps.Api.schemas.models import (
+    CookbookCreate, Ingredient, InstructionStep, RecipeBase, ShoppingListItem, ShoppingListRequest,
+)
+from Apps.Api.services.quantities import ingredient_key
+from Apps.Api.services.shopping import build_shopping_list
+
+# Singular och plural (obestämd och bestämd form) ska ge samma stam
+FORMS = [
+    ("pannkaka", "pannkakor", "pannkakorna"),
+    ("gurka", "gurkor", "gurkorna"),
+    ("äpple", "äpplen", "äpplet"),
+    ("tomat", "tomater", "tomaterna"),
+    ("lök", "lökar", "lökarna"),
+]
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    backend = InMemoryStorage() if request.param == "memory" else SqliteStorage(str(tmp_path / "t.sqlite"))
+    yield Store(backend)
+    backend.close()
+
+def _recipe(title, ingredients, lang="sv"):
+    return RecipeBase(
+        title=title,
+        language=lang,
+        ingredients=[Ingredient(name=n, quantity=q, unit=u) for n, q, u in ingredients],
+        steps=[InstructionStep(order=1, text="Blanda.")],
+    )
+
+def _add(store, *recipes):
+    cb = store.create_cookbook(CookbookCreate(name="Test")).id
+    return cb, store.add_recipes(cb, list(recipes))
+
+@pytest.mark.parametrize("forms", FORMS, ids=[f[0] for f in FORMS])
+def test_singular_and_plural_share_stem(forms):
+    assert len({stem(w, "sv") for w in forms}) == 1
+
+@pytest.mark.parametrize("query", ["pannkaka", "pannkakor", "Pannkakorna"])
+def test_title_search_matches_singular_and_plural(store, query):
+    cb, [r] = _add(store, _recipe("Pannkakor", [("mjölk", "6", "dl")]))
+    assert [hit.id for hit, _ in store.search_recipes(query, cookbook_id=cb, lang="sv")] == [r.id]
+
+@pytest.mark.parametrize("have", [["gurka", "äpple"], ["gurkor", "äpplen"]])
+def test_recipes_by_ingredients_matches_singular_and_plural(store, have):
+    cb, [r] = _add(store, _recipe("Sallad", [("gurkor", "2", None), ("äpplen", "3", None), ("salt", None, None)]))
+    [(hit, matched, total, idx)] = store.recipes_by_ingredients(have, cookbook_id=cb, lang="sv")
+    assert (hit.id, matched, total, idx) == (r.id, 2, 3, [0, 1])
+
+def test_ingredient_key_groups_singular_and_plural():
+    assert ingredient_key("1 gurka", "sv") == ingredient_key("gurkor", "sv")
+    assert ingredient_key("äpple", "sv") == ingredient_key("äpplen", "sv")
+
+def test_shopping_list_groups_singular_and_plural(store):
+    _, (a, b) = _add(
+        store,
+        _recipe("Tzatziki", [("gurka", "1", "st")]),
+        _recipe("Sallad", [("gurkor", "2", "st")]),
+    )
+    res = build_shopping_list(store, ShoppingListRequest(items=[ShoppingListItem(recipe_id=a.id), ShoppingListItem(recipe_id=b.id)]))
+    [item] = res.items
+    assert (item.quantity, item.recipe_ids) == (3, [a.id, b.id])
+
+def test_sqlite_terms_are_rebuilt_after_analyzer_change(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    backend = SqliteStorage(path)
+    cb, [r] = _add(Store(backend), _recipe("Pannkakor", [("mjölk", "6", "dl")]))
+    backend.close()
+    # Som en databas byggd med den gamla stamningen
+    db = sqlite3.connect(path)
+    db.execute("UPDATE recipe_fts SET title = 'pannkakor'")
+    db.execute("PRAGMA user_version = 1")
+    db.commit()
+    db.close()
+
+    backend = SqliteStorage(path)
+    try:
+        assert [hit.id for hit, _ in Store(backend).search_recipes("pannkaka", cookbook_id=cb, lang="sv")] == [r.id]
+    finally:
+        backend.close()
@@ -0,0 +1 @@
+# Tom med flit: pytest lägger då repo-roten på sys.path, så att "Apps.Api" går att importera